@@ -0,0 +1,388 @@
+"""
+Offline benchmark suite for the laptop pipeline and the Pi protocol.
+
+Uses a tiny randomly initialized CLIP model and synthetic frames, so it
+needs no camera, network or model download. Results can be saved as a JSON
+baseline and compared against a previous one:
+
+    python benchmark.py --save baselines/cpu.json
+    python benchmark.py --compare baselines/cpu.json --tolerance 0.15
+
+--check instead verifies that the table-driven decision engine decides
+exactly like the original if/elif rules, on random and boundary scores:
+
+    python benchmark.py --check
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+FRAME_SHAPE = (480, 640, 3)
+JPEG_QUALITIES = [50, 80, 95]
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 3, items: int = 1) -> Dict[str, float]:
+    """
+    Time repeated calls of fn
+    Args:
+        fn: Callable to benchmark
+        iterations: Number of timed calls
+        warmup: Number of untimed calls first
+        items: Work items processed per call, for throughput
+    Returns:
+        Dictionary with mean/p50/p95 latency in ms and items per second
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+    mean = statistics.fmean(samples)
+    return {
+        "mean_ms": mean,
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "throughput": items * 1000.0 / mean if mean else 0.0,
+    }
+
+
+def make_tiny_clip(directory: str) -> str:
+    """
+    Write a tiny randomly initialized CLIP model and processor to a directory
+    Returns:
+        Path usable as VisionControlSystem(model_name=...)
+    """
+    from transformers import CLIPConfig, CLIPModel, CLIPProcessor, CLIPTokenizer, CLIPImageProcessor
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    # Byte-level vocabulary with no merges: every character is its own token
+    characters = list(bytes_to_unicode().values())
+    vocab = {token: i for i, token in enumerate(characters + [c + "</w>" for c in characters])}
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+    vocab_file = os.path.join(directory, "vocab.json")
+    merges_file = os.path.join(directory, "merges.txt")
+    with open(vocab_file, "w") as f:
+        json.dump(vocab, f)
+    with open(merges_file, "w") as f:
+        f.write("#version: 0.2\n")
+
+    config = CLIPConfig(
+        text_config=dict(vocab_size=len(vocab), hidden_size=64, intermediate_size=128,
+                         num_hidden_layers=2, num_attention_heads=2, max_position_embeddings=77),
+        vision_config=dict(image_size=64, patch_size=16, hidden_size=64, intermediate_size=128,
+                           num_hidden_layers=2, num_attention_heads=2),
+        projection_dim=32,
+    )
+    CLIPModel(config).save_pretrained(directory)
+    CLIPProcessor(
+        image_processor=CLIPImageProcessor(size={"shortest_edge": 64}, crop_size={"height": 64, "width": 64}),
+        tokenizer=CLIPTokenizer(vocab_file, merges_file),
+    ).save_pretrained(directory)
+    return directory
+
+
+def synthetic_frames(count: int, seed: int = 0) -> List[np.ndarray]:
+    """Random frames with some low-frequency structure so JPEG sizes are realistic"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        small = rng.integers(0, 256, size=(FRAME_SHAPE[0] // 16, FRAME_SHAPE[1] // 16, 3), dtype=np.uint8)
+        frame = cv2.resize(small, (FRAME_SHAPE[1], FRAME_SHAPE[0]), interpolation=cv2.INTER_LINEAR)
+        noise = rng.integers(0, 16, size=FRAME_SHAPE, dtype=np.uint8)
+        frames.append(cv2.add(frame, noise))
+    return frames
+
+
+def bench_analyze(model_name: str, backends: List[str], batch_sizes: List[int], iterations: int) -> Dict[str, dict]:
+    """analyze_scenes latency/throughput per backend and batch size"""
+    from vision_control_system import VisionControlSystem
+
+    results = {}
+    frames = synthetic_frames(max(batch_sizes))
+    for backend in backends:
+        system = VisionControlSystem(model_name=model_name, device=backend)
+        for batch_size in batch_sizes:
+            batch = frames[:batch_size]
+            results[f"analyze/{backend}/batch{batch_size}"] = measure(
+                lambda: system.analyze_scenes(batch), iterations, items=batch_size)
+    return results
+
+
+def bench_score(batch_sizes: List[int], iterations: int, prompts: int = 12, regions: int = 1,
+                dim: int = 512) -> Dict[str, dict]:
+    """PromptScorer grouped-softmax scoring cost, without the image encoder"""
+    import torch
+    from prompt_set import DEFAULT_SCENE_ELEMENTS
+    from scoring import PromptScorer
+
+    names = (DEFAULT_SCENE_ELEMENTS * (prompts // len(DEFAULT_SCENE_ELEMENTS) + 1))[:prompts]
+    snapshot = (names, torch.randn(prompts, dim), torch.ones(prompts))
+    scorer = PromptScorer()
+    results = {}
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            image_features = torch.randn(batch_size, regions, dim)
+            results[f"score/batch{batch_size}x{regions}"] = measure(
+                lambda: scorer.score(image_features, snapshot).cpu(), iterations, items=batch_size * regions)
+    return results
+
+
+def bench_decide(iterations: int) -> Dict[str, dict]:
+    """determine_command + generate_motor_commands per-call cost"""
+    from scene_scores import SceneSchema
+    from vision_control_system import VisionControlSystem
+
+    # The decision methods don't touch the model, so skip loading one
+    system = VisionControlSystem.__new__(VisionControlSystem)
+    rng = np.random.default_rng(0)
+    schema = SceneSchema(VisionControlSystem.SCENE_ELEMENTS, VisionControlSystem.REQUIRED_SCENE_ELEMENTS)
+    analyses = schema.batch(rng.random((256, len(schema))))
+    calls = 1000
+
+    def run():
+        for i in range(calls):
+            system.generate_motor_commands(system.determine_command(analyses[i & 255]))
+
+    return {"decide/determine+generate": measure(run, iterations, items=calls)}
+
+
+def reference_command(scene_analysis) -> str:
+    """The original hand-written decision rules, kept as the reference DEFAULT_RULES must match"""
+    if scene_analysis["pedestrian"] > 0.3 or scene_analysis["car"] > 0.3 or scene_analysis["obstacle"] > 0.3:
+        return "stop"
+    if scene_analysis["traffic light"] > 0.5:
+        return "stop"
+    if scene_analysis["stop sign"] > 0.5:
+        return "stop"
+    if scene_analysis["narrow space"] > 0.5:
+        return "slow_down"
+    elif scene_analysis["clear path"] > 0.7:
+        if scene_analysis["left turn"] > 0.6:
+            return "turn_left"
+        elif scene_analysis["right turn"] > 0.6:
+            return "turn_right"
+        else:
+            return "move_forward"
+    return "maintain_current"
+
+
+def check_decisions(samples: int = 20000, seed: int = 0) -> List[str]:
+    """
+    Compare the vectorized engine (batched and per frame) with reference_command
+    Args:
+        samples: Score vectors per kind (uniform random, and drawn from values at the thresholds)
+    Returns:
+        Descriptions of the mismatching frames (empty when the engine matches)
+    """
+    from decision_engine import DEFAULT_RULES
+    from scene_scores import SceneSchema
+    from vision_control_system import VisionControlSystem
+
+    system = VisionControlSystem.__new__(VisionControlSystem)
+    schema = SceneSchema(VisionControlSystem.SCENE_ELEMENTS, VisionControlSystem.REQUIRED_SCENE_ELEMENTS)
+    rng = np.random.default_rng(seed)
+
+    # Each threshold as float32 plus its float32 neighbours, and the extremes
+    thresholds = np.asarray(sorted({threshold for rule in DEFAULT_RULES for _, threshold in rule.conditions}),
+                            dtype=np.float32)
+    edges = np.concatenate([thresholds, np.nextafter(thresholds, np.float32(0)),
+                            np.nextafter(thresholds, np.float32(1)), np.float32([0.0, 1.0])])
+    scores = np.concatenate([rng.random((samples, len(schema)), dtype=np.float32),
+                             rng.choice(edges, size=(samples, len(schema)))])
+
+    analyses = schema.batch(scores)
+    batched, _ = system.determine_commands(analyses)
+    mismatches = []
+    for i, analysis in enumerate(analyses):
+        expected = reference_command(analysis)
+        single = system.determine_command(analysis)
+        if batched[i] != expected or single != expected:
+            mismatches.append(f"{analysis.to_dict()}: expected {expected}, batched {batched[i]}, single {single}")
+    return mismatches
+
+
+def bench_jpeg(iterations: int) -> Dict[str, dict]:
+    """JPEG encode/decode cost at several qualities"""
+    frame = synthetic_frames(1)[0]
+    results = {}
+    for quality in JPEG_QUALITIES:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        encoded = cv2.imencode(".jpg", frame, params)[1]
+        encode = measure(lambda: cv2.imencode(".jpg", frame, params), iterations)
+        encode["bytes"] = int(encoded.size)
+        results[f"jpeg/encode/q{quality}"] = encode
+        results[f"jpeg/decode/q{quality}"] = measure(lambda: cv2.imdecode(encoded, cv2.IMREAD_COLOR), iterations)
+    return results
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("socket closed")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def bench_socket(iterations: int) -> Dict[str, dict]:
+    """
+    Loopback round trip of the Pi protocol: the car sends a length-prefixed
+    JPEG frame, the laptop answers with a JSON command
+    """
+    frame = cv2.imencode(".jpg", synthetic_frames(1)[0], [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+    command = json.dumps({"speed": 0.5, "steering": 0.0, "brake": 0.0}).encode()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def laptop():
+        conn, _ = server.accept()
+        with conn:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                while True:
+                    (size,) = struct.unpack("!I", _recv_exact(conn, 4))
+                    _recv_exact(conn, size)
+                    conn.sendall(command)
+            except ConnectionError:
+                pass
+
+    thread = threading.Thread(target=laptop, daemon=True)
+    thread.start()
+    car = socket.create_connection(server.getsockname())
+    car.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    header = len(frame).to_bytes(4, "big")
+
+    def round_trip():
+        car.sendall(header)
+        car.sendall(frame)
+        car.recv(1024)
+
+    try:
+        result = measure(round_trip, iterations, warmup=10)
+        result["bytes"] = len(frame)
+        return {"socket/frame+command_rtt": result}
+    finally:
+        car.close()
+        thread.join(timeout=1.0)
+        server.close()
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Compare mean latencies against a baseline
+    Returns:
+        List of regression descriptions (empty if none)
+    """
+    regressions = []
+    for name, result in sorted(current.items()):
+        if name not in baseline:
+            print(f"  {name:40s} {result['mean_ms']:10.3f} ms  (new)")
+            continue
+        before = baseline[name]["mean_ms"]
+        change = (result["mean_ms"] - before) / before if before else 0.0
+        marker = ""
+        if change > tolerance:
+            marker = "  REGRESSION"
+            regressions.append(f"{name}: {before:.3f} -> {result['mean_ms']:.3f} ms ({change:+.1%})")
+        print(f"  {name:40s} {result['mean_ms']:10.3f} ms  {change:+7.1%}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the VLM car pipeline offline")
+    parser.add_argument("--suite", nargs="+", default=["analyze", "score", "decide", "jpeg", "socket"],
+                        choices=["analyze", "score", "decide", "jpeg", "socket"], help="Benchmarks to run")
+    parser.add_argument("--model", default=None, help="CLIP model name or path (default: tiny random model)")
+    parser.add_argument("--backends", nargs="+", default=None, help="Torch devices (default: cpu and cuda if available)")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 16], help="analyze_scenes batch sizes")
+    parser.add_argument("--iterations", type=int, default=50, help="Timed iterations per benchmark")
+    parser.add_argument("--save", help="Write results to this JSON baseline file")
+    parser.add_argument("--compare", help="Compare against this JSON baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown before flagging")
+    parser.add_argument("--check", action="store_true",
+                        help="Only check the decision engine against the original rules (exit code 1 on mismatch)")
+    args = parser.parse_args()
+
+    if args.check:
+        mismatches = check_decisions()
+        for mismatch in mismatches[:20]:
+            print(f"  {mismatch}")
+        if mismatches:
+            print(f"Decision check failed: {len(mismatches)} frames differ from the original rules")
+            sys.exit(1)
+        print("Decision check passed: the rule table matches the original rules")
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if "analyze" in args.suite:
+            import torch
+
+            backends = args.backends or (["cpu", "cuda"] if torch.cuda.is_available() else ["cpu"])
+            model_name = args.model or make_tiny_clip(tmp)
+            results.update(bench_analyze(model_name, backends, args.batch_sizes, args.iterations))
+        if "score" in args.suite:
+            results.update(bench_score(args.batch_sizes, args.iterations))
+        if "decide" in args.suite:
+            results.update(bench_decide(args.iterations))
+        if "jpeg" in args.suite:
+            results.update(bench_jpeg(args.iterations))
+        if "socket" in args.suite:
+            results.update(bench_socket(args.iterations * 4))
+
+    print("\nResults:")
+    for name, result in sorted(results.items()):
+        print(f"  {name:40s} mean {result['mean_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms  "
+              f"{result['throughput']:10.1f}/s")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparison with {args.compare}:")
+        regressions = compare(results, baseline["results"], args.tolerance)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "meta": {
+                    "timestamp": time.time(),
+                    "platform": platform.platform(),
+                    "python": platform.python_version(),
+                    "cpu_count": os.cpu_count(),
+                    "model": args.model or "tiny-random-clip",
+                    "iterations": args.iterations,
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
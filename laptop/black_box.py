@@ -0,0 +1,321 @@
+"""
+Always-on black-box frame recorder.
+
+Keeps the last N frames as JPEG plus per-frame metadata in a preallocated,
+memory-mapped ring file. Recording writes into fixed-size slots in place,
+so nothing grows and the file on disk always holds the most recent window,
+even after a crash. Raw frames are only copied into one of two preallocated
+staging buffers on the control thread; a background thread JPEG-encodes
+them into the ring (cv2.imencode allocates its output there, not in the
+loop). If encoding falls behind, the older staged frame is dropped. A trigger (emergency stop, loop exception, operator
+signal) writes the window as a standalone clip in the background: a .mjpeg
+stream (playable with ffplay/VLC) and a .json index.
+
+    python black_box.py blackbox.ring --output crash.mjpeg    # dump a ring file after the fact
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from decision_engine import COMMANDS
+
+MAGIC = b"VLMBBOX1"
+# magic, slot count, slot size
+FILE_HEADER = struct.Struct("<8sII")
+FILE_HEADER_SIZE = 64
+# seq, timestamp, frame ID, JPEG length, command, flags, speed, steering
+SLOT_HEADER = struct.Struct("<QdqIhhff")
+
+
+class BlackBoxRecorder:
+    """Ring of the most recent JPEG frames in a memory-mapped file"""
+
+    def __init__(self, path: str, slots: int = 300, slot_size: int = 128 * 1024, jpeg_quality: int = 70,
+                 output_dir: str = "blackbox", cooldown: float = 10.0):
+        """
+        Args:
+            path: Ring file, created (or reused if the geometry matches)
+            slots: Number of frames kept (seconds x frame rate)
+            slot_size: Bytes per slot including its header; larger frames are re-encoded smaller
+            jpeg_quality: JPEG quality for raw frames
+            output_dir: Directory snapshots are written to
+            cooldown: Minimum seconds between snapshots with the same reason
+        """
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.jpeg_quality = jpeg_quality
+        self.output_dir = output_dir
+        self.cooldown = cooldown
+        self._encode_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self._fallback_params = [cv2.IMWRITE_JPEG_QUALITY, max(10, jpeg_quality // 2)]
+
+        self.frames = 0
+        self.oversized = 0
+        self.snapshots = 0
+        self._last_trigger: Dict[str, float] = {}
+        self.dropped = 0
+        self._requested: Optional[str] = None
+        self._writers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        # Signalled when a frame reaches the ring; snapshots wait for frames still being encoded
+        self._written = threading.Condition(self._lock)
+
+        # Staging buffers (allocated on the first frame of a resolution), the staged
+        # frame waiting for the encoder and the buffer the encoder is reading
+        self._stage = threading.Condition()
+        self._staging: List[Optional[np.ndarray]] = [None, None]
+        self._pending = None
+        self._encoding: Optional[int] = None
+        self._closed = False
+
+        size = FILE_HEADER_SIZE + slots * slot_size
+        reuse = os.path.exists(path) and os.path.getsize(path) == size
+        self._file = open(path, "r+b" if reuse else "w+b")
+        if not reuse:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        FILE_HEADER.pack_into(self._map, 0, MAGIC, slots, slot_size)
+        # Continue the sequence after whatever the file already holds
+        self._seq = max((header[0] for header in self._headers()), default=0)
+        self._written_seq = self._seq
+        self._encoder = threading.Thread(target=self._encode_loop, name="BlackBoxEncoder", daemon=True)
+        self._encoder.start()
+
+    def _headers(self):
+        for slot in range(self.slots):
+            yield SLOT_HEADER.unpack_from(self._map, FILE_HEADER_SIZE + slot * self.slot_size)
+
+    def record(self, frame, frame_id: int, command: str = "", motor: Optional[Dict[str, float]] = None):
+        """
+        Store a frame in the next slot: JPEG bytes are written directly, raw
+        frames are staged for the encoder thread
+        Args:
+            frame: BGR image array, or JPEG bytes
+            frame_id: Frame ID
+            command: Command decided for this frame
+            motor: Motor commands (speed/steering)
+        """
+        meta = (time.time(), frame_id, COMMANDS.index(command) if command in COMMANDS else -1,
+                motor["speed"] if motor else 0.0, motor["steering"] if motor else 0.0)
+        if isinstance(frame, np.ndarray):
+            with self._stage:
+                # The encoder only reads the buffer it took; the other one is free to overwrite
+                index = 1 if self._encoding == 0 else 0
+                buffer = self._staging[index]
+                if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+                    buffer = self._staging[index] = np.empty_like(frame)
+                np.copyto(buffer, frame)
+                if self._pending is not None:
+                    self.dropped += 1
+                with self._lock:
+                    self._seq += 1
+                    seq = self._seq
+                self._pending = (index, seq, meta)
+                self._stage.notify()
+        else:
+            with self._lock:
+                self._seq += 1
+                seq = self._seq
+            data = memoryview(frame)
+            if data.nbytes > self.slot_size - SLOT_HEADER.size:
+                self.oversized += 1
+                data = None
+            self._write_slot(seq, meta, data)
+        if self._requested is not None:
+            reason, self._requested = self._requested, None
+            self.trigger(reason)
+
+    def _write_slot(self, seq: int, meta: tuple, data: Optional[memoryview]):
+        """Write one frame's slot; data None only marks seq as done (encode failed or oversized)"""
+        with self._written:
+            if data is not None:
+                length = data.nbytes
+                offset = FILE_HEADER_SIZE + (seq % self.slots) * self.slot_size
+                # Invalidate the slot first so a crash mid-write never pairs a header with partial data
+                SLOT_HEADER.pack_into(self._map, offset, 0, 0.0, 0, 0, 0, 0, 0.0, 0.0)
+                start = offset + SLOT_HEADER.size
+                self._map[start:start + length] = data
+                timestamp, frame_id, command, speed, steering = meta
+                SLOT_HEADER.pack_into(self._map, offset, seq, timestamp, frame_id, length, command, 0,
+                                      speed, steering)
+                self.frames += 1
+            self._written_seq = max(self._written_seq, seq)
+            self._written.notify_all()
+
+    def _encode_loop(self):
+        """Encode staged frames into the ring until close()"""
+        while True:
+            with self._stage:
+                self._stage.wait_for(lambda: self._pending is not None or self._closed)
+                if self._pending is None:
+                    return
+                (index, seq, meta), self._pending = self._pending, None
+                self._encoding = index
+            data = None
+            try:
+                frame = self._staging[index]
+                ok, jpeg = cv2.imencode(".jpg", frame, self._encode_params)
+                if ok and jpeg.size > self.slot_size - SLOT_HEADER.size:
+                    ok, jpeg = cv2.imencode(".jpg", frame, self._fallback_params)
+                if ok and jpeg.size > self.slot_size - SLOT_HEADER.size:
+                    self.oversized += 1
+                elif ok:
+                    data = jpeg.data
+            except Exception as e:
+                print(f"Error encoding black box frame: {str(e)}")
+            finally:
+                with self._stage:
+                    self._encoding = None
+                self._write_slot(seq, meta, data)
+
+    def request(self, reason: str):
+        """
+        Ask for a snapshot after the next recorded frame. Safe to call from a
+        signal handler, which may interrupt record() while it holds the lock
+        """
+        self._requested = reason
+
+    def trigger(self, reason: str) -> Optional[threading.Thread]:
+        """
+        Snapshot the current window to a clip, unless the same reason fired within the cooldown
+        Returns:
+            The thread writing the clip, or None if suppressed
+        """
+        now = time.monotonic()
+        if now - self._last_trigger.get(reason, -self.cooldown) < self.cooldown:
+            return None
+        self._last_trigger[reason] = now
+
+        # Only the newest sequence number is taken here; the snapshot thread
+        # copies the slots up to it while recording carries on
+        with self._lock:
+            last_seq = self._seq
+        base = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{reason}")
+        thread = threading.Thread(target=self._write_snapshot, args=(last_seq, base, reason),
+                                  name="BlackBoxSnapshot", daemon=True)
+        self._writers = [writer for writer in self._writers if writer.is_alive()] + [thread]
+        thread.start()
+        return thread
+
+    def _collect(self, last_seq: int) -> List[dict]:
+        """
+        Copy the frames recorded up to last_seq out of the live ring, oldest first.
+        Frames still being encoded are waited for. A slot whose header changes
+        while its JPEG is copied was overwritten in the meantime and is dropped
+        """
+        with self._written:
+            self._written.wait_for(lambda: self._written_seq >= last_seq, timeout=1.0)
+        records = []
+        for slot in range(self.slots):
+            offset = FILE_HEADER_SIZE + slot * self.slot_size
+            header = SLOT_HEADER.unpack_from(self._map, offset)
+            if header[0] == 0 or header[0] > last_seq:
+                continue
+            start = offset + SLOT_HEADER.size
+            jpeg = self._map[start:start + header[3]]
+            if SLOT_HEADER.unpack_from(self._map, offset) != header:
+                continue
+            records.append(_slot_record(header, jpeg))
+        records.sort(key=lambda record: record["seq"])
+        return records
+
+    def _write_snapshot(self, last_seq: int, base: str, reason: str):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            count = write_clip(self._collect(last_seq), base + ".mjpeg", reason)
+            self.snapshots += 1
+            print(f"Black box: wrote {count} frames to {base}.mjpeg ({reason})")
+        except Exception as e:
+            print(f"Error writing black box snapshot: {str(e)}")
+
+    def close(self):
+        # The encoder drains the staged frame; snapshots still being written read from the map
+        with self._stage:
+            self._closed = True
+            self._stage.notify()
+        self._encoder.join(timeout=5.0)
+        for writer in self._writers:
+            writer.join(timeout=5.0)
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+def read_ring(buffer) -> List[dict]:
+    """
+    Decode the slots of a ring file image
+    Args:
+        buffer: Ring file contents (bytes, mmap or memoryview)
+    Returns:
+        Frame records ordered oldest first, each with the JPEG bytes under "jpeg"
+    """
+    magic, slots, slot_size = FILE_HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("not a black box ring file")
+    records = []
+    for slot in range(slots):
+        offset = FILE_HEADER_SIZE + slot * slot_size
+        header = SLOT_HEADER.unpack_from(buffer, offset)
+        if header[0] == 0:
+            continue
+        start = offset + SLOT_HEADER.size
+        records.append(_slot_record(header, buffer[start:start + header[3]]))
+    records.sort(key=lambda record: record["seq"])
+    return records
+
+
+def _slot_record(header: tuple, jpeg) -> dict:
+    seq, timestamp, frame_id, _, command, _, speed, steering = header
+    return {
+        "seq": seq,
+        "timestamp": timestamp,
+        "frame": frame_id,
+        "command": COMMANDS[command] if 0 <= command < len(COMMANDS) else None,
+        "speed": speed,
+        "steering": steering,
+        "jpeg": bytes(jpeg),
+    }
+
+
+def write_clip(records: List[dict], path: str, reason: str = "") -> int:
+    """
+    Write frame records as an MJPEG stream plus a .json index next to it
+    Returns:
+        Number of frames written
+    """
+    index = []
+    with open(path, "wb") as f:
+        for record in records:
+            index.append({key: value for key, value in record.items() if key != "jpeg"})
+            index[-1]["offset"] = f.tell()
+            index[-1]["length"] = len(record["jpeg"])
+            f.write(record["jpeg"])
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump({"reason": reason, "frames": index}, f, indent=1)
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dump the frames held in a black box ring file")
+    parser.add_argument("ring", help="Ring file written by BlackBoxRecorder")
+    parser.add_argument("--output", default="blackbox.mjpeg", help="Clip path (.mjpeg, with a .json index)")
+    args = parser.parse_args()
+
+    with open(args.ring, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as ring:
+            records = read_ring(ring)
+    count = write_clip(records, args.output, "manual")
+    print(f"Wrote {count} frames to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Decision threshold calibration over logged scene scores.
+
+Loads per-frame scores with ground-truth command labels, evaluates many
+candidate threshold vectors through the vectorized decision engine and
+reports accuracy, per-command precision/recall and the safety-critical miss
+rate (frames labelled "stop" that were not decided as "stop").
+
+Inputs are replay.py results with a "label" field added (.jsonl or .csv),
+or an .npz with "scores" (N, K), "names" (K,) and "labels" (N,):
+
+    python calibrate.py labelled.jsonl --samples 20000 --workers 8 --output thresholds.json
+    python main.py --thresholds thresholds.json
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from decision_engine import COMMANDS, DEFAULT_RULES, CompiledRules, DecisionEngine
+from scene_scores import SceneSchema
+
+SAFETY_COMMAND = "stop"
+# Upper bound on the (candidates, frames, conditions) working set per evaluation step
+MEMORY_BUDGET = 64 * 2**20
+
+# Per-process data, set by the pool initializer
+_data = None
+
+
+def load_scores(path: str, label_key: str = "label") -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Load labelled scene scores
+    Args:
+        path: .jsonl / .csv replay results with a label column, or an .npz
+        label_key: Name of the label field
+    Returns:
+        Tuple of (score names, float32 scores (N, K), label indices into COMMANDS (N,));
+        frames without a known command label are dropped
+    """
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            names = [str(name) for name in data["names"]]
+            scores = data["scores"].astype(np.float32)
+            labels = [str(label) for label in data["labels"]]
+    else:
+        with open(path, newline="") as f:
+            if path.endswith(".csv"):
+                rows = list(csv.DictReader(f))
+                names = [key[len("score:"):] for key in rows[0] if key.startswith("score:")] if rows else []
+                scores = np.asarray([[float(row[f"score:{name}"]) for name in names] for row in rows],
+                                    dtype=np.float32)
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+                names = list(rows[0]["scores"]) if rows else []
+                scores = np.asarray([[row["scores"][name] for name in names] for row in rows], dtype=np.float32)
+        labels = [row.get(label_key) for row in rows]
+
+    keep = np.asarray([label in COMMANDS for label in labels], dtype=bool)
+    label_ids = np.asarray([COMMANDS.index(label) for label in labels if label in COMMANDS], dtype=np.intp)
+    return names, scores.reshape(len(labels), len(names))[keep], label_ids
+
+
+def confusion_matrices(compiled: CompiledRules, scores: np.ndarray, labels: np.ndarray,
+                       thresholds: np.ndarray) -> np.ndarray:
+    """
+    Confusion matrices for a batch of condition threshold vectors
+    Args:
+        compiled: Rules bound to the scores' schema
+        scores: Scores (N, K)
+        labels: Label indices (N,)
+        thresholds: Condition thresholds (candidates, conditions)
+    Returns:
+        Integer array (candidates, commands, commands) indexed [candidate, label, prediction]
+    """
+    count = len(COMMANDS)
+    step = max(1, MEMORY_BUDGET // max(1, 4 * scores.shape[0] * len(compiled.thresholds)))
+    matrices = np.empty((len(thresholds), count, count), dtype=np.int64)
+    for start in range(0, len(thresholds), step):
+        chunk = thresholds[start:start + step]
+        predictions, _ = compiled.evaluate(scores, chunk)
+        cells = (np.arange(len(chunk))[:, None] * count + labels[None, :]) * count + predictions
+        matrices[start:start + len(chunk)] = np.bincount(
+            cells.ravel(), minlength=len(chunk) * count * count).reshape(len(chunk), count, count)
+    return matrices
+
+
+def summarize(matrices: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Metrics from confusion matrices (candidates, label, prediction)
+    Returns:
+        Dictionary of per-candidate arrays: accuracy, macro_f1, safety_miss, false_stop,
+        and (candidates, commands) precision / recall
+    """
+    true_positive = np.diagonal(matrices, axis1=1, axis2=2).astype(np.float64)
+    predicted = matrices.sum(axis=1)
+    actual = matrices.sum(axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, true_positive / predicted, np.nan)
+        recall = np.where(actual > 0, true_positive / actual, np.nan)
+        f1 = 2 * precision * recall / (precision + recall)
+    present = actual[0] > 0
+    stop = COMMANDS.index(SAFETY_COMMAND)
+    stops = max(1, actual[0, stop])
+    others = max(1, matrices[0].sum() - actual[0, stop])
+    return {
+        "accuracy": true_positive.sum(axis=1) / max(1, matrices[0].sum()),
+        "macro_f1": np.nan_to_num(f1[:, present]).mean(axis=1),
+        "safety_miss": (actual[:, stop] - true_positive[:, stop]) / stops,
+        "false_stop": (predicted[:, stop] - true_positive[:, stop]) / others,
+        "precision": precision,
+        "recall": recall,
+    }
+
+
+def candidate_thresholds(count: int, elements: int, low: float, high: float, grid_steps: int = 0,
+                         seed: int = 0) -> np.ndarray:
+    """
+    Candidate per-element threshold vectors
+    Args:
+        count: Number of random candidates (ignored for a grid)
+        elements: Number of tuned elements
+        low, high: Search range
+        grid_steps: Values per element for a full grid search (0 for random search)
+        seed: Random seed
+    Returns:
+        Float32 array (candidates, elements)
+    """
+    if grid_steps:
+        values = np.linspace(low, high, grid_steps, dtype=np.float32)
+        if grid_steps ** elements > 10_000_000:
+            raise ValueError(f"Grid of {grid_steps}^{elements} candidates is too large; "
+                             "use random search or tune fewer elements")
+        return np.asarray(list(itertools.product(values, repeat=elements)), dtype=np.float32)
+    return np.random.default_rng(seed).uniform(low, high, size=(count, elements)).astype(np.float32)
+
+
+def _init_worker(names, scores, labels, rules):
+    global _data
+    schema = SceneSchema(names)
+    _data = (DecisionEngine(rules).compile(schema), scores, labels)
+
+
+def _evaluate_chunk(thresholds: np.ndarray) -> np.ndarray:
+    compiled, scores, labels = _data
+    return confusion_matrices(compiled, scores, labels, thresholds[:, compiled.condition_elements])
+
+
+def calibrate(names: List[str], scores: np.ndarray, labels: np.ndarray, candidates: np.ndarray,
+              tuned: List[str], engine: DecisionEngine, workers: int = 1, chunk_size: int = 256):
+    """
+    Evaluate candidate thresholds for the tuned elements, keeping the others fixed
+    Returns:
+        Tuple of (full per-element threshold matrix (candidates, elements), element names,
+        confusion matrices (candidates, commands, commands))
+    """
+    compiled = engine.compile(SceneSchema(names, engine.elements))
+    current = engine.thresholds()
+    full = np.tile(np.asarray([current[element] for element in compiled.elements], dtype=np.float32),
+                   (len(candidates), 1))
+    full[:, [compiled.elements.index(element) for element in tuned]] = candidates
+
+    chunks = [full[start:start + chunk_size] for start in range(0, len(full), chunk_size)]
+    initargs = (names, scores, labels, engine.rules)
+    if workers <= 1:
+        _init_worker(*initargs)
+        matrices = [_evaluate_chunk(chunk) for chunk in chunks]
+    else:
+        with mp.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+            matrices = pool.map(_evaluate_chunk, chunks)
+    return full, compiled.elements, np.concatenate(matrices)
+
+
+def rank(metrics: Dict[str, np.ndarray], max_miss: float) -> np.ndarray:
+    """
+    Candidate order: those within the safety miss budget by macro F1, then the rest by miss rate
+    """
+    within = metrics["safety_miss"] <= max_miss
+    return np.lexsort((-metrics["macro_f1"], metrics["safety_miss"] * ~within, ~within))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate decision thresholds on labelled scene scores")
+    parser.add_argument("inputs", nargs="+", help="Labelled replay results (.jsonl/.csv) or .npz score files")
+    parser.add_argument("--label-key", default="label", help="Label field in .jsonl/.csv inputs")
+    parser.add_argument("--elements", nargs="+", help="Scene elements to tune (default: all rule elements)")
+    parser.add_argument("--samples", type=int, default=10000, help="Random search candidates")
+    parser.add_argument("--grid-steps", type=int, default=0, help="Full grid search with this many values per element")
+    parser.add_argument("--range", nargs=2, type=float, default=[0.05, 0.95], metavar=("LOW", "HIGH"),
+                        help="Threshold search range")
+    parser.add_argument("--max-miss", type=float, default=0.01, help="Allowed safety-critical (stop) miss rate")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--top", type=int, default=5, help="Candidates to report")
+    parser.add_argument("--seed", type=int, default=0, help="Random search seed")
+    parser.add_argument("--output", help="Write the best thresholds and their metrics to this JSON file")
+    args = parser.parse_args()
+
+    names, scores, labels = None, [], []
+    for path in args.inputs:
+        file_names, file_scores, file_labels = load_scores(path, args.label_key)
+        if names is not None and file_names != names:
+            raise SystemExit(f"{path} has different score columns than {args.inputs[0]}")
+        names = file_names
+        scores.append(file_scores)
+        labels.append(file_labels)
+    scores, labels = np.concatenate(scores), np.concatenate(labels)
+    if not len(labels):
+        raise SystemExit("No labelled frames found")
+
+    engine = DecisionEngine(DEFAULT_RULES)
+    tuned = args.elements or engine.elements
+    unknown = [element for element in tuned if element not in engine.elements]
+    if unknown:
+        raise SystemExit(f"Not used by any rule: {', '.join(unknown)}")
+
+    candidates = candidate_thresholds(args.samples, len(tuned), *args.range, args.grid_steps, args.seed)
+    # Row 0 is the current configuration, for reference
+    current = engine.thresholds()
+    candidates = np.vstack([[current[element] for element in tuned], candidates]).astype(np.float32)
+    print(f"Evaluating {len(candidates)} threshold candidates over {len(labels)} frames "
+          f"with {args.workers} worker(s)")
+
+    start = time.perf_counter()
+    thresholds, elements, matrices = calibrate(names, scores, labels, candidates, tuned, engine, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Done in {elapsed:.1f}s ({len(candidates) * len(labels) / elapsed / 1e6:.1f}M frame-candidates/s)")
+
+    metrics = summarize(matrices)
+    order = rank(metrics, args.max_miss)
+
+    def describe(label, index):
+        print(f"\n{label}: accuracy {metrics['accuracy'][index]:.3f}  macro F1 {metrics['macro_f1'][index]:.3f}  "
+              f"stop miss {metrics['safety_miss'][index]:.3%}  false stop {metrics['false_stop'][index]:.3%}")
+        print("  " + "  ".join(f"{element}={value:.2f}" for element, value in zip(elements, thresholds[index])))
+
+    describe("Current thresholds", 0)
+    for position, index in enumerate(order[:args.top]):
+        describe(f"#{position + 1}", index)
+
+    best = order[0]
+    print("\nPer-command metrics for #1:")
+    for command_id, command in enumerate(COMMANDS):
+        print(f"  {command:18s} precision {metrics['precision'][best, command_id]:6.3f}  "
+              f"recall {metrics['recall'][best, command_id]:6.3f}  "
+              f"frames {int(matrices[best, command_id].sum())}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "thresholds": {element: round(float(value), 4) for element, value in zip(elements, thresholds[best])},
+                "metrics": {key: float(metrics[key][best])
+                            for key in ("accuracy", "macro_f1", "safety_miss", "false_stop")},
+                "frames": int(len(labels)),
+            }, f, indent=2)
+        print(f"\nWrote best thresholds to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Cheap classical-CV stage ahead of CLIP.
+
+Each frame is reduced to a few features on a small downscaled copy: edge
+density, free floor found by back-projecting a learned floor colour
+histogram, the share of saturated red (stop signs, lights), and the largest
+non-floor blob in the near field. Frames that are clearly open floor exit
+with "move_forward", and frames with a large blob right in front exit with
+"stop". Everything else goes to CLIP.
+
+The floor histogram is learned from frames CLIP's decision sends straight
+ahead, so the cascade stays out of the way until it has seen the floor. It
+also never skips CLIP for more than a few frames in a row; those forced
+frames audit the cascade's verdict against CLIP's decision. An audit that
+disagrees suspends exits: every frame the cascade would decide goes through
+CLIP until several audits in a row agree again.
+"""
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Rule names reported for cascade exits (telemetry, replay, logs)
+CASCADE_RULES = {"move_forward": "cascade_clear", "stop": "cascade_blocked"}
+
+
+class Cascade:
+    """Classical-CV pre-filter deciding trivial frames without CLIP"""
+
+    def __init__(self, width: int = 96, height: int = 72, warmup: int = 10, max_consecutive: int = 5,
+                 recover: int = 3, clear_edges: float = 0.05, clear_free: float = 0.95, blocked_blob: float = 0.25,
+                 red_max: float = 0.002, floor_probability: int = 32, learning_rate: float = 0.05):
+        """
+        Args:
+            width, height: Size frames are reduced to
+            warmup: Frames decided "move_forward" by CLIP needed before the cascade makes decisions
+            max_consecutive: Cascade exits in a row before a frame is forced through CLIP
+            recover: Agreeing audits in a row needed to resume exits after a disagreement
+            clear_edges: Maximum edge density of the lower half for a clear exit
+            clear_free: Minimum free floor share of the lower half for a clear exit
+            blocked_blob: Near-field blob share of the lower half that exits with a stop
+            red_max: Maximum share of saturated red pixels for any exit
+            floor_probability: Back-projection value (0-255) above which a pixel counts as floor
+            learning_rate: Weight of each confirmed clear frame in the floor histogram
+        """
+        self.size = (width, height)
+        self.warmup = warmup
+        self.max_consecutive = max_consecutive
+        self.recover = recover
+        self.clear_edges = clear_edges
+        self.clear_free = clear_free
+        self.blocked_blob = blocked_blob
+        self.red_max = red_max
+        self.floor_probability = floor_probability
+        self.learning_rate = learning_rate
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+        self.floor_hist = None
+        self.confirmed = 0
+        self._consecutive = 0
+        # Agreeing audits still needed before exits resume; nonzero while suspended
+        self._suspended = 0
+        self._pending = None
+        self.last_features = None
+
+        self.frames = 0
+        self.exits = Counter()
+        self.forwarded = Counter()
+        self.audits = 0
+        self.audit_agreed = 0
+        self.suspensions = 0
+        self.time_s = 0.0
+
+    def features(self, frame: np.ndarray) -> Dict[str, float]:
+        """
+        Compute the cascade features of a BGR frame
+        Returns:
+            Dictionary of edges, free, blob and red shares, plus the HSV floor patch for learning
+        """
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        height, width = hsv.shape[:2]
+        lower = slice(height // 2, height)
+
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, 50, 150)[lower] > 0
+
+        hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+        red = ((hue < 10) | (hue > 170)) & (saturation > 120) & (value > 70)
+
+        features = {"edges": float(edges.mean()), "red": float(red.mean()), "free": 0.0, "blob": 0.0,
+                    "patch": hsv[height * 7 // 8:, width // 3:2 * width // 3]}
+        if self.floor_hist is not None:
+            probability = cv2.calcBackProject([hsv[lower]], [0, 1], self.floor_hist, [0, 180, 0, 256], 1)
+            floor = cv2.morphologyEx((probability > self.floor_probability).astype(np.uint8), cv2.MORPH_CLOSE,
+                                     self._kernel)
+            features["free"] = float(floor.mean())
+            # Largest non-floor component reaching the bottom quarter of the frame
+            count, labels, stats, _ = cv2.connectedComponentsWithStats(1 - floor, connectivity=4)
+            near = stats[1:, cv2.CC_STAT_TOP] + stats[1:, cv2.CC_STAT_HEIGHT] > floor.shape[0] // 2
+            if count > 1 and near.any():
+                features["blob"] = float(stats[1:, cv2.CC_STAT_AREA][near].max() / floor.size)
+        return features
+
+    def check(self, frame: np.ndarray) -> Optional[Tuple[str, str]]:
+        """
+        Decide a frame if it is trivial
+        Returns:
+            (command, rule name) for a cascade exit, or None when CLIP should decide
+        """
+        start = time.perf_counter()
+        self.frames += 1
+        features = self.features(frame)
+        verdict, reason = self._verdict(features)
+        self.last_features = features
+        self._pending = (features, None)
+        if verdict is not None and (self._suspended or self._consecutive >= self.max_consecutive):
+            # Forced through CLIP; observe() compares the verdict with CLIP's decision
+            self._pending = (features, verdict)
+            verdict, reason = None, "suspended" if self._suspended else "audit"
+            self.audits += 1
+        self.time_s += time.perf_counter() - start
+
+        if verdict is None:
+            self._consecutive = 0
+            self.forwarded[reason] += 1
+            return None
+        self._consecutive += 1
+        self.exits[verdict] += 1
+        return verdict, CASCADE_RULES[verdict]
+
+    def _verdict(self, features: Dict[str, float]) -> Tuple[Optional[str], str]:
+        if self.confirmed < self.warmup:
+            return None, "warmup"
+        if features["red"] > self.red_max:
+            return None, "red"
+        if features["blob"] >= self.blocked_blob:
+            return "stop", "blocked"
+        if (features["edges"] <= self.clear_edges and features["free"] >= self.clear_free
+                and features["blob"] < self.blocked_blob / 10):
+            return "move_forward", "clear"
+        return None, "uncertain"
+
+    def observe(self, command: str):
+        """
+        Feed back the command decided for the last frame forwarded to CLIP;
+        "move_forward" frames teach the floor model
+        """
+        if self._pending is None:
+            return
+        features, audit_verdict = self._pending
+        self._pending = None
+        if audit_verdict is not None:
+            if audit_verdict == command:
+                self.audit_agreed += 1
+                self._suspended = max(0, self._suspended - 1)
+            else:
+                # The features no longer predict CLIP here; decide with CLIP until audits agree again
+                if not self._suspended:
+                    self.suspensions += 1
+                self._suspended = self.recover
+                self._consecutive = 0
+        if command == "move_forward":
+            hist = cv2.calcHist([features["patch"]], [0, 1], None, [30, 32], [0, 180, 0, 256])
+            cv2.normalize(hist, hist, 0, 255, cv2.NORM_MINMAX)
+            if self.floor_hist is None:
+                self.floor_hist = hist
+            else:
+                cv2.accumulateWeighted(hist, self.floor_hist, self.learning_rate)
+            self.confirmed += 1
+
+    def summary(self) -> Dict[str, float]:
+        """Exit counts and rates since startup"""
+        exits = sum(self.exits.values())
+        return {
+            "frames": self.frames,
+            "exit_rate": exits / self.frames if self.frames else 0.0,
+            "exits": dict(self.exits),
+            "forwarded": dict(self.forwarded),
+            "audits": self.audits,
+            "audit_agreement": self.audit_agreed / self.audits if self.audits else None,
+            "suspensions": self.suspensions,
+            "mean_ms": self.time_s / self.frames * 1000.0 if self.frames else 0.0,
+        }
@@ -0,0 +1,195 @@
+"""
+Command head: a linear probe or small MLP from CLIP image embeddings to
+command logits.
+
+Trained on CPU from logged embeddings and labels (replay.py --embeddings rows
+with a "label" field, or an .npz with "embeddings" and "labels"). At runtime
+it replaces prompt scoring and the threshold rules: one small matmul after
+the image tower.
+
+    python command_head.py labelled.jsonl --output head.safetensors --hidden 256
+    python main.py --command-head head.safetensors
+"""
+import argparse
+import json
+from typing import Dict, Tuple
+
+import numpy as np
+
+from decision_engine import COMMANDS
+from vector_index import load_labelled_embeddings
+
+HEAD_FORMAT = "vlm-car-command-head-1"
+
+
+def _torch():
+    import torch
+    return torch
+
+
+def build_head(dim: int, hidden: int = 0, dropout: float = 0.1):
+    """
+    Args:
+        dim: Embedding dimension
+        hidden: Hidden units of the MLP; 0 for a linear probe
+        dropout: Dropout before the output layer (MLP only)
+    Returns:
+        CommandHead module
+    """
+    torch = _torch()
+
+    class CommandHead(torch.nn.Module):
+        """Normalized embedding -> command logits"""
+
+        def __init__(self):
+            super().__init__()
+            self.dim = dim
+            self.hidden = hidden
+            if hidden:
+                self.layers = torch.nn.Sequential(
+                    torch.nn.Linear(dim, hidden), torch.nn.GELU(), torch.nn.Dropout(dropout),
+                    torch.nn.Linear(hidden, len(COMMANDS)))
+            else:
+                self.layers = torch.nn.Linear(dim, len(COMMANDS))
+
+        def forward(self, embeddings):
+            return self.layers(torch.nn.functional.normalize(embeddings, dim=-1))
+
+        def predict(self, embeddings: np.ndarray) -> np.ndarray:
+            """Command logits (N, len(COMMANDS)) for host embeddings (N, dim)"""
+            with torch.no_grad():
+                return self(torch.from_numpy(np.ascontiguousarray(embeddings, dtype=np.float32))).numpy()
+
+    return CommandHead()
+
+
+def train_head(embeddings: np.ndarray, labels: np.ndarray, hidden: int = 0, epochs: int = 50,
+               batch_size: int = 256, lr: float = 1e-3, weight_decay: float = 1e-4, balance: bool = True,
+               val_fraction: float = 0.2, seed: int = 0) -> Tuple[object, Dict[str, float]]:
+    """
+    Fit a command head with AdamW on CPU
+    Args:
+        embeddings: Image embeddings (N, dim)
+        labels: Command indices into COMMANDS (N,)
+        hidden: Hidden units; 0 for a linear probe
+        epochs: Passes over the training split
+        batch_size: Minibatch size
+        lr: Learning rate
+        weight_decay: AdamW weight decay
+        balance: Weight the loss by inverse command frequency
+        val_fraction: Share of frames held out for validation
+        seed: Random seed for the split and initialization
+    Returns:
+        Tuple of (trained head in eval mode, metrics dictionary)
+    """
+    torch = _torch()
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(labels))
+    val_count = int(len(labels) * val_fraction) if len(labels) >= 10 else 0
+    val, train = order[:val_count], order[val_count:]
+
+    x = torch.from_numpy(np.ascontiguousarray(embeddings, dtype=np.float32))
+    y = torch.from_numpy(np.asarray(labels, dtype=np.int64))
+    counts = np.bincount(labels[train], minlength=len(COMMANDS)).astype(np.float32)
+    weights = None
+    if balance:
+        weights = torch.from_numpy(np.where(counts > 0, counts.sum() / np.maximum(counts, 1) / len(COMMANDS), 0.0)
+                                   .astype(np.float32))
+
+    head = build_head(x.shape[1], hidden)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=lr, weight_decay=weight_decay)
+    loss_fn = torch.nn.CrossEntropyLoss(weight=weights)
+    train_index = torch.from_numpy(train)
+    for _ in range(epochs):
+        head.train()
+        for batch in train_index[torch.randperm(len(train_index))].split(batch_size):
+            optimizer.zero_grad()
+            loss = loss_fn(head(x[batch]), y[batch])
+            loss.backward()
+            optimizer.step()
+    head.eval()
+
+    metrics = {"frames": len(labels), "train_accuracy": evaluate(head, embeddings[train], labels[train])["accuracy"]}
+    if val_count:
+        for key, value in evaluate(head, embeddings[val], labels[val]).items():
+            metrics[f"val_{key}"] = value
+    return head, metrics
+
+
+def evaluate(head, embeddings: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    """Accuracy plus per-command recall"""
+    predicted = head.predict(embeddings).argmax(axis=1)
+    metrics = {"accuracy": float(np.mean(predicted == labels)) if len(labels) else 0.0}
+    for i, command in enumerate(COMMANDS):
+        mask = labels == i
+        if mask.any():
+            metrics[f"recall_{command}"] = float(np.mean(predicted[mask] == i))
+    return metrics
+
+
+def save_head(head, path: str, metrics: Dict[str, float] = None):
+    """Write head weights and shape metadata to a .safetensors file"""
+    from safetensors.torch import save_file
+
+    metadata = {
+        "format": HEAD_FORMAT,
+        "dim": str(head.dim),
+        "hidden": str(head.hidden),
+        "commands": json.dumps(list(COMMANDS)),
+        "metrics": json.dumps(metrics or {}),
+    }
+    save_file({name: tensor.contiguous() for name, tensor in head.state_dict().items()}, path, metadata=metadata)
+
+
+def load_head(path: str):
+    """
+    Load a head written by save_head
+    Returns:
+        CommandHead on the CPU in eval mode
+    """
+    from safetensors import safe_open
+    from safetensors.torch import load_file
+
+    with safe_open(path, framework="pt") as f:
+        metadata = f.metadata()
+    if not metadata or metadata.get("format") != HEAD_FORMAT:
+        raise ValueError(f"{path} is not a command head")
+    if json.loads(metadata["commands"]) != list(COMMANDS):
+        raise ValueError(f"{path} was trained for a different command set")
+    head = build_head(int(metadata["dim"]), int(metadata["hidden"]))
+    head.load_state_dict(load_file(path))
+    return head.eval()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a command head on labelled CLIP image embeddings")
+    parser.add_argument("inputs", nargs="+", help=".npz or replay --embeddings .jsonl files with labels")
+    parser.add_argument("--output", default="command_head.safetensors", help="Head file to write")
+    parser.add_argument("--hidden", type=int, default=0, help="MLP hidden units (0 for a linear probe)")
+    parser.add_argument("--epochs", type=int, default=50, help="Training epochs")
+    parser.add_argument("--batch-size", type=int, default=256, help="Minibatch size")
+    parser.add_argument("--lr", type=float, default=1e-3, help="Learning rate")
+    parser.add_argument("--weight-decay", type=float, default=1e-4, help="AdamW weight decay")
+    parser.add_argument("--no-balance", action="store_true", help="Don't weight the loss by command frequency")
+    parser.add_argument("--val-fraction", type=float, default=0.2, help="Share of frames held out")
+    parser.add_argument("--label-key", default="label", help="Label field in .jsonl inputs")
+    args = parser.parse_args()
+
+    data = [load_labelled_embeddings(path, args.label_key) for path in args.inputs]
+    embeddings = np.concatenate([embedding for embedding, _ in data])
+    labels = np.concatenate([label for _, label in data])
+    if not len(labels):
+        raise SystemExit("No labelled embeddings found")
+    print(f"Training {'linear' if not args.hidden else f'{args.hidden}-unit MLP'} head on {len(labels)} frames")
+
+    head, metrics = train_head(embeddings, labels, args.hidden, args.epochs, args.batch_size, args.lr,
+                               args.weight_decay, not args.no_balance, args.val_fraction)
+    for key, value in metrics.items():
+        print(f"  {key:28s} {value:.3f}" if isinstance(value, float) else f"  {key:28s} {value}")
+    save_head(head, args.output, metrics)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Table-driven decision engine.
+
+The driving rules are a declarative table of (name, command, conditions)
+rows in priority order, where every condition is a (scene element,
+threshold) pair that fires when the score exceeds the threshold. The table
+is compiled against a SceneSchema into index and threshold arrays, so a
+whole batch of score vectors is decided with a few NumPy operations: the
+first rule whose conditions all hold wins, and frames where none does get
+the default command.
+
+Threshold vectors can also be passed in bulk, shape (candidates, conditions),
+to evaluate many threshold settings over the same scores in one call.
+"""
+import json
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from scene_scores import SceneSchema
+
+COMMANDS = ("move_forward", "stop", "turn_left", "turn_right", "slow_down", "maintain_current")
+DEFAULT_COMMAND = "maintain_current"
+
+Rule = namedtuple("Rule", ["name", "command", "conditions"])
+
+# Highest priority first; the same logic determine_command used to spell out as an if/elif chain
+DEFAULT_RULES = (
+    Rule("pedestrian", "stop", (("pedestrian", 0.3),)),
+    Rule("car", "stop", (("car", 0.3),)),
+    Rule("obstacle", "stop", (("obstacle", 0.3),)),
+    Rule("traffic_light", "stop", (("traffic light", 0.5),)),
+    Rule("stop_sign", "stop", (("stop sign", 0.5),)),
+    Rule("narrow_space", "slow_down", (("narrow space", 0.5),)),
+    Rule("clear_left", "turn_left", (("clear path", 0.7), ("left turn", 0.6))),
+    Rule("clear_right", "turn_right", (("clear path", 0.7), ("right turn", 0.6))),
+    Rule("clear_path", "move_forward", (("clear path", 0.7),)),
+)
+
+
+class CompiledRules:
+    """A rule table bound to one SceneSchema"""
+
+    def __init__(self, rules: Sequence[Rule], schema: SceneSchema, default: str = DEFAULT_COMMAND):
+        conditions = [condition for rule in rules for condition in rule.conditions]
+        self.rules = tuple(rules)
+        self.schema = schema
+        self.columns = schema.columns([element for element, _ in conditions])
+        # float64, like the Python floats the original rules compared float32 scores against;
+        # float32 thresholds would miss a score equal to float32(threshold) (e.g. 0.3f > 0.3)
+        self.thresholds = np.asarray([threshold for _, threshold in conditions], dtype=np.float64)
+        # Distinct elements and the element each condition reads, to expand per-element thresholds
+        self.elements = tuple(dict.fromkeys(element for element, _ in conditions))
+        self.condition_elements = np.asarray([self.elements.index(element) for element, _ in conditions],
+                                             dtype=np.intp)
+
+        # (conditions, rules + 1) membership; the last column is the always-true default rule
+        self.membership = np.zeros((len(conditions), len(rules) + 1), dtype=np.float32)
+        row = 0
+        for index, rule in enumerate(rules):
+            self.membership[row:row + len(rule.conditions), index] = 1.0
+            row += len(rule.conditions)
+        self.required = self.membership.sum(axis=0)
+
+        self.rule_commands = np.asarray([COMMANDS.index(rule.command) for rule in rules]
+                                        + [COMMANDS.index(default)], dtype=np.intp)
+        self.rule_names = tuple(rule.name for rule in rules) + ("default",)
+
+    def evaluate(self, scores: np.ndarray, thresholds: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decide a batch of frames
+        Args:
+            scores: Score array of shape (N, K) in schema column order
+            thresholds: Optional condition thresholds, shape (conditions,) or (candidates, conditions)
+        Returns:
+            Tuple of (command indices into COMMANDS, index of the rule that fired), each of
+            shape (N,), or (candidates, N) for a batch of threshold vectors
+        """
+        thresholds = self.thresholds if thresholds is None else np.asarray(thresholds, dtype=np.float64)
+        # (..., N, conditions) condition hits
+        hits = scores[:, self.columns] > thresholds[..., None, :]
+        satisfied = hits.astype(np.float32) @ self.membership
+        fired = satisfied >= self.required
+        rule = fired.argmax(axis=-1)
+        return self.rule_commands[rule], rule
+
+
+class DecisionEngine:
+    """Rule table that compiles itself for each prompt schema it sees"""
+
+    def __init__(self, rules: Sequence[Rule] = DEFAULT_RULES, default: str = DEFAULT_COMMAND):
+        for rule in rules:
+            if rule.command not in COMMANDS:
+                raise ValueError(f"Rule {rule.name} has unknown command {rule.command}")
+        self.rules = tuple(rules)
+        self.default = default
+        self._compiled = {}
+
+    @property
+    def elements(self) -> List[str]:
+        """Scene elements the rules read"""
+        return list(dict.fromkeys(element for rule in self.rules for element, _ in rule.conditions))
+
+    @property
+    def rule_names(self) -> Tuple[str, ...]:
+        """Rule names in priority order, ending with the default rule"""
+        return tuple(rule.name for rule in self.rules) + ("default",)
+
+    def thresholds(self) -> Dict[str, float]:
+        """Threshold of each scene element (the first one, if rules disagree)"""
+        thresholds = {}
+        for rule in self.rules:
+            for element, threshold in rule.conditions:
+                thresholds.setdefault(element, threshold)
+        return thresholds
+
+    def with_thresholds(self, thresholds: Dict[str, float]) -> "DecisionEngine":
+        """Copy of the engine with per-element thresholds replaced in every rule"""
+        rules = [rule._replace(conditions=tuple((element, thresholds.get(element, threshold))
+                                                for element, threshold in rule.conditions))
+                 for rule in self.rules]
+        return DecisionEngine(rules, self.default)
+
+    def compile(self, schema: SceneSchema) -> CompiledRules:
+        compiled = self._compiled.get(schema)
+        if compiled is None:
+            compiled = self._compiled[schema] = CompiledRules(self.rules, schema, self.default)
+        return compiled
+
+    def decide(self, scores: np.ndarray, schema: SceneSchema) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decide a batch of frames
+        Args:
+            scores: Score array of shape (N, K) in schema column order
+            schema: Column layout of scores
+        Returns:
+            Tuple of (command indices into COMMANDS, fired rule indices), each of shape (N,)
+        """
+        return self.compile(schema).evaluate(scores)
+
+    def rule_name(self, schema: SceneSchema, index: int) -> str:
+        return self.compile(schema).rule_names[index]
+
+
+def load_thresholds(path: str) -> Dict[str, float]:
+    """
+    Read per-element thresholds, e.g. as written by calibrate.py
+    Accepts {element: threshold} or {"thresholds": {element: threshold}, ...}.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    if "thresholds" in config:
+        config = config["thresholds"]
+    return {element: float(threshold) for element, threshold in config.items()}
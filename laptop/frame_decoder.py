@@ -0,0 +1,226 @@
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import cv2
+import numpy as np
+
+try:
+    # Decodes straight into a caller-provided buffer and releases the GIL
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+DecodedFrame = namedtuple("DecodedFrame", ["stream_id", "seq", "timestamp", "image", "buffer"])
+
+
+class BufferPool:
+    """Pool of preallocated byte buffers that decoded frames are written into"""
+
+    def __init__(self, frame_shape=(480, 640, 3), count=8):
+        self.capacity = int(np.prod(frame_shape))
+        self._free = deque(np.empty(self.capacity, dtype=np.uint8) for _ in range(count))
+        self._lock = threading.Lock()
+        self.allocations = 0
+
+    def acquire(self, size: int) -> np.ndarray:
+        """Take a buffer of at least `size` bytes, allocating only if the pool is empty or too small"""
+        with self._lock:
+            if size <= self.capacity and self._free:
+                return self._free.popleft()
+            self.allocations += 1
+        return np.empty(max(size, self.capacity), dtype=np.uint8)
+
+    def release(self, buffer: Optional[np.ndarray]):
+        """Return a buffer to the pool"""
+        if buffer is None or buffer.size != self.capacity:
+            return
+        with self._lock:
+            self._free.append(buffer)
+
+
+class _StreamState:
+    def __init__(self):
+        self.next_seq = 0
+        self.delivered_seq = -1
+        self.pending = deque()
+        self.latest = None
+        self.cond = threading.Condition()
+
+
+class FrameDecodePool:
+    """
+    Parallel JPEG decoder for one or more incoming frame streams.
+
+    Compressed frames are handed to a thread pool (libjpeg releases the GIL,
+    so decode scales across cores) and decoded into pooled buffers. Per
+    stream, frames are delivered in sequence order: a frame that finishes
+    decoding after a newer one was already delivered is dropped as stale,
+    and a consumer always gets the newest undelivered frame.
+
+    A delivered frame's pooled buffer belongs to whoever receives it: the
+    caller of latest(), or the on_frame callback when one is set (latest()
+    then returns nothing). The pool recycles it only on release(frame).
+    """
+
+    def __init__(self, workers: Optional[int] = None, frame_shape=(480, 640, 3),
+                 max_pending: int = 2, on_frame: Optional[Callable[[DecodedFrame], None]] = None):
+        """
+        Args:
+            workers: Number of decode threads (defaults to the CPU count)
+            frame_shape: Expected decoded frame shape, used to size pooled buffers
+            max_pending: Maximum queued decodes per stream before the oldest is dropped
+            on_frame: Optional callback invoked from a worker thread for each delivered frame,
+                instead of queueing it for latest(); it owns the frame and must release() it
+        """
+        self.workers = workers or os.cpu_count() or 2
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jpeg-decode")
+        self.pool = BufferPool(frame_shape, count=self.workers * 2 + 4)
+        self.max_pending = max_pending
+        self.on_frame = on_frame
+        self.streams: Dict[str, _StreamState] = {}
+        self._lock = threading.Lock()
+        # Shared by all streams and decode threads; each stream's cond only covers its own state
+        self._stats_lock = threading.Lock()
+        self.stats = {"submitted": 0, "decoded": 0, "dropped_queue": 0,
+                      "dropped_stale": 0, "dropped_unread": 0, "errors": 0}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _stream(self, stream_id) -> _StreamState:
+        with self._lock:
+            state = self.streams.get(stream_id)
+            if state is None:
+                state = self.streams[stream_id] = _StreamState()
+            return state
+
+    def submit(self, stream_id, data, timestamp: Optional[float] = None):
+        """
+        Queue a compressed frame for decoding
+        Args:
+            stream_id: Identifier of the source stream (e.g. car address)
+            data: JPEG bytes
+            timestamp: Capture/receive time, defaults to now
+        """
+        state = self._stream(stream_id)
+        timestamp = time.time() if timestamp is None else timestamp
+        with state.cond:
+            seq = state.next_seq
+            state.next_seq += 1
+            # Bound the per-stream backlog by cancelling the oldest queued decode
+            while len(state.pending) >= self.max_pending:
+                oldest = state.pending.popleft()
+                if oldest.cancel():
+                    self._count("dropped_queue")
+            future = self.executor.submit(self._decode, stream_id, seq, timestamp, data)
+            state.pending.append(future)
+        self._count("submitted")
+
+    def _decode(self, stream_id, seq, timestamp, data):
+        state = self._stream(stream_id)
+        buffer = None
+        try:
+            if simplejpeg is not None:
+                height, width, _, _ = simplejpeg.decode_jpeg_header(data)
+                buffer = self.pool.acquire(height * width * 3)
+                image = simplejpeg.decode_jpeg(data, colorspace="BGR", buffer=buffer)
+            else:
+                image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if image is None:
+                    raise ValueError("invalid JPEG data")
+        except Exception as e:
+            self.pool.release(buffer)
+            self._count("errors")
+            print(f"Error decoding frame {seq} from {stream_id}: {str(e)}")
+            return
+
+        frame = DecodedFrame(stream_id, seq, timestamp, image, buffer)
+        with state.cond:
+            if seq <= state.delivered_seq:
+                # A newer frame of this stream has already been delivered
+                self._count("dropped_stale")
+                self.pool.release(buffer)
+                return
+            state.delivered_seq = seq
+            self._count("decoded")
+            if self.on_frame is None:
+                if state.latest is not None:
+                    self._count("dropped_unread")
+                    self.pool.release(state.latest.buffer)
+                state.latest = frame
+                state.cond.notify_all()
+        if self.on_frame is not None:
+            self.on_frame(frame)
+
+    def latest(self, stream_id, timeout: Optional[float] = None) -> Optional[DecodedFrame]:
+        """
+        Take the newest decoded frame of a stream, waiting up to `timeout` seconds
+        Returns:
+            DecodedFrame, or None on timeout. Call release() when done with it.
+        """
+        state = self._stream(stream_id)
+        with state.cond:
+            # Re-checks after every wakeup, so a spurious one doesn't return early
+            state.cond.wait_for(lambda: state.latest is not None, timeout)
+            frame, state.latest = state.latest, None
+            return frame
+
+    def release(self, frame: Optional[DecodedFrame]):
+        """Return a consumed frame's buffer to the pool"""
+        if frame is not None:
+            self.pool.release(frame.buffer)
+
+    def shutdown(self):
+        """Stop the decode workers"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytearray]:
+    """Read exactly `size` bytes, or return None if the peer closed the connection"""
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            return None
+        received += n
+    return data
+
+
+def receive_frames(sock: socket.socket, decoder: FrameDecodePool, stream_id=None):
+    """
+    Receive length-prefixed JPEG frames (4-byte big-endian size, as sent by
+    CarController.send_image and sensors/camera_stream.py) and hand them to the
+    decode pool. Returns when the connection closes.
+    """
+    stream_id = stream_id if stream_id is not None else sock.getpeername()
+    while True:
+        header = _recv_exact(sock, 4)
+        if header is None:
+            return
+        (size,) = struct.unpack("!I", header)
+        data = _recv_exact(sock, size)
+        if data is None:
+            return
+        decoder.submit(stream_id, data, timestamp=time.time())
+
+
+def serve_frames(decoder: FrameDecodePool, host: str = "0.0.0.0", port: int = 8000):
+    """Accept any number of frame streams, one receive thread per connection"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen()
+    print(f"Receiving frame streams on {host}:{port}")
+    while True:
+        conn, addr = server.accept()
+        print(f"Frame stream connected from {addr}")
+        threading.Thread(target=receive_frames, args=(conn, decoder, addr), daemon=True).start()
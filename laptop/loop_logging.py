@@ -0,0 +1,178 @@
+"""
+Asynchronous, rate-limited structured logging for the control loop.
+
+Loop code logs through the standard `logging` API on the "vlm_car" logger.
+A QueueHandler only rate-limits and enqueues each record; formatting and
+file I/O happen on a QueueListener thread. Each message type (the `event`
+extra, or the message template) has its own token bucket and sampling rate.
+Suppressed records are counted, and the next record that passes carries the
+count.
+
+    log.info("Executing commands: speed=%.2f", speed, extra={"event": "execute"})
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+LOGGER_NAME = "vlm_car"
+
+# event -> (records per second, burst, sampling probability)
+DEFAULT_RATES: Dict[str, Tuple[float, float, float]] = {
+    "execute": (1.0, 1.0, 1.0),
+}
+DEFAULT_RATE = (5.0, 20.0, 1.0)
+
+# LogRecord attributes that are not user-supplied extras
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def event_of(record: logging.LogRecord) -> str:
+    return getattr(record, "event", None) or str(record.msg)
+
+
+class RateLimitFilter(logging.Filter):
+    """Per-event token bucket plus random sampling; counts what it drops"""
+
+    def __init__(self, rates: Optional[Dict[str, Tuple[float, float, float]]] = None,
+                 default: Tuple[float, float, float] = DEFAULT_RATE):
+        super().__init__()
+        self.rates = dict(DEFAULT_RATES if rates is None else rates)
+        self.default = default
+        self.suppressed = Counter()
+        self._buckets: Dict[str, list] = {}
+        self._pending = Counter()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = event_of(record)
+        rate, burst, sample = self.rates.get(event, self.default)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(event)
+            if bucket is None:
+                bucket = self._buckets[event] = [burst, now]
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            # Warnings and errors are rate limited but never sampled away
+            sampled_out = record.levelno < logging.WARNING and sample < 1.0 and random.random() >= sample
+            if sampled_out or bucket[0] < 1.0:
+                self.suppressed[event] += 1
+                self._pending[event] += 1
+                return False
+            bucket[0] -= 1.0
+            if self._pending[event]:
+                record.suppressed = self._pending.pop(event)
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler formats the message in the calling thread; here the
+    record is enqueued as-is, so log arguments must not be mutated afterwards
+    (the loop passes scalars and strings).
+    """
+
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block the loop on a slow disk
+            self.dropped += 1
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record with the timestamp, level, event, message and extras"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "event": event_of(record),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "event":
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} (+{suppressed} suppressed)" if suppressed else text
+
+
+class LoopLogging:
+    """Handle on the installed queue handler and listener"""
+
+    def __init__(self, handler: DeferredQueueHandler, listener: logging.handlers.QueueListener,
+                 rate_limit: RateLimitFilter):
+        self.handler = handler
+        self.listener = listener
+        self.rate_limit = rate_limit
+
+    def stop(self):
+        """Flush queued records, stop the listener and report suppression counts"""
+        logger = logging.getLogger(LOGGER_NAME)
+        suppressed = sum(self.rate_limit.suppressed.values())
+        if suppressed or self.handler.dropped:
+            logger.info("Logging summary: %d suppressed, %d dropped", suppressed, self.handler.dropped,
+                        extra={"event": "logging_summary", "suppressed_by_event": dict(self.rate_limit.suppressed)})
+        self.listener.stop()
+        logger.removeHandler(self.handler)
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+def setup_logging(path: str = "vlm_car.jsonl", fmt: str = "json", level: int = logging.INFO,
+                  rates: Optional[Dict[str, Tuple[float, float, float]]] = None,
+                  queue_size: int = 10000) -> LoopLogging:
+    """
+    Route the "vlm_car" logger through a rate-limited queue to a file
+    Args:
+        path: Log file (appended to)
+        fmt: "json" for JSON lines, "text" for plain lines
+        level: Minimum level recorded
+        rates: Per-event (records/s, burst, sample probability) overrides
+        queue_size: Records buffered before new ones are dropped
+    Returns:
+        LoopLogging; call stop() on shutdown
+    """
+    file_handler = logging.FileHandler(path)
+    file_handler.setFormatter(JsonLinesFormatter() if fmt == "json" else TextFormatter())
+
+    records = queue.Queue(queue_size)
+    handler = DeferredQueueHandler(records)
+    rate_limit = RateLimitFilter(rates)
+    handler.addFilter(rate_limit)
+    listener = logging.handlers.QueueListener(records, file_handler, respect_handler_level=True)
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    # Keep loop records off the console
+    logger.propagate = False
+    listener.start()
+    return LoopLogging(handler, listener, rate_limit)
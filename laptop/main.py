@@ -1,17 +1,103 @@
 from vision_control_system import VisionControlSystem
+from profiling import ControlLoopProfiler
+from decision_engine import load_thresholds
+from telemetry import TelemetryRecorder
+from black_box import BlackBoxRecorder
+from cascade import Cascade
+from scene_student import is_student
+from loop_logging import setup_logging
 import argparse
+import logging
+import signal
 
 def main():
     parser = argparse.ArgumentParser(description='Vision-Language Model Robotic Car Control System')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--model', default='openai/clip-vit-base-patch32',
+                        help='CLIP model name/path, a .safetensors artifact from model_artifact.py, '
+                             'or a .ts/.onnx student from scene_student.py')
+    parser.add_argument('--vision-only', action='store_true',
+                        help='Free the CLIP text encoder after prompt embeddings are computed')
+    parser.add_argument('--prompts', help='Prompt configuration file, re-applied whenever it changes')
+    parser.add_argument('--prompt-cache', help='.npz file caching prompt embeddings across restarts')
+    parser.add_argument('--thresholds', help='Decision thresholds file, e.g. from calibrate.py')
+    parser.add_argument('--cascade', action='store_true',
+                        help='Decide trivially clear or blocked frames with classical CV and skip CLIP for them')
+    parser.add_argument('--command-head', help='Trained command head (command_head.py) replacing prompt scoring')
+    parser.add_argument('--knn-index', help='Vector index of labelled frames that refines rule-based commands')
+    parser.add_argument('--knn-mode', choices=['blend', 'override'], default='blend',
+                        help='Blend neighbour votes with the rule command, or override it when confident')
+    parser.add_argument('--knn-k', type=int, default=10, help='Neighbours per frame')
+    parser.add_argument('--log-file', default='vlm_car.jsonl', help='Control loop log file')
+    parser.add_argument('--log-format', choices=['json', 'text'], default='json', help='Log file format')
+    parser.add_argument('--log-level', default='INFO', help='Minimum level written to the log file')
+    parser.add_argument('--telemetry', help='Directory for columnar per-frame telemetry')
+    parser.add_argument('--telemetry-segment-mb', type=float, default=64.0,
+                        help='Telemetry segment size before rotating')
+    parser.add_argument('--black-box', help='Ring file keeping the most recent frames for crash capture')
+    parser.add_argument('--black-box-seconds', type=float, default=15.0, help='Seconds of frames kept')
+    parser.add_argument('--black-box-fps', type=float, default=10.0, help='Expected control loop frame rate')
+    parser.add_argument('--black-box-dir', default='blackbox', help='Directory for black box snapshots')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the control loop (cProfile, torch.profiler and stack sampling)')
+    parser.add_argument('--profile-dir', default='profile', help='Directory for profiling output')
+    parser.add_argument('--profile-start', type=int, default=20,
+                        help='Loop iteration at which profiling windows open')
+    parser.add_argument('--profile-iterations', type=int, default=50,
+                        help='Number of loop iterations captured with cProfile')
+    parser.add_argument('--profile-torch-iterations', type=int, default=10,
+                        help='Number of inference calls traced with torch.profiler')
+    parser.add_argument('--profile-sample-ms', type=float, default=10.0,
+                        help='Stack sampling interval in ms (0 disables)')
     args = parser.parse_args()
+    if is_student(args.model) and (args.command_head or args.knn_index):
+        # Both work on CLIP image embeddings, which a student doesn't produce
+        parser.error('--command-head and --knn-index need a CLIP model, not a scene student')
+    
+    profiler = None
+    if args.profile:
+        profiler = ControlLoopProfiler(
+            output_dir=args.profile_dir,
+            start=args.profile_start,
+            iterations=args.profile_iterations,
+            torch_iterations=args.profile_torch_iterations,
+            sample_interval=args.profile_sample_ms / 1000.0,
+        )
+    
+    # Per-frame messages are queued, rate limited and written to the log file by a background thread
+    loop_logging = setup_logging(args.log_file, args.log_format, getattr(logging, args.log_level.upper()))
     
     try:
         # Initialize and run the control system
-        control_system = VisionControlSystem()
+        control_system = VisionControlSystem(model_name=args.model, open_camera=True,
+                                             vision_only=args.vision_only,
+                                             prompt_config=args.prompts,
+                                             prompt_cache=args.prompt_cache,
+                                             command_head=args.command_head)
+        if args.prompts:
+            control_system.watch_prompt_config(args.prompts)
+        if args.thresholds:
+            control_system.set_thresholds(load_thresholds(args.thresholds))
+        if args.cascade:
+            control_system.cascade = Cascade()
+        if args.knn_index:
+            control_system.set_knn_index(args.knn_index, k=args.knn_k, mode=args.knn_mode)
+        telemetry = None
+        if args.telemetry:
+            telemetry = TelemetryRecorder(args.telemetry, control_system.score_names,
+                                          control_system.rule_names,
+                                          segment_bytes=int(args.telemetry_segment_mb * 2**20))
+        black_box = None
+        if args.black_box:
+            black_box = BlackBoxRecorder(args.black_box,
+                                         slots=max(1, int(args.black_box_seconds * args.black_box_fps)),
+                                         output_dir=args.black_box_dir)
+            if hasattr(signal, 'SIGUSR1'):
+                # Operator snapshot: kill -USR1 <pid>
+                signal.signal(signal.SIGUSR1, lambda signum, frame: black_box.request('operator'))
         print("Starting Vision Control System...")
         print("Press Ctrl+C to stop")
-        control_system.run_control_loop()
+        control_system.run_control_loop(profiler=profiler, telemetry=telemetry, black_box=black_box)
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -19,6 +105,7 @@ def main():
             import traceback
             traceback.print_exc()
     finally:
+        loop_logging.stop()
         print("System shutdown complete")
 
 if __name__ == "__main__":
@@ -0,0 +1,200 @@
+"""
+Single-file vision artifact for fast cold starts.
+
+`bake` writes one safetensors file holding everything the runtime needs:
+the CLIP vision tower and projection weights, the precomputed prompt
+embeddings, the logit scale and the image preprocessing constants. Loading
+it memory-maps the weights into a CLIPVisionModelWithProjection built on the
+meta device, so there is no text tower, no tokenizer, no random weight init
+and no dependency on the HuggingFace cache layout.
+
+    python model_artifact.py --model openai/clip-vit-base-patch32 --output clip_vision.safetensors
+    python main.py --model clip_vision.safetensors
+"""
+import argparse
+import json
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+ARTIFACT_FORMAT = "vlm-car-vision/1"
+ARTIFACT_SUFFIX = ".safetensors"
+
+
+def is_artifact(path: str) -> bool:
+    """Whether a model name refers to a baked artifact rather than a HuggingFace model"""
+    return path.endswith(ARTIFACT_SUFFIX)
+
+
+class VisionArtifact:
+    """Vision-only CLIP runtime loaded from a baked artifact"""
+
+    def __init__(self, model, prompts: List[str], text_embeddings, logit_scale: float, preprocess_config: dict,
+                 source_model: str = None, templates: Optional[List[str]] = None):
+        self.model = model
+        self.source_model = source_model
+        self.prompts = prompts
+        self.templates = templates
+        self.text_embeddings = text_embeddings
+        self.logit_scale = logit_scale
+        self.preprocess_config = preprocess_config
+
+        self.shortest_edge = preprocess_config["shortest_edge"]
+        self.crop_height = preprocess_config["crop_height"]
+        self.crop_width = preprocess_config["crop_width"]
+        # Fold rescale and normalize into one multiply-add per pixel
+        std = np.asarray(preprocess_config["image_std"], dtype=np.float32)
+        mean = np.asarray(preprocess_config["image_mean"], dtype=np.float32)
+        self._scale = preprocess_config["rescale_factor"] / std
+        self._bias = -mean / std
+
+    def preprocess(self, images: List[np.ndarray]) -> np.ndarray:
+        """
+        Resize, center-crop and normalize images the way CLIPImageProcessor does
+        Args:
+            images: List of HxWx3 uint8 arrays
+        Returns:
+            Float32 array of shape (N, 3, crop_height, crop_width)
+        """
+        batch = np.empty((len(images), 3, self.crop_height, self.crop_width), dtype=np.float32)
+        for i, image in enumerate(images):
+            height, width = image.shape[:2]
+            if height <= width:
+                new_height, new_width = self.shortest_edge, int(self.shortest_edge * width / height)
+            else:
+                new_height, new_width = int(self.shortest_edge * height / width), self.shortest_edge
+            # INTER_AREA approximates PIL's antialiased bicubic when downscaling
+            interpolation = cv2.INTER_AREA if new_height < height else cv2.INTER_CUBIC
+            resized = cv2.resize(image, (new_width, new_height), interpolation=interpolation)
+            top = (new_height - self.crop_height) // 2
+            left = (new_width - self.crop_width) // 2
+            crop = resized[top:top + self.crop_height, left:left + self.crop_width]
+            batch[i] = (crop * self._scale + self._bias).transpose(2, 0, 1)
+        return batch
+
+    def encode_images(self, images: List[np.ndarray], device):
+        """Preprocess images and return their projected CLIP image embeddings"""
+        import torch
+
+        pixel_values = torch.from_numpy(self.preprocess(images)).to(device)
+        return self.model(pixel_values=pixel_values).image_embeds
+
+
+def bake(model_name: str, output: str, prompts: List[str], templates: Optional[List[str]] = None):
+    """
+    Write a vision-only artifact for a CLIP model
+    Args:
+        model_name: HuggingFace model name or local path
+        output: Path of the .safetensors file to write
+        prompts: Prompts whose text embeddings are precomputed
+        templates: Prompt ensemble templates averaged into each prompt's embedding
+    """
+    import torch
+    from safetensors.torch import save_file
+    from transformers import CLIPModel, CLIPProcessor
+    from prompt_set import PromptSet
+
+    model = CLIPModel.from_pretrained(model_name).eval()
+    processor = CLIPProcessor.from_pretrained(model_name)
+
+    def encode_text(texts):
+        with torch.no_grad():
+            text_inputs = processor(text=texts, return_tensors="pt", padding=True)
+            return model.get_text_features(**text_inputs)
+
+    # Same ensembling code path as the runtime, so baked rows match re-encoded ones
+    text_embeddings = torch.from_numpy(PromptSet(encode_text, model_name, "cpu", templates=templates).encode(prompts))
+
+    tensors = {"text_embeddings": text_embeddings.contiguous(),
+               "logit_scale": model.logit_scale.detach().exp().reshape(1)}
+    for prefix, module in (("vision_model", model.vision_model), ("visual_projection", model.visual_projection)):
+        for key, value in module.state_dict().items():
+            tensors[f"vision.{prefix}.{key}"] = value.contiguous()
+        # Non-persistent buffers (e.g. position_ids) are not in the state dict
+        # but still need real values when the model is built on the meta device
+        for key, value in module.named_buffers():
+            tensors[f"buffer.{prefix}.{key}"] = value.contiguous()
+
+    image_processor = processor.image_processor
+    preprocess_config = {
+        "shortest_edge": image_processor.size["shortest_edge"],
+        "crop_height": image_processor.crop_size["height"],
+        "crop_width": image_processor.crop_size["width"],
+        "rescale_factor": image_processor.rescale_factor,
+        "image_mean": list(image_processor.image_mean),
+        "image_std": list(image_processor.image_std),
+    }
+    metadata = {
+        "format": ARTIFACT_FORMAT,
+        "source_model": model_name,
+        "vision_config": model.config.vision_config.to_json_string(),
+        "projection_dim": str(model.config.projection_dim),
+        "prompts": json.dumps(prompts),
+        "templates": json.dumps(templates or []),
+        "preprocess": json.dumps(preprocess_config),
+    }
+    save_file(tensors, output, metadata=metadata)
+    print(f"Wrote {len(tensors)} tensors for {len(prompts)} prompts to {output}")
+
+
+def load_artifact(path: str, device) -> VisionArtifact:
+    """
+    Load a baked artifact with memory-mapped weights
+    Args:
+        path: Path of the .safetensors artifact
+        device: Torch device to run the vision tower on
+    Returns:
+        VisionArtifact ready for inference
+    """
+    import torch
+    from safetensors import safe_open
+    from safetensors.torch import load_file
+    from transformers import CLIPVisionConfig, CLIPVisionModelWithProjection
+
+    with safe_open(path, framework="pt") as f:
+        metadata = f.metadata()
+    if not metadata or metadata.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path} is not a {ARTIFACT_FORMAT} artifact")
+
+    tensors = load_file(path, device=str(device))
+    config = CLIPVisionConfig(**json.loads(metadata["vision_config"]))
+    config.projection_dim = int(metadata["projection_dim"])
+
+    with torch.device("meta"):
+        model = CLIPVisionModelWithProjection(config)
+    state_dict = {key[len("vision."):]: value for key, value in tensors.items() if key.startswith("vision.")}
+    model.load_state_dict(state_dict, assign=True)
+    for key, value in tensors.items():
+        if key.startswith("buffer."):
+            module_name, _, buffer_name = key[len("buffer."):].rpartition(".")
+            model.get_submodule(module_name).register_buffer(buffer_name, value, persistent=False)
+    model.eval()
+
+    return VisionArtifact(
+        model=model,
+        prompts=json.loads(metadata["prompts"]),
+        text_embeddings=tensors["text_embeddings"],
+        logit_scale=float(tensors["logit_scale"].item()),
+        preprocess_config=json.loads(metadata["preprocess"]),
+        source_model=metadata.get("source_model"),
+        templates=json.loads(metadata.get("templates", "[]")) or None,
+    )
+
+
+def main():
+    from prompt_set import DEFAULT_SCENE_ELEMENTS, DEFAULT_TEMPLATES, load_prompt_config, load_prompt_templates
+
+    parser = argparse.ArgumentParser(description="Bake a single-file vision artifact from a CLIP model")
+    parser.add_argument("--model", default="openai/clip-vit-base-patch32", help="CLIP model name or path")
+    parser.add_argument("--output", default="clip_vision" + ARTIFACT_SUFFIX, help="Artifact path")
+    parser.add_argument("--prompts", help="Prompt configuration file (default: the built-in scene elements)")
+    args = parser.parse_args()
+
+    prompts = list(load_prompt_config(args.prompts)) if args.prompts else DEFAULT_SCENE_ELEMENTS
+    templates = load_prompt_templates(args.prompts) if args.prompts else None
+    bake(args.model, args.output, prompts, DEFAULT_TEMPLATES if templates is None else templates)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+
+class StackSampler(threading.Thread):
+    """
+    Low-overhead sampling profiler for one thread.
+
+    Periodically snapshots the target thread's Python stack via
+    sys._current_frames() and counts collapsed stacks, which can be rendered
+    with flamegraph.pl or speedscope. Cheap enough to leave on for long runs.
+    """
+
+    def __init__(self, target_thread_id: int, interval: float = 0.01):
+        super().__init__(name="StackSampler", daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1.0)
+
+    def write_collapsed(self, path: str):
+        """Write stacks in the collapsed 'frame;frame;frame count' format"""
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ControlLoopProfiler:
+    """
+    Profiling hooks for VisionControlSystem.run_control_loop.
+
+    - cProfile over a window of loop iterations -> control_loop.pstats
+    - torch.profiler around the inference call over a (shorter) window
+      -> inference_trace.json (Chrome trace, open in chrome://tracing or Perfetto)
+    - stack sampling of the control loop thread for the whole run
+      -> control_loop.folded (collapsed stacks for flamegraphs)
+    """
+
+    def __init__(self, output_dir: str = "profile", start: int = 20, iterations: int = 50,
+                 torch_iterations: int = 10, sample_interval: float = 0.01):
+        """
+        Args:
+            output_dir: Directory for profile output files
+            start: Loop iteration at which the cProfile/torch windows open (skips warm-up)
+            iterations: Number of iterations profiled with cProfile
+            torch_iterations: Number of inference calls traced with torch.profiler
+            sample_interval: Stack sampling interval in seconds (0 disables sampling)
+        """
+        self.output_dir = output_dir
+        self.start = start
+        self.iterations = iterations
+        self.torch_iterations = torch_iterations
+        self.sample_interval = sample_interval
+
+        self.iteration = -1
+        self._cprofile = None
+        self._torch_profile = None
+        self._torch_calls = 0
+        self._sampler = None
+        self._started_at = None
+
+    def begin(self):
+        """Start whole-run sampling of the calling thread"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._started_at = time.time()
+        if self.sample_interval > 0:
+            self._sampler = StackSampler(threading.get_ident(), self.sample_interval)
+            self._sampler.start()
+        print(f"Profiling enabled, writing results to {self.output_dir}/")
+
+    def begin_iteration(self, index: int):
+        """Called at the start of every control loop iteration"""
+        self.iteration = index
+        if index == self.start and self.iterations > 0:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def end_iteration(self, index: int):
+        """Called at the end of every control loop iteration"""
+        if self._cprofile is not None and index >= self.start + self.iterations - 1:
+            self._finish_cprofile()
+
+    @contextmanager
+    def inference(self):
+        """Wrap the model inference call; traced with torch.profiler inside the window"""
+        if not (self.start <= self.iteration and self._torch_calls < self.torch_iterations):
+            yield
+            return
+
+        if self._torch_profile is None:
+            import torch
+            from torch.profiler import profile, ProfilerActivity
+
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            self._torch_profile = profile(activities=activities, record_shapes=True)
+            self._torch_profile.__enter__()
+
+        import torch
+        with torch.profiler.record_function("inference"):
+            yield
+        self._torch_calls += 1
+        if self._torch_calls >= self.torch_iterations:
+            self._finish_torch_profile()
+
+    def _finish_cprofile(self):
+        self._cprofile.disable()
+        path = os.path.join(self.output_dir, "control_loop.pstats")
+        self._cprofile.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(self._cprofile, stream=summary).sort_stats("cumulative").print_stats(15)
+        print(summary.getvalue())
+        print(f"cProfile stats for {self.iterations} iterations written to {path}")
+        self._cprofile = None
+
+    def _finish_torch_profile(self):
+        self._torch_profile.__exit__(None, None, None)
+        path = os.path.join(self.output_dir, "inference_trace.json")
+        self._torch_profile.export_chrome_trace(path)
+        print(self._torch_profile.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+        print(f"torch.profiler trace for {self._torch_calls} inference calls written to {path}")
+        self._torch_profile = None
+
+    def stop(self):
+        """Close any open windows and write all remaining output"""
+        if self._cprofile is not None:
+            self._finish_cprofile()
+        if self._torch_profile is not None:
+            self._finish_torch_profile()
+        if self._sampler is not None:
+            self._sampler.stop()
+            path = os.path.join(self.output_dir, "control_loop.folded")
+            self._sampler.write_collapsed(path)
+            elapsed = time.time() - self._started_at
+            print(f"{self._sampler.samples} stack samples over {elapsed:.0f}s written to {path}")
+            self._sampler = None
+
+
+def profile_inference(profiler):
+    """Context manager for the inference call that is a no-op without a profiler"""
+    return profiler.inference() if profiler is not None else nullcontext()
@@ -0,0 +1,337 @@
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Scene elements scored for every frame, shared by VisionControlSystem and
+# VisionLanguageProcessor
+DEFAULT_SCENE_ELEMENTS = [
+    "road", "pedestrian", "car", "traffic light", "stop sign",
+    "obstacle", "clear path", "narrow space", "intersection",
+    "left turn", "right turn", "straight path",
+    # Background classes of the signal and path softmax groups (scoring.DEFAULT_PROMPT_GROUPS)
+    "road with no signs", "blocked path"
+]
+
+# Prompt ensemble templates; each class row is the normalized mean of the
+# normalized embeddings of all its templated prompts
+DEFAULT_TEMPLATES = [
+    "a photo of a {}.",
+    "a dashcam view of a {}.",
+    "a photo of a {} seen from a small robot car.",
+    "a low camera view of a {} ahead.",
+    "a blurry photo of a {}.",
+    "a photo of the {} in front of the car.",
+    "an indoor photo of a {}.",
+    "an outdoor photo of a {}.",
+]
+
+
+def ensemble_key(prompt: str, templates: Optional[List[str]] = None) -> str:
+    """Cache key of a class row: the bare prompt, or the prompt plus its ensemble templates"""
+    if not templates:
+        return prompt
+    return json.dumps([prompt, list(templates)])
+
+
+class EmbeddingCache:
+    """
+    Prompt embedding cache keyed by (model, prompt).
+
+    Optionally persisted to an .npz file so restarts don't re-encode prompts.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._vectors: Dict[Tuple[str, str], np.ndarray] = {}
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def get(self, model_id: str, prompt: str) -> Optional[np.ndarray]:
+        return self._vectors.get((model_id, prompt))
+
+    def put(self, model_id: str, prompt: str, vector: np.ndarray):
+        self._vectors[(model_id, prompt)] = np.asarray(vector, dtype=np.float32)
+
+    def load(self, path: str):
+        """Merge cached embeddings from an .npz file"""
+        with np.load(path) as data:
+            keys = json.loads(str(data["keys"]))
+            for (model_id, prompt), vector in zip(keys, data["vectors"]):
+                self._vectors[(model_id, prompt)] = vector
+
+    def save(self, path: Optional[str] = None):
+        """Write all cached embeddings to an .npz file"""
+        path = path or self.path
+        if not path or not self._vectors:
+            return
+        keys = list(self._vectors)
+        # Through a file object: np.savez would append .npz to a bare path that load() then misses
+        with open(path, "wb") as f:
+            np.savez(f, keys=json.dumps(keys), vectors=np.stack([self._vectors[key] for key in keys]))
+
+
+class PromptSet:
+    """
+    Runtime-updatable set of scoring prompts.
+
+    Embeddings live in one contiguous (capacity x dim) matrix on the model's
+    device that is updated in place: adding prompts writes new rows,
+    removing shifts the rows below up, reweighting only touches the weight
+    vector. Only prompts missing from the cache are sent to the encoder, in
+    a single batch, and outside the lock readers take: updates are
+    serialized among themselves and hold the reader lock only to write the
+    encoded rows. Readers take a snapshot that is re-copied only after a
+    change, so the hot loop never blocks on an update.
+
+    With templates, each class is a prompt ensemble: the templated prompts
+    are encoded once, averaged and stored as a single row, so per-frame
+    cost stays one row per class.
+    """
+
+    def __init__(self, encoder: Callable[[List[str]], "torch.Tensor"], model_id: str, device,
+                 cache: Optional[EmbeddingCache] = None, capacity: int = 32,
+                 templates: Optional[List[str]] = None, required: Iterable[str] = ()):
+        """
+        Args:
+            encoder: Function mapping a list of prompts to a (N, dim) embedding tensor
+            model_id: Model identifier used in cache keys
+            device: Torch device the matrix lives on
+            cache: Embedding cache (a private in-memory one by default)
+            capacity: Initial row capacity of the embedding matrix
+            templates: Prompt ensemble templates containing "{}", or None for bare prompts
+            required: Prompts the decision logic depends on, which cannot be removed
+        """
+        self.encoder = encoder
+        self.model_id = model_id
+        self.device = device
+        self.cache = cache or EmbeddingCache()
+        self.capacity = capacity
+        self.templates = list(templates) if templates else None
+        self.required = frozenset(required)
+
+        self.names: List[str] = []
+        self._weights = np.ones(capacity, dtype=np.float32)
+        self._matrix = None
+        # _lock guards the matrix, names and weights (snapshot takes it per frame);
+        # _update_lock serializes updates, including their text encoding
+        self._lock = threading.RLock()
+        self._update_lock = threading.RLock()
+        self._version = 0
+        self._snapshot = None
+        self._snapshot_version = -1
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def cache_key(self, prompt: str) -> str:
+        return ensemble_key(prompt, self.templates)
+
+    def _embed(self, prompts: List[str], templates: Optional[List[str]]) -> np.ndarray:
+        """Embeddings for prompts under templates, encoding only the ones not yet cached"""
+        missing = [p for p in prompts if self.cache.get(self.model_id, ensemble_key(p, templates)) is None]
+        if missing:
+            vectors = self._encode(missing, templates)
+            for prompt, vector in zip(missing, vectors):
+                self.cache.put(self.model_id, ensemble_key(prompt, templates), vector)
+        return np.stack([self.cache.get(self.model_id, ensemble_key(p, templates)) for p in prompts])
+
+    def encode(self, prompts: List[str]) -> np.ndarray:
+        """
+        Encode class rows, bypassing the cache
+        Returns:
+            Array of shape (len(prompts), dim), ensemble-averaged when templates are set
+        """
+        return self._encode(prompts, self.templates)
+
+    def _encode(self, prompts: List[str], templates: Optional[List[str]]) -> np.ndarray:
+        if not templates:
+            return self.encoder(prompts).detach().float().cpu().numpy()
+        texts = [template.format(prompt) for prompt in prompts for template in templates]
+        vectors = self.encoder(texts).detach().float().cpu().numpy()
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors.reshape(len(prompts), len(templates), -1).mean(axis=1)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def set_templates(self, templates: Optional[List[str]]):
+        """Switch ensemble templates, re-embedding every class row in place"""
+        import torch
+
+        templates = list(templates) if templates else None
+        with self._update_lock:
+            if templates == self.templates:
+                return
+            names = list(self.names)
+            vectors = torch.from_numpy(self._embed(names, templates)).to(self.device) if names else None
+            with self._lock:
+                self.templates = templates
+                if vectors is not None:
+                    self._matrix[:len(names)] = vectors
+                self._version += 1
+
+    def _reserve(self, rows: int, dim: int):
+        import torch
+
+        if self._matrix is not None and rows <= self._matrix.shape[0]:
+            return
+        capacity = max(rows, self.capacity, 2 * (self._matrix.shape[0] if self._matrix is not None else 0))
+        matrix = torch.zeros((capacity, dim), dtype=torch.float32, device=self.device)
+        weights = np.ones(capacity, dtype=np.float32)
+        if self._matrix is not None:
+            matrix[:len(self.names)] = self._matrix[:len(self.names)]
+            weights[:len(self.names)] = self._weights[:len(self.names)]
+        self._matrix, self._weights = matrix, weights
+
+    def add(self, prompts: Iterable[str], weight: float = 1.0):
+        """Add prompts (existing ones are left untouched)"""
+        import torch
+
+        with self._update_lock:
+            new = [p for p in dict.fromkeys(prompts) if p not in self.names]
+            if not new:
+                return
+            vectors = torch.from_numpy(self._embed(new, self.templates)).to(self.device)
+            with self._lock:
+                # Only updates change the names and they are serialized, so `new` is still missing
+                start = len(self.names)
+                self._reserve(start + len(new), vectors.shape[1])
+                self._matrix[start:start + len(new)] = vectors
+                self._weights[start:start + len(new)] = weight
+                self.names.extend(new)
+                self._version += 1
+
+    def remove(self, prompts: Iterable[str]):
+        """Remove prompts, keeping the order of the remaining ones"""
+        prompts = list(prompts)
+        required = [prompt for prompt in prompts if prompt in self.required]
+        if required:
+            raise ValueError(f"Cannot remove required prompts: {', '.join(required)}")
+        with self._update_lock, self._lock:
+            for prompt in prompts:
+                if prompt not in self.names:
+                    continue
+                index = self.names.index(prompt)
+                count = len(self.names)
+                self._matrix[index:count - 1] = self._matrix[index + 1:count].clone()
+                self._weights[index:count - 1] = self._weights[index + 1:count]
+                del self.names[index]
+                self._version += 1
+
+    def reweight(self, weights: Dict[str, float]):
+        """Set per-prompt score weights"""
+        with self._update_lock, self._lock:
+            for prompt, weight in weights.items():
+                if prompt in self.names:
+                    self._weights[self.names.index(prompt)] = weight
+            self._version += 1
+
+    def update(self, prompts: Dict[str, float]):
+        """
+        Make the set match a {prompt: weight} mapping, encoding only new prompts
+        Args:
+            prompts: Desired prompts and their weights, in order
+        """
+        with self._update_lock:
+            # Encode outside the reader lock, then apply the whole change at once
+            new = [p for p in prompts if p not in self.names]
+            if new:
+                self._embed(new, self.templates)
+            with self._lock:
+                self.remove([p for p in self.names if p not in prompts])
+                self.add(list(prompts))
+                self.reweight(prompts)
+
+    def snapshot(self):
+        """
+        Consistent view for scoring
+        Returns:
+            Tuple of (names, embedding matrix (K, dim), weight tensor (K,))
+        """
+        import torch
+
+        with self._lock:
+            if self._snapshot_version != self._version:
+                count = len(self.names)
+                self._snapshot = (
+                    list(self.names),
+                    self._matrix[:count].clone(),
+                    torch.from_numpy(self._weights[:count].copy()).to(self.device),
+                )
+                self._snapshot_version = self._version
+            return self._snapshot
+
+
+def load_prompt_config(path: str) -> Dict[str, float]:
+    """
+    Read the prompts of a prompt configuration file
+
+    Accepts either a JSON list of prompts or {"prompts": {prompt: weight}}
+    (a bare {prompt: weight} object works too).
+    """
+    with open(path) as f:
+        config = json.load(f)
+    if isinstance(config, dict) and "prompts" in config:
+        config = config["prompts"]
+    if isinstance(config, list):
+        return {prompt: 1.0 for prompt in config}
+    return {prompt: float(weight) for prompt, weight in config.items()}
+
+
+def load_prompt_templates(path: str) -> Optional[List[str]]:
+    """
+    Read the ensemble templates of a prompt configuration file
+    Returns:
+        The "templates" list ([] disables ensembling), or None if the file doesn't set it
+    """
+    with open(path) as f:
+        config = json.load(f)
+    if isinstance(config, dict) and isinstance(config.get("templates"), list):
+        return config["templates"]
+    return None
+
+
+class PromptConfigWatcher(threading.Thread):
+    """Polls a prompt configuration file and applies changes to a PromptSet"""
+
+    def __init__(self, prompts: PromptSet, path: str, interval: float = 2.0, mtime: Optional[float] = None):
+        """
+        Args:
+            prompts: Prompt set to update
+            path: Prompt configuration file
+            interval: Seconds between polls
+            mtime: Modification time of the version already applied, if any
+        """
+        super().__init__(name="PromptConfigWatcher", daemon=True)
+        self.prompts = prompts
+        self.path = path
+        self.interval = interval
+        self._mtime = mtime
+        self._stop_event = threading.Event()
+
+    def poll(self):
+        """Apply the config file if it changed since the last poll"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            config = load_prompt_config(self.path)
+            templates = load_prompt_templates(self.path)
+            if templates is not None:
+                self.prompts.set_templates(templates)
+            self.prompts.update(config)
+            print(f"Applied prompt config {self.path}: {len(config)} prompts")
+        except Exception as e:
+            print(f"Error applying prompt config {self.path}: {str(e)}")
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,261 @@
+"""
+Offline replay of recorded video through the decision pipeline.
+
+Runs analyze_scenes -> determine_commands -> generate_motor_commands over
+video files and image directories as fast as the hardware allows, sharding
+frame ranges across worker processes, and writes per-frame scores, commands
+and timings to a JSON-lines or CSV results file. With --embeddings, JSON-lines
+rows also carry the CLIP image embedding, which vector_index.py can index
+once the rows are labelled.
+
+    python replay.py recordings/run1.mp4 recordings/frames/ -o results.jsonl --workers 4
+"""
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from typing import Iterator, List, Tuple
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# Per-process VisionControlSystem, created once by the pool initializer
+_system = None
+
+
+def list_sources(paths: List[str]) -> List[Tuple[str, int]]:
+    """
+    Expand input paths into (source, frame_count) pairs
+    Args:
+        paths: Video files and/or directories of images
+    Returns:
+        List of (source path, number of frames)
+    """
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources.append((path, len(_image_files(path))))
+        else:
+            capture = cv2.VideoCapture(path)
+            if not capture.isOpened():
+                print(f"Skipping unreadable source: {path}")
+                continue
+            sources.append((path, int(capture.get(cv2.CAP_PROP_FRAME_COUNT))))
+            capture.release()
+    return sources
+
+
+def _image_files(directory: str) -> List[str]:
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def read_frames(source: str, start: int, end: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield (frame_index, frame) for frames [start, end) of a video file or image directory"""
+    if os.path.isdir(source):
+        for index, path in enumerate(_image_files(source)[start:end], start):
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield index, frame
+        return
+
+    capture = cv2.VideoCapture(source)
+    if start:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    try:
+        for index in range(start, end):
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield index, frame
+    finally:
+        capture.release()
+
+
+def make_shards(sources: List[Tuple[str, int]], shard_size: int) -> List[Tuple[str, int, int]]:
+    """Split every source into (source, start, end) frame ranges"""
+    return [
+        (source, start, min(start + shard_size, count))
+        for source, count in sources
+        for start in range(0, count, shard_size)
+    ]
+
+
+def _init_worker(model_name: str, device: str, threads: int, knn_index: str = None, command_head: str = None):
+    global _system
+    import torch
+    from vision_control_system import VisionControlSystem
+
+    torch.set_num_threads(threads)
+    try:
+        _system = VisionControlSystem(model_name=model_name, device=device, command_head=command_head)
+        if knn_index:
+            _system.set_knn_index(knn_index)
+    except SystemExit:
+        # VisionControlSystem exits on load failure; a pool would just respawn the worker
+        _system = None
+
+
+def _run_batch(system, source, batch, embeddings: bool = False):
+    indices = [index for index, _ in batch]
+    frames = [frame for _, frame in batch]
+
+    start = time.perf_counter()
+    analyses = system.analyze_scenes(frames)
+    features = system.last_image_features
+    analyze_ms = (time.perf_counter() - start) * 1000.0 / len(frames)
+
+    start = time.perf_counter()
+    commands, rules = system.determine_commands(analyses, features)
+    decide_ms = (time.perf_counter() - start) * 1000.0 / len(frames)
+
+    rows = []
+    for i, (index, scores, command, rule) in enumerate(zip(indices, analyses, commands, rules)):
+        rows.append({
+            "source": source,
+            "frame": index,
+            "command": command,
+            "rule": rule,
+            **system.generate_motor_commands(command),
+            "analyze_ms": analyze_ms,
+            "decide_ms": decide_ms,
+            "scores": scores.to_dict(),
+        })
+        if embeddings and features is not None:
+            rows[-1]["embedding"] = features[i].tolist()
+    return rows
+
+
+def process_shard(shard: Tuple[str, int, int], batch_size: int = 16, system=None,
+                  embeddings: bool = False) -> List[dict]:
+    """
+    Run the decision pipeline over one frame range
+    Args:
+        shard: (source, start, end) frame range
+        batch_size: Number of frames per CLIP forward pass
+        system: VisionControlSystem to use (defaults to the worker's instance)
+        embeddings: Include each frame's image embedding in its row
+    Returns:
+        List of per-frame result rows
+    """
+    system = system or _system
+    if system is None:
+        raise RuntimeError("CLIP model failed to load in replay worker")
+    source, start, end = shard
+    rows, batch = [], []
+    for index, frame in read_frames(source, start, end):
+        batch.append((index, frame))
+        if len(batch) == batch_size:
+            rows.extend(_run_batch(system, source, batch, embeddings))
+            batch = []
+    if batch:
+        rows.extend(_run_batch(system, source, batch, embeddings))
+    return rows
+
+
+class ResultWriter:
+    """Writes result rows as JSON lines, or as flat CSV when the path ends in .csv"""
+
+    def __init__(self, path: str):
+        self.file = open(path, "w", newline="")
+        self.csv = path.endswith(".csv")
+        self.writer = None
+
+    def write(self, rows: List[dict]):
+        for row in rows:
+            if not self.csv:
+                self.file.write(json.dumps(row) + "\n")
+                continue
+            flat = {key: value for key, value in row.items() if key not in ("scores", "embedding")}
+            flat.update({f"score:{name}": value for name, value in row["scores"].items()})
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.file, fieldnames=list(flat))
+                self.writer.writeheader()
+            self.writer.writerow(flat)
+
+    def close(self):
+        self.file.close()
+
+
+def replay(paths: List[str], output: str, workers: int = 1, batch_size: int = 16,
+           shard_size: int = 256, model_name: str = "openai/clip-vit-base-patch32",
+           device: str = "cpu", embeddings: bool = False, knn_index: str = None,
+           command_head: str = None) -> dict:
+    """
+    Replay recorded frames through the pipeline and write per-frame results
+    Returns:
+        Summary dictionary with frame count, elapsed time and throughput
+    """
+    sources = list_sources(paths)
+    shards = make_shards(sources, shard_size)
+    total = sum(count for _, count in sources)
+    print(f"Replaying {total} frames from {len(sources)} sources in {len(shards)} shards "
+          f"with {workers} worker(s)")
+
+    writer = ResultWriter(output)
+    frames = 0
+    start = time.perf_counter()
+    try:
+        if workers <= 1:
+            _init_worker(model_name, device, max(1, os.cpu_count() or 1), knn_index, command_head)
+            results = (process_shard(shard, batch_size, None, embeddings) for shard in shards)
+            for rows in results:
+                writer.write(rows)
+                frames += len(rows)
+        else:
+            threads = max(1, (os.cpu_count() or workers) // workers)
+            # spawn avoids forking a process that may already hold CUDA/OpenMP state
+            context = mp.get_context("spawn")
+            with context.Pool(workers, initializer=_init_worker,
+                              initargs=(model_name, device, threads, knn_index, command_head)) as pool:
+                for rows in pool.imap(_process_shard_star,
+                                      [(shard, batch_size, None, embeddings) for shard in shards]):
+                    writer.write(rows)
+                    frames += len(rows)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    summary = {"frames": frames, "elapsed_s": elapsed, "fps": frames / elapsed if elapsed else 0.0}
+    print(f"Processed {frames} frames in {elapsed:.1f}s ({summary['fps']:.1f} fps), results in {output}")
+    return summary
+
+
+def _process_shard_star(args):
+    return process_shard(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded video through the decision pipeline")
+    parser.add_argument("inputs", nargs="+", help="Video files and/or image directories")
+    parser.add_argument("-o", "--output", default="replay_results.jsonl", help="Results file (.jsonl or .csv)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=16, help="Frames per CLIP forward pass")
+    parser.add_argument("--shard-size", type=int, default=256, help="Frames per work unit")
+    parser.add_argument("--model", default="openai/clip-vit-base-patch32", help="CLIP model name or path")
+    parser.add_argument("--device", default="cpu", help="Torch device for the workers")
+    parser.add_argument("--embeddings", action="store_true", help="Include image embeddings in .jsonl rows")
+    parser.add_argument("--knn-index", help="Vector index refining the rule-based commands")
+    parser.add_argument("--command-head", help="Trained command head (command_head.py) replacing prompt scoring")
+    args = parser.parse_args()
+    from scene_student import is_student
+    if is_student(args.model) and (args.command_head or args.knn_index):
+        parser.error("--command-head and --knn-index need a CLIP model, not a scene student")
+
+    try:
+        replay(args.inputs, args.output, args.workers, args.batch_size, args.shard_size, args.model, args.device,
+               args.embeddings, args.knn_index, args.command_head)
+    except KeyboardInterrupt:
+        print("\nReplay interrupted by user")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Array-backed scene scores.
+
+A SceneSchema fixes the name -> column mapping of a prompt vocabulary once;
+SceneScores is a read-only mapping over one row of a float32 array, so a
+batch of frames costs one device-to-host copy and each lookup is an index
+into a NumPy array instead of a per-element .item() call.
+"""
+from collections.abc import Mapping
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+
+class SceneSchema:
+    """Fixed name -> column index mapping for scene scores"""
+
+    def __init__(self, names: Sequence[str], required: Iterable[str] = ()):
+        """
+        Args:
+            names: Score names in column order
+            required: Names that consumers look up; missing ones raise ValueError
+        """
+        self.names = tuple(names)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+        if len(self.index) != len(self.names):
+            raise ValueError(f"Duplicate scene elements in {self.names}")
+        missing = [name for name in required if name not in self.index]
+        if missing:
+            raise ValueError(f"Scene elements missing from the prompt set: {', '.join(missing)}")
+
+    def __len__(self):
+        return len(self.names)
+
+    def __eq__(self, other):
+        return isinstance(other, SceneSchema) and self.names == other.names
+
+    def __hash__(self):
+        return hash(self.names)
+
+    def columns(self, names: Iterable[str]) -> np.ndarray:
+        """Column indices of names, for vectorized access"""
+        return np.asarray([self.index[name] for name in names], dtype=np.intp)
+
+    def scores(self, values) -> "SceneScores":
+        """Wrap one row of scores"""
+        return SceneScores(self, values)
+
+    def batch(self, values) -> List["SceneScores"]:
+        """Wrap a (N, K) score array as N SceneScores sharing its memory"""
+        values = np.asarray(values, dtype=np.float32)
+        if values.ndim != 2 or values.shape[1] != len(self.names):
+            raise ValueError(f"Expected scores of shape (N, {len(self.names)}), got {values.shape}")
+        return [SceneScores(self, row, validate=False) for row in values]
+
+    def zeros(self, count: int = 1) -> List["SceneScores"]:
+        """All-zero scores, e.g. as the result of a failed analysis"""
+        return self.batch(np.zeros((count, len(self.names)), dtype=np.float32))
+
+
+class SceneScores(Mapping):
+    """Read-only {scene element: confidence} view over one row of a float32 array"""
+
+    __slots__ = ("schema", "values")
+
+    def __init__(self, schema: SceneSchema, values, validate: bool = True):
+        self.schema = schema
+        self.values = values if not validate else np.asarray(values, dtype=np.float32)
+        if validate and self.values.shape != (len(schema),):
+            raise ValueError(f"Expected {len(schema)} scores, got shape {self.values.shape}")
+
+    def __getitem__(self, name: str) -> float:
+        return float(self.values[self.schema.index[name]])
+
+    def __iter__(self):
+        return iter(self.schema.names)
+
+    def __len__(self):
+        return len(self.schema.names)
+
+    def __repr__(self):
+        return f"SceneScores({self.to_dict()})"
+
+    def to_dict(self) -> Dict[str, float]:
+        """Plain dictionary, e.g. for JSON output"""
+        return dict(zip(self.schema.names, self.values.tolist()))
@@ -0,0 +1,298 @@
+"""
+Distilled scene-scoring student.
+
+A small convolutional network is trained on recorded frames to reproduce the
+CLIP teacher's scene-score vectors (the output of analyze_scenes), then
+exported as TorchScript (.ts) or ONNX (.onnx) with a .json sidecar holding
+the score names and preprocessing. VisionControlSystem loads an exported
+student in place of CLIP when it is passed as the model:
+
+    python scene_student.py recordings/ --teacher openai/clip-vit-base-patch32 --output student.onnx
+    python main.py --model student.onnx
+
+Scene backends expose `names` and `score(images) -> (N, len(names)) array`,
+which is all analyze_scenes needs from them.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from decision_engine import DEFAULT_RULES, DecisionEngine, load_thresholds
+from scene_scores import SceneSchema
+
+STUDENT_FORMAT = "vlm-car-scene-student-1"
+STUDENT_SUFFIXES = (".ts", ".onnx")
+# CLIP's image normalization, so the student sees the teacher's input statistics
+MEAN = (0.48145466, 0.4578275, 0.40821073)
+STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def is_student(path: str) -> bool:
+    """True for an exported student with its .json sidecar"""
+    return path.endswith(STUDENT_SUFFIXES) and os.path.isfile(path + ".json")
+
+
+def resize_frames(images: Sequence[np.ndarray], size: int) -> np.ndarray:
+    """BGR frames -> uint8 RGB array (N, size, size, 3)"""
+    batch = np.empty((len(images), size, size, 3), dtype=np.uint8)
+    for i, image in enumerate(images):
+        cv2.resize(image, (size, size), dst=batch[i], interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(batch[i], cv2.COLOR_BGR2RGB, dst=batch[i])
+    return batch
+
+
+def normalize_frames(frames: np.ndarray) -> np.ndarray:
+    """uint8 RGB (N, H, W, 3) -> normalized float32 NCHW"""
+    x = frames.astype(np.float32) * (1.0 / 255.0)
+    x -= np.asarray(MEAN, dtype=np.float32)
+    x /= np.asarray(STD, dtype=np.float32)
+    return np.ascontiguousarray(x.transpose(0, 3, 1, 2))
+
+
+def build_student(outputs: int, width: int = 32):
+    """
+    Depthwise-separable CNN: a stride-2 stem and four stride-2 blocks, then
+    global pooling and a linear layer to the score vector
+    Args:
+        outputs: Number of scene scores
+        width: Channels of the stem; blocks double it up to 8x
+    """
+    import torch
+    from torch import nn
+
+    def block(cin, cout):
+        return nn.Sequential(
+            nn.Conv2d(cin, cin, 3, stride=2, padding=1, groups=cin, bias=False), nn.BatchNorm2d(cin), nn.ReLU6(),
+            nn.Conv2d(cin, cout, 1, bias=False), nn.BatchNorm2d(cout), nn.ReLU6())
+
+    channels = [width, width * 2, width * 4, width * 8, width * 8]
+    layers = [nn.Conv2d(3, width, 3, stride=2, padding=1, bias=False), nn.BatchNorm2d(width), nn.ReLU6()]
+    layers += [block(cin, cout) for cin, cout in zip(channels, channels[1:])]
+    layers += [nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(channels[-1], outputs)]
+    return torch.nn.Sequential(*layers)
+
+
+def collect_teacher_scores(teacher, paths: List[str], size: int, batch_size: int = 16,
+                           max_frames: int = 0) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Run the teacher over recorded frames
+    Args:
+        teacher: VisionControlSystem scoring with CLIP
+        paths: Video files and/or image directories
+        size: Student input size
+        batch_size: Frames per teacher forward pass
+        max_frames: Stop after this many frames (0 for all)
+    Returns:
+        Tuple of (student inputs uint8 (N, size, size, 3), teacher scores (N, K), score names)
+    """
+    from replay import list_sources, read_frames
+
+    inputs, scores, names = [], [], None
+    frames = 0
+    for source, count in list_sources(paths):
+        batch = []
+        for _, frame in read_frames(source, 0, count):
+            batch.append(frame)
+            if len(batch) == batch_size or frames + len(batch) == max_frames:
+                names = _teacher_batch(teacher, batch, size, inputs, scores)
+                frames += len(batch)
+                batch = []
+            if max_frames and frames >= max_frames:
+                break
+        if batch:
+            names = _teacher_batch(teacher, batch, size, inputs, scores)
+            frames += len(batch)
+        if max_frames and frames >= max_frames:
+            break
+    return np.concatenate(inputs), np.concatenate(scores), names
+
+
+def _teacher_batch(teacher, batch, size, inputs, scores):
+    analyses = teacher.analyze_scenes(batch)
+    inputs.append(resize_frames(batch, size))
+    scores.append(np.stack([analysis.values for analysis in analyses]))
+    return list(analyses[0].schema.names)
+
+
+def train_student(inputs: np.ndarray, targets: np.ndarray, width: int = 32, epochs: int = 30,
+                  batch_size: int = 64, lr: float = 2e-3, val_fraction: float = 0.1, seed: int = 0):
+    """
+    Fit the student to the teacher's scores with an MSE loss
+    Args:
+        inputs: uint8 RGB frames (N, size, size, 3)
+        targets: Teacher scores (N, K)
+    Returns:
+        Tuple of (student in eval mode, indices of the validation frames)
+    """
+    import torch
+
+    torch.manual_seed(seed)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(targets))
+    val_count = int(len(targets) * val_fraction)
+    val, train = order[:val_count], order[val_count:]
+
+    student = build_student(targets.shape[1], width)
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr, weight_decay=1e-4)
+    steps = epochs * max(1, -(-len(train) // batch_size))
+    schedule = torch.optim.lr_scheduler.OneCycleLR(optimizer, lr, total_steps=steps)
+    y = torch.from_numpy(targets.astype(np.float32))
+    for epoch in range(epochs):
+        student.train()
+        start, total = time.perf_counter(), 0.0
+        for batch in np.array_split(rng.permutation(train), max(1, -(-len(train) // batch_size))):
+            x = normalize_frames(inputs[batch])
+            # Brightness jitter; no flips, which would swap left and right
+            x *= rng.uniform(0.8, 1.2, (len(batch), 1, 1, 1)).astype(np.float32)
+            optimizer.zero_grad()
+            loss = torch.nn.functional.mse_loss(student(torch.from_numpy(x)), y[batch])
+            loss.backward()
+            optimizer.step()
+            schedule.step()
+            total += loss.item() * len(batch)
+        print(f"  epoch {epoch + 1:3d}  loss {total / max(1, len(train)):.5f}  ({time.perf_counter() - start:.1f}s)")
+    return student.eval(), val
+
+
+def predict(student, inputs: np.ndarray, batch_size: int = 256) -> np.ndarray:
+    import torch
+
+    with torch.no_grad():
+        return np.concatenate([student(torch.from_numpy(normalize_frames(inputs[i:i + batch_size]))).numpy()
+                               for i in range(0, len(inputs), batch_size)])
+
+
+def agreement(student_scores: np.ndarray, teacher_scores: np.ndarray, names: List[str],
+              engine: DecisionEngine = None) -> Dict[str, float]:
+    """Score error and decision agreement (under engine's rules, DEFAULT_RULES by default) against the teacher"""
+    engine = engine or DecisionEngine(DEFAULT_RULES)
+    compiled = engine.compile(SceneSchema(names))
+    student_commands, _ = compiled.evaluate(student_scores.astype(np.float32))
+    teacher_commands, _ = compiled.evaluate(teacher_scores.astype(np.float32))
+    errors = np.abs(student_scores - teacher_scores)
+    report = {
+        "frames": len(teacher_scores),
+        "command_agreement": float(np.mean(student_commands == teacher_commands)),
+        "score_mae": float(errors.mean()),
+    }
+    report.update({f"mae:{name}": float(error) for name, error in zip(names, errors.mean(axis=0))})
+    return report
+
+
+def export_student(student, path: str, names: List[str], size: int, report: Dict[str, float] = None,
+                   teacher: str = None, engine: DecisionEngine = None):
+    """
+    Write the student as TorchScript (.ts) or ONNX (.onnx) plus its .json sidecar.
+    The sidecar also carries the decision rules (engine's, DEFAULT_RULES by
+    default), so the Pi's local pilot can turn scores into commands without
+    the laptop code.
+    """
+    import torch
+
+    engine = engine or DecisionEngine(DEFAULT_RULES)
+    example = torch.zeros(1, 3, size, size)
+    if path.endswith(".onnx"):
+        torch.onnx.export(student, (example,), path, input_names=["images"], output_names=["scores"],
+                          dynamic_axes={"images": {0: "batch"}, "scores": {0: "batch"}}, dynamo=False)
+    else:
+        torch.jit.trace(student, example).save(path)
+    with open(path + ".json", "w") as f:
+        json.dump({"format": STUDENT_FORMAT, "names": names, "input_size": size, "mean": MEAN, "std": STD,
+                   "teacher": teacher, "agreement": report or {},
+                   "rules": [list(rule) for rule in engine.rules], "default": engine.default}, f, indent=2)
+
+
+class StudentBackend:
+    """Scene backend running an exported student with TorchScript or ONNX Runtime"""
+
+    def __init__(self, path: str, threads: int = 0):
+        """
+        Args:
+            path: Exported .ts or .onnx student (with its .json sidecar)
+            threads: Intra-op threads, 0 for the runtime's default
+        """
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        if meta.get("format") != STUDENT_FORMAT:
+            raise ValueError(f"{path} is not an exported scene student")
+        self.path = path
+        self.names = list(meta["names"])
+        self.size = meta["input_size"]
+        self.teacher = meta.get("teacher")
+        if path.endswith(".onnx"):
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self._session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            self._run = lambda x: self._session.run(None, {"images": x})[0]
+        else:
+            import torch
+
+            if threads:
+                torch.set_num_threads(threads)
+            module = torch.jit.load(path, map_location="cpu").eval()
+
+            def run(x):
+                with torch.no_grad():
+                    return module(torch.from_numpy(x)).numpy()
+            self._run = run
+
+    def score(self, images: Sequence[np.ndarray]) -> np.ndarray:
+        """Scene scores (N, len(names)) for BGR frames"""
+        return np.asarray(self._run(normalize_frames(resize_frames(images, self.size))), dtype=np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the CLIP scene scorer into a small CNN student")
+    parser.add_argument("inputs", nargs="+", help="Video files and/or image directories")
+    parser.add_argument("--teacher", default="openai/clip-vit-base-patch32", help="CLIP model name, path or artifact")
+    parser.add_argument("--prompts", help="Prompt configuration the teacher scores with")
+    parser.add_argument("--output", default="student.ts", help="Exported student (.ts or .onnx)")
+    parser.add_argument("--size", type=int, default=128, help="Student input size")
+    parser.add_argument("--width", type=int, default=32, help="Student stem channels")
+    parser.add_argument("--epochs", type=int, default=30, help="Training epochs")
+    parser.add_argument("--batch-size", type=int, default=64, help="Training batch size")
+    parser.add_argument("--lr", type=float, default=2e-3, help="Peak learning rate")
+    parser.add_argument("--max-frames", type=int, default=0, help="Frames used for distillation (0 for all)")
+    parser.add_argument("--device", help="Torch device for the teacher")
+    parser.add_argument("--thresholds", help="Decision thresholds file (calibrate.py) for the agreement "
+                                             "report and the exported rules")
+    args = parser.parse_args()
+    if not args.output.endswith(STUDENT_SUFFIXES):
+        parser.error("--output must end in .ts or .onnx")
+    if args.output.endswith(".onnx"):
+        try:
+            import onnx  # noqa: F401  (needed by torch.onnx.export; fail before distilling)
+        except ImportError:
+            parser.error("ONNX export needs the onnx package (pip install onnx), or use a .ts output")
+
+    from vision_control_system import VisionControlSystem
+
+    engine = DecisionEngine(DEFAULT_RULES)
+    if args.thresholds:
+        engine = engine.with_thresholds(load_thresholds(args.thresholds))
+    teacher = VisionControlSystem(model_name=args.teacher, device=args.device, prompt_config=args.prompts)
+    print("Scoring frames with the teacher...")
+    inputs, scores, names = collect_teacher_scores(teacher, args.inputs, args.size, max_frames=args.max_frames)
+    print(f"Distilling {len(scores)} frames x {len(names)} scores")
+
+    student, val = train_student(inputs, scores, args.width, args.epochs, args.batch_size, args.lr)
+    held_out = val if len(val) else np.arange(len(scores))
+    report = agreement(predict(student, inputs[held_out]), scores[held_out], names, engine)
+    print(f"Agreement with the teacher on {report['frames']} held-out frames:")
+    print(f"  command agreement  {report['command_agreement']:.3f}")
+    print(f"  score MAE          {report['score_mae']:.4f}")
+
+    export_student(student, args.output, names, args.size, report, teacher.model_name, engine)
+    print(f"Wrote {args.output} and {args.output}.json")
+
+
+if __name__ == "__main__":
+    main()
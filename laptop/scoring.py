@@ -0,0 +1,139 @@
+"""
+Fused CLIP scoring of image embeddings against prompt embeddings.
+
+Text embeddings are normalized and multiplied by the model's logit scale
+once per prompt set version, so scoring a batch is one normalization of the
+image embeddings, one GEMM and a (grouped) softmax. Image embeddings may
+have any leading shape, e.g. (frames, dim) or (frames, regions, dim).
+
+Each softmax group answers one question (what is in the way, which way the
+path goes, ...), so a score of 0.7 means 0.7 against the alternatives that
+matter instead of against every prompt in the vocabulary. A prompt in no
+group (e.g. one added at runtime) is scored as a two-way softmax against a
+background prompt, so it still reads as "how much more than plain road".
+"""
+from typing import Dict, List, Optional
+
+# Mutually exclusive prompt groups; a softmax runs within each group.
+# Every group carries a background prompt ("road", "road with no signs",
+# "blocked path") so a frame showing none of its classes doesn't push the
+# softmax mass onto them. Prompts not listed here are each scored against
+# DEFAULT_BACKGROUND alone.
+DEFAULT_PROMPT_GROUPS = {
+    "hazard": ["pedestrian", "car", "obstacle", "road"],
+    "signal": ["traffic light", "stop sign", "intersection", "road with no signs"],
+    "path": ["clear path", "narrow space", "blocked path"],
+    "direction": ["left turn", "right turn", "straight path"],
+}
+
+# Competitor of every ungrouped prompt; the mean of all prompt rows stands in when absent
+DEFAULT_BACKGROUND = "road"
+
+# Fallback when a model doesn't expose one; trained CLIP checkpoints sit at the clamp of 100
+DEFAULT_LOGIT_SCALE = 100.0
+
+
+class PromptScorer:
+    """Scores image embeddings against a PromptSet snapshot"""
+
+    def __init__(self, logit_scale: float = DEFAULT_LOGIT_SCALE, groups: Optional[Dict[str, List[str]]] = None,
+                 background: str = DEFAULT_BACKGROUND):
+        """
+        Args:
+            logit_scale: Multiplier applied to cosine similarities before the softmax
+            groups: Mapping of group name to prompts (DEFAULT_PROMPT_GROUPS by default)
+            background: Prompt each ungrouped prompt is scored against
+        """
+        self.logit_scale = float(logit_scale)
+        self.groups = DEFAULT_PROMPT_GROUPS if groups is None else groups
+        self.background = background
+        self._snapshot = None
+        self._prepared = None
+
+    def set_groups(self, groups: Dict[str, List[str]]):
+        """Replace the softmax groups; takes effect on the next score call"""
+        self.groups = groups
+        self._snapshot = None
+
+    def group_ids(self, names: List[str]) -> List[int]:
+        """Softmax group index of each prompt name"""
+        lookup = {}
+        for index, members in enumerate(self.groups.values()):
+            for name in members:
+                lookup.setdefault(name, index)
+        ungrouped = len(self.groups)
+        return [lookup.get(name, ungrouped) for name in names]
+
+    def _prepare(self, snapshot):
+        """Scaled, normalized text matrix, group membership and the ungrouped prompts' competitor"""
+        import torch
+
+        if snapshot is self._snapshot:
+            return self._prepared
+        names, text_features, weights = snapshot
+        text = torch.nn.functional.normalize(text_features.float(), dim=-1)
+        text_t = (text * self.logit_scale).t().contiguous()
+
+        ids = torch.tensor(self.group_ids(names), device=text.device)
+        # Ungrouped prompts: (K,) mask and the scaled background row (dim,) they compete with
+        ungrouped = ids == len(self.groups)
+        background = None
+        if ungrouped.any():
+            row = text[names.index(self.background)] if self.background in names else text.mean(dim=0)
+            background = torch.nn.functional.normalize(row, dim=-1) * self.logit_scale
+        else:
+            ungrouped = None
+        _, ids = torch.unique(ids, return_inverse=True)
+        # One-hot (K, G) membership; None when every prompt is in one group
+        group_count = int(ids.max()) + 1 if len(names) else 1
+        membership = None
+        if group_count > 1:
+            membership = torch.nn.functional.one_hot(ids, group_count).to(text.dtype)
+
+        self._prepared = (text_t, membership, weights.float(), ungrouped, background)
+        self._snapshot = snapshot
+        return self._prepared
+
+    def logits(self, image_features, snapshot):
+        """
+        Scaled cosine similarities
+        Args:
+            image_features: Tensor of shape (..., dim)
+            snapshot: PromptSet snapshot (names, text matrix (K, dim), weights (K,))
+        Returns:
+            Tensor of shape (..., K)
+        """
+        import torch
+
+        text_t = self._prepare(snapshot)[0]
+        image = torch.nn.functional.normalize(image_features.to(text_t.dtype), dim=-1)
+        return image @ text_t
+
+    def score(self, image_features, snapshot):
+        """
+        Grouped softmax confidences, scaled by the per-prompt weights
+        Args:
+            image_features: Tensor of shape (..., dim)
+            snapshot: PromptSet snapshot (names, text matrix (K, dim), weights (K,))
+        Returns:
+            Tensor of shape (..., K); each group's scores sum to 1 before weighting
+        """
+        import torch
+
+        text_t, membership, weights, ungrouped, background = self._prepare(snapshot)
+        image = torch.nn.functional.normalize(image_features.to(text_t.dtype), dim=-1)
+        logits = image @ text_t
+        if membership is None:
+            scores = torch.softmax(logits, dim=-1)
+        else:
+            # Per-group max for stability: mask other groups' logits to -inf, reduce over prompts
+            masked = logits.unsqueeze(-1).masked_fill(membership == 0, float("-inf"))
+            group_max = masked.amax(dim=-2)
+            exp = torch.exp(logits - group_max @ membership.t())
+            group_sum = exp @ membership
+            scores = exp / (group_sum @ membership.t())
+        if ungrouped is not None:
+            # Two-way softmax of each ungrouped prompt against the background
+            versus = torch.sigmoid(logits - (image @ background).unsqueeze(-1))
+            scores = torch.where(ungrouped, versus, scores)
+        return scores * weights
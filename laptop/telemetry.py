@@ -0,0 +1,265 @@
+"""
+Columnar per-frame telemetry.
+
+Every control loop iteration appends one fixed-schema row (timestamp, frame
+ID, score vector, command, fired rule, motor values, stage timings). The loop
+only copies values into a preallocated batch buffer; a background thread
+writes full batches column by column and rotates segments by size.
+
+On disk, each segment is a directory holding one raw little-endian file per
+column plus a schema.json, so any column of any segment can be memory-mapped
+without reading the others:
+
+    telemetry/
+        segment-<start ms>-000001/
+            schema.json  timestamp.bin  frame.bin  scores.bin  command.bin ...
+"""
+import json
+import os
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from decision_engine import COMMANDS
+
+STAGES = ("capture", "analyze", "decide", "execute", "total")
+
+
+def row_dtype(score_count: int, stage_count: int = len(STAGES)) -> np.dtype:
+    """Structured dtype of one telemetry row"""
+    return np.dtype([
+        ("timestamp", "<f8"),
+        ("frame", "<i8"),
+        ("scores", "<f4", (score_count,)),
+        ("command", "<i2"),
+        ("rule", "<i2"),
+        ("speed", "<f4"),
+        ("steering", "<f4"),
+        ("brake", "<f4"),
+        ("timings", "<f4", (stage_count,)),
+    ])
+
+
+class TelemetryRecorder:
+    """
+    Appends telemetry rows with a background writer.
+
+    record() is safe to call from one producer thread; if the writer falls
+    behind and no batch buffer is free, the row is dropped and counted.
+    """
+
+    def __init__(self, directory: str, score_names: Sequence[str], rule_names: Sequence[str] = (),
+                 stages: Sequence[str] = STAGES, batch_rows: int = 256, buffers: int = 8, segment_bytes: int = 64 * 2**20,
+                 flush_interval: float = 1.0):
+        """
+        Args:
+            directory: Output directory for segments
+            score_names: Names of the score vector columns
+            rule_names: Decision rule names, indexed by the rule column
+            stages: Names of the stage timing columns (milliseconds)
+            batch_rows: Rows per batch handed to the writer
+            buffers: Number of preallocated batch buffers
+            segment_bytes: Segment size after which the writer starts a new one
+            flush_interval: Maximum seconds a partial batch waits before being written
+        """
+        self.directory = directory
+        self.rule_names = tuple(rule_names)
+        self._rule_index = {name: i for i, name in enumerate(self.rule_names)}
+        self.stages = tuple(stages)
+        self.batch_rows = batch_rows
+        self.buffer_count = buffers
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+
+        self.rows = 0
+        self.dropped = 0
+        self.segments = 0
+
+        self._free = queue.Queue()
+        self._full = queue.Queue()
+        self._batch = None
+        self._fill = 0
+        self._batch_started = 0.0
+        self._segment = None
+        self._set_schema(score_names)
+
+        os.makedirs(directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_loop, name="TelemetryWriter", daemon=True)
+        self._writer.start()
+
+    def _set_schema(self, score_names: Sequence[str]):
+        """Allocate batch buffers for a score schema (startup and prompt changes only)"""
+        self.score_names = tuple(score_names)
+        self.dtype = row_dtype(len(self.score_names), len(self.stages))
+        self._free = queue.Queue()
+        for _ in range(self.buffer_count):
+            self._free.put(np.zeros(self.batch_rows, dtype=self.dtype))
+        self._batch = None
+        self._fill = 0
+
+    def record(self, frame: int, scores: np.ndarray, command: str, rule: str, motor: Dict[str, float],
+               timings: Sequence[float], score_names: Optional[Sequence[str]] = None):
+        """
+        Append one row
+        Args:
+            frame: Frame ID
+            scores: Score vector in score_names order
+            command: Command name (one of COMMANDS)
+            rule: Name of the decision rule that fired
+            motor: Motor commands with speed/steering/brake
+            timings: Stage timings in ms, in stages order
+            score_names: Score names, if they may have changed since the last row
+        """
+        if score_names is not None and tuple(score_names) != self.score_names:
+            self.flush()
+            self._full.put(("schema", tuple(score_names)))
+            self._set_schema(score_names)
+
+        if self._batch is None:
+            try:
+                self._batch = self._free.get_nowait()
+            except queue.Empty:
+                self.dropped += 1
+                return
+            self._fill = 0
+            self._batch_started = time.monotonic()
+
+        row = self._batch[self._fill]
+        row["timestamp"] = time.time()
+        row["frame"] = frame
+        row["scores"] = scores
+        row["command"] = COMMANDS.index(command) if command in COMMANDS else -1
+        row["rule"] = self._rule_index.get(rule, -1)
+        row["speed"] = motor["speed"]
+        row["steering"] = motor["steering"]
+        row["brake"] = motor["brake"]
+        row["timings"] = timings
+        self._fill += 1
+        self.rows += 1
+
+        if self._fill == self.batch_rows or time.monotonic() - self._batch_started > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Hand the current partial batch to the writer"""
+        if self._batch is not None and self._fill:
+            self._full.put(("rows", self._batch, self._fill))
+            self._batch = None
+            self._fill = 0
+
+    def close(self):
+        """Write everything still buffered and stop the writer"""
+        self.flush()
+        self._full.put(None)
+        self._writer.join(timeout=10.0)
+        print(f"Telemetry: {self.rows} rows in {self.segments} segment(s) under {self.directory}, "
+              f"{self.dropped} dropped")
+
+    def _open_segment(self, score_names: Sequence[str], dtype: np.dtype):
+        self._close_segment()
+        self.segments += 1
+        path = os.path.join(self.directory, f"segment-{int(time.time() * 1000):013d}-{self.segments:06d}")
+        os.makedirs(path)
+        with open(os.path.join(path, "schema.json"), "w") as f:
+            json.dump({
+                "columns": {name: {"dtype": dtype[name].base.str, "shape": list(dtype[name].shape)}
+                            for name in dtype.names},
+                "score_names": list(score_names),
+                "stages": list(self.stages),
+                "commands": list(COMMANDS),
+                "rules": list(self.rule_names),
+            }, f, indent=2)
+        files = {name: open(os.path.join(path, f"{name}.bin"), "ab") for name in dtype.names}
+        self._segment = {"files": files, "bytes": 0}
+
+    def _close_segment(self):
+        if self._segment is not None:
+            for f in self._segment["files"].values():
+                f.close()
+            self._segment = None
+
+    def _write_loop(self):
+        score_names = self.score_names
+        while True:
+            item = self._full.get()
+            if item is None:
+                break
+            if item[0] == "schema":
+                self._close_segment()
+                score_names = item[1]
+                continue
+            _, batch, count = item
+            try:
+                if self._segment is None or self._segment["bytes"] >= self.segment_bytes:
+                    self._open_segment(score_names, batch.dtype)
+                for name, f in self._segment["files"].items():
+                    f.write(np.ascontiguousarray(batch[name][:count]).tobytes())
+                    f.flush()
+                self._segment["bytes"] += count * batch.dtype.itemsize
+            except OSError as e:
+                print(f"Error writing telemetry: {str(e)}")
+            # Buffers from before a schema change are simply dropped
+            if batch.dtype == self.dtype:
+                self._free.put(batch)
+        self._close_segment()
+
+
+class TelemetryReader:
+    """Memory-mapped access to recorded telemetry segments"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segment_paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, name, "schema.json")))
+
+    def __len__(self):
+        return sum(len(segment["timestamp"]) for segment in self.segments())
+
+    @staticmethod
+    def open_segment(path: str) -> Dict[str, np.ndarray]:
+        """
+        Memory-map every column of one segment
+        Returns:
+            Dictionary of column name -> read-only array, plus "schema"
+        """
+        with open(os.path.join(path, "schema.json")) as f:
+            schema = json.load(f)
+        columns = {"schema": schema}
+        for name, spec in schema["columns"].items():
+            dtype = np.dtype(spec["dtype"])
+            row_items = int(np.prod(spec["shape"])) if spec["shape"] else 1
+            column_path = os.path.join(path, f"{name}.bin")
+            size = os.path.getsize(column_path)
+            rows = size // (dtype.itemsize * row_items)
+            shape = (rows, *spec["shape"])
+            # np.memmap can't map empty files
+            columns[name] = np.memmap(column_path, dtype=dtype, mode="r", shape=shape) if rows \
+                else np.empty(shape, dtype=dtype)
+        # Columns are flushed independently; trim to the rows every column has
+        rows = min(len(columns[name]) for name in schema["columns"])
+        for name in schema["columns"]:
+            columns[name] = columns[name][:rows]
+        return columns
+
+    def segments(self) -> Iterator[Dict[str, np.ndarray]]:
+        for path in self.segment_paths:
+            yield self.open_segment(path)
+
+    def column(self, name: str) -> np.ndarray:
+        """One column concatenated over all segments (score columns must share a schema)"""
+        parts = [segment[name] for segment in self.segments()]
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def scores(self, score_name: str) -> np.ndarray:
+        """One scene element's score over all segments, by name"""
+        parts = [segment["scores"][:, segment["schema"]["score_names"].index(score_name)]
+                 for segment in self.segments() if score_name in segment["schema"]["score_names"]]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+
+    def commands(self) -> List[str]:
+        """Command names over all segments"""
+        return [COMMANDS[i] if i >= 0 else "unknown" for i in self.column("command").tolist()]
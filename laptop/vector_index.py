@@ -0,0 +1,470 @@
+"""
+Memory-mapped vector index over CLIP image embeddings.
+
+Two index types share one on-disk layout (a directory with meta.json and
+raw per-column files that are memory-mapped and grown in place):
+
+- FlatIndex: exact cosine search over float32 vectors
+- IVFPQIndex: inverted file with product-quantized residuals; each vector is
+  stored as one coarse list ID plus m bytes, so millions of frames fit in a
+  few tens of MB and a query only scans the lists closest to it
+
+Both support batch queries and incremental inserts, and store a command
+label per vector, which KnnDecider uses to blend or override the rule-based
+command.
+
+    python vector_index.py build embeddings.jsonl --output track_index --kind ivfpq
+"""
+import argparse
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from decision_engine import COMMANDS
+
+# Rows scored per step, bounding the (queries, rows) score matrix
+SEARCH_CHUNK = 65536
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 20, seed: int = 0, spherical: bool = False) -> np.ndarray:
+    """
+    Lloyd's k-means
+    Args:
+        data: Training vectors (N, d)
+        k: Number of centroids
+        iterations: Refinement passes
+        seed: Random seed for the initial centroids
+        spherical: Assign by inner product and keep centroids unit length
+    Returns:
+        Centroids (k, d)
+    """
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(data, centroids, spherical)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        # Re-seed empty clusters from random points
+        sums[empty] = data[rng.choice(len(data), int(empty.sum()))]
+        counts[empty] = 1
+        centroids = sums / counts[:, None]
+        if spherical:
+            centroids = normalize(centroids)
+    return centroids.astype(np.float32)
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, spherical: bool = False) -> np.ndarray:
+    if spherical:
+        return (data @ centroids.T).argmax(axis=1)
+    distances = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * data @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k (score, id) pairs per row, highest first"""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(ids, np.take_along_axis(part, order, axis=1), axis=1)
+
+
+class _Column:
+    """Growable memory-mapped array stored as a raw file"""
+
+    def __init__(self, path: str, dtype, tail: Tuple[int, ...] = (), capacity: int = 1024):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.tail = tuple(tail)
+        row_bytes = self.dtype.itemsize * int(np.prod(self.tail, dtype=np.int64))
+        existing = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+        self.capacity = max(capacity, existing)
+        self._row_bytes = row_bytes
+        self._map()
+
+    def _map(self):
+        with open(self.path, "ab") as f:
+            f.truncate(self.capacity * self._row_bytes)
+        self.array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(self.capacity, *self.tail))
+
+    def write(self, start: int, values: np.ndarray):
+        end = start + len(values)
+        if end > self.capacity:
+            self.array.flush()
+            del self.array
+            self.capacity = max(end, 2 * self.capacity)
+            self._map()
+        self.array[start:end] = values
+
+    def flush(self):
+        self.array.flush()
+
+
+class VectorIndex(ABC):
+    """Common storage and label handling for the index types"""
+
+    kind = None
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        meta = self._read_meta()
+        self.count = meta.get("count", 0)
+        self.labels = _Column(os.path.join(path, "labels.i2"), np.int16)
+
+    def _read_meta(self) -> dict:
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["kind"] != self.kind or meta["dim"] != self.dim:
+            raise ValueError(f"{self.path} holds a {meta['kind']} index of dim {meta['dim']}")
+        return meta
+
+    def _meta(self) -> dict:
+        return {"kind": self.kind, "dim": self.dim, "count": self.count, "commands": list(COMMANDS)}
+
+    def __len__(self):
+        return self.count
+
+    def add(self, vectors: np.ndarray, labels: np.ndarray):
+        """
+        Append vectors with their command labels
+        Args:
+            vectors: Embeddings (N, dim), normalized here
+            labels: Command indices into COMMANDS (N,)
+        """
+        vectors = normalize(np.atleast_2d(vectors))
+        self._add(vectors)
+        self.labels.write(self.count, np.asarray(labels, dtype=np.int16))
+        self.count += len(vectors)
+
+    @abstractmethod
+    def _add(self, vectors: np.ndarray):
+        """Store already normalized vectors at rows count..count+N"""
+
+    @abstractmethod
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest neighbours by cosine similarity
+        Args:
+            queries: Embeddings (Q, dim)
+            k: Neighbours per query
+        Returns:
+            Tuple of (similarities (Q, k), row IDs (Q, k)); IDs are -1 where fewer than k exist
+        """
+
+    def label_of(self, ids: np.ndarray) -> np.ndarray:
+        """Command labels for row IDs (-1 for missing neighbours)"""
+        return np.where(ids >= 0, self.labels.array[np.maximum(ids, 0)], -1)
+
+    def flush(self):
+        """Persist the columns and the row count"""
+        for column in self._columns():
+            column.flush()
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(self._meta(), f, indent=2)
+
+    def _columns(self) -> List[_Column]:
+        return [self.labels]
+
+
+class FlatIndex(VectorIndex):
+    """Exact search over all stored vectors"""
+
+    kind = "flat"
+
+    def __init__(self, path: str, dim: int):
+        super().__init__(path, dim)
+        self.vectors = _Column(os.path.join(path, "vectors.f32"), np.float32, (dim,))
+
+    def _add(self, vectors: np.ndarray):
+        self.vectors.write(self.count, vectors)
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        queries = normalize(np.atleast_2d(queries))
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for start in range(0, self.count, SEARCH_CHUNK):
+            end = min(start + SEARCH_CHUNK, self.count)
+            scores = queries @ self.vectors.array[start:end].T
+            ids = np.broadcast_to(np.arange(start, end), scores.shape)
+            best_scores, best_ids = _top_k(np.hstack([best_scores, scores]), np.hstack([best_ids, ids]), k)
+        return best_scores, best_ids
+
+    def _columns(self):
+        return [self.labels, self.vectors]
+
+
+class IVFPQIndex(VectorIndex):
+    """Inverted file over coarse centroids with product-quantized residuals"""
+
+    kind = "ivfpq"
+
+    def __init__(self, path: str, dim: int, nlist: int = 256, m: int = 32, nprobe: int = 8):
+        """
+        Args:
+            path: Index directory
+            dim: Embedding dimension (divisible by m)
+            nlist: Number of coarse lists
+            m: Number of PQ sub-vectors (bytes per stored vector)
+            nprobe: Lists scanned per query
+        """
+        super().__init__(path, dim)
+        meta = self._read_meta()
+        self.nlist = meta.get("nlist", nlist)
+        self.m = meta.get("m", m)
+        if dim % self.m:
+            raise ValueError(f"dim {dim} is not divisible by m {self.m}")
+        self.nprobe = nprobe
+        self.coarse = self.codebooks = None
+        if os.path.exists(os.path.join(path, "quantizer.npz")):
+            with np.load(os.path.join(path, "quantizer.npz")) as quantizer:
+                self.coarse = quantizer["coarse"]
+                self.codebooks = quantizer["codebooks"]
+            self.nlist = len(self.coarse)
+        self.lists = _Column(os.path.join(path, "lists.i4"), np.int32)
+        self.codes = _Column(os.path.join(path, "codes.u8"), np.uint8, (self.m,))
+        # Row IDs grouped by list, rebuilt lazily after inserts
+        self._order = self._offsets = None
+
+    @property
+    def trained(self) -> bool:
+        return self.coarse is not None
+
+    def train(self, sample: np.ndarray, iterations: int = 20, seed: int = 0):
+        """
+        Learn the coarse centroids and residual codebooks
+        Args:
+            sample: Representative embeddings, ideally at least 40 x nlist of them
+        """
+        sample = normalize(sample)
+        self.coarse = kmeans(sample, self.nlist, iterations, seed, spherical=True)
+        self.nlist = len(self.coarse)
+        residuals = sample - self.coarse[_nearest(sample, self.coarse, spherical=True)]
+        sub = self.dim // self.m
+        self.codebooks = np.stack([
+            kmeans(np.ascontiguousarray(residuals[:, j * sub:(j + 1) * sub]), 256, iterations, seed + j)
+            for j in range(self.m)])
+        if self.codebooks.shape[1] < 256:
+            # Tiny training sets: pad so codes always index a full table
+            pad = np.repeat(self.codebooks[:, :1], 256 - self.codebooks.shape[1], axis=1)
+            self.codebooks = np.concatenate([self.codebooks, pad], axis=1)
+        np.savez(os.path.join(self.path, "quantizer.npz"), coarse=self.coarse, codebooks=self.codebooks)
+
+    def _add(self, vectors: np.ndarray):
+        if not self.trained:
+            raise RuntimeError("IVFPQIndex must be trained before vectors are added")
+        lists = _nearest(vectors, self.coarse, spherical=True)
+        residuals = vectors - self.coarse[lists]
+        sub = self.dim // self.m
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest(residuals[:, j * sub:(j + 1) * sub], self.codebooks[j])
+        self.lists.write(self.count, lists.astype(np.int32))
+        self.codes.write(self.count, codes)
+        self._order = None
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._order is None:
+            lists = self.lists.array[:self.count]
+            self._order = np.argsort(lists, kind="stable")
+            self._offsets = np.searchsorted(lists[self._order], np.arange(self.nlist + 1))
+        return self._order, self._offsets
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        queries = normalize(np.atleast_2d(queries))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        coarse_scores = queries @ self.coarse.T
+        probes = np.argpartition(-coarse_scores, nprobe - 1, axis=1)[:, :nprobe]
+        # Inner products of each query sub-vector with every codeword: (Q, m, 256)
+        sub = self.dim // self.m
+        tables = np.einsum("qmd,mcd->qmc", queries.reshape(len(queries), self.m, sub), self.codebooks)
+
+        order, offsets = self._inverted_lists()
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        columns = np.arange(self.m)
+        for q in range(len(queries)):
+            rows = np.concatenate([order[offsets[l]:offsets[l + 1]] for l in probes[q]])
+            if not len(rows):
+                continue
+            rows.sort()  # Sequential reads from the memory-mapped columns
+            # Asymmetric distance: exact coarse term plus looked-up residual terms
+            scores = coarse_scores[q, self.lists.array[rows]] + tables[q, columns, self.codes.array[rows]].sum(axis=1)
+            padded_scores = np.concatenate([best_scores[q], scores])[None]
+            padded_ids = np.concatenate([best_ids[q], rows])[None]
+            top_scores, top_ids = _top_k(padded_scores, padded_ids, k)
+            best_scores[q], best_ids[q] = top_scores[0], top_ids[0]
+        return best_scores, best_ids
+
+    def _meta(self):
+        return {**super()._meta(), "nlist": self.nlist, "m": self.m}
+
+    def _columns(self):
+        return [self.labels, self.lists, self.codes]
+
+
+def open_index(path: str, **kwargs) -> VectorIndex:
+    """Open an existing index directory with the right index type"""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    cls = {"flat": FlatIndex, "ivfpq": IVFPQIndex}[meta["kind"]]
+    return cls(path, meta["dim"], **kwargs)
+
+
+class KnnDecider:
+    """
+    Blends the rule-based command with the commands of the nearest stored frames.
+
+    Neighbour votes are weighted by similarity. In "override" mode the kNN
+    command replaces the rule command when the vote is confident enough; in
+    "blend" mode the rule command is one more vote of weight (1 - knn_weight).
+    A rule "stop" is never overridden.
+    """
+
+    def __init__(self, index: VectorIndex, k: int = 10, mode: str = "blend", knn_weight: float = 0.6,
+                 min_similarity: float = 0.85, min_confidence: float = 0.7):
+        """
+        Args:
+            index: Vector index with command labels
+            k: Neighbours per query
+            mode: "blend" or "override"
+            knn_weight: Weight of the neighbour vote in blend mode
+            min_similarity: Neighbours less similar than this are ignored
+            min_confidence: Vote share the kNN command needs in override mode
+        """
+        if mode not in ("blend", "override"):
+            raise ValueError(f"Unknown kNN mode {mode}")
+        self.index = index
+        self.k = k
+        self.mode = mode
+        self.knn_weight = knn_weight
+        self.min_similarity = min_similarity
+        self.min_confidence = min_confidence
+        self._stop = COMMANDS.index("stop")
+
+    def votes(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Similarity-weighted command votes of the nearest neighbours
+        Returns:
+            Array (Q, len(COMMANDS)) of vote shares (rows are all zero without usable neighbours)
+        """
+        similarities, ids = self.index.search(embeddings, self.k)
+        labels = self.index.label_of(ids)
+        weights = np.where((labels >= 0) & (similarities >= self.min_similarity), similarities, 0.0)
+        votes = np.zeros((len(labels), len(COMMANDS)), dtype=np.float32)
+        np.add.at(votes, (np.arange(len(labels))[:, None], np.maximum(labels, 0)), weights)
+        totals = votes.sum(axis=1, keepdims=True)
+        return np.divide(votes, totals, out=np.zeros_like(votes), where=totals > 0)
+
+    def decide(self, embeddings: np.ndarray, rule_commands: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Combine rule commands with neighbour votes for a batch of frames
+        Args:
+            embeddings: Image embeddings (Q, dim)
+            rule_commands: Rule-based command indices (Q,)
+        Returns:
+            Tuple of (command indices (Q,), mask of frames where kNN changed the command)
+        """
+        votes = self.votes(embeddings)
+        rule_commands = np.asarray(rule_commands)
+        if self.mode == "override":
+            knn = votes.argmax(axis=1)
+            use = votes.max(axis=1) >= self.min_confidence
+        else:
+            combined = votes * self.knn_weight
+            combined[np.arange(len(rule_commands)), rule_commands] += 1.0 - self.knn_weight
+            knn = combined.argmax(axis=1)
+            use = votes.sum(axis=1) > 0
+        use &= rule_commands != self._stop
+        commands = np.where(use, knn, rule_commands)
+        return commands, commands != rule_commands
+
+
+def load_labelled_embeddings(path: str, label_key: str = "label") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load image embeddings with command labels
+    Args:
+        path: .npz with "embeddings" and "labels", or replay --embeddings .jsonl output
+        label_key: Label field of .jsonl rows (rows without one fall back to "command")
+    Returns:
+        Tuple of (float32 embeddings (N, dim), command indices (N,)); unlabelled rows are dropped
+    """
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            embeddings = data["embeddings"].astype(np.float32)
+            labels = [str(label) for label in data["labels"]]
+    else:
+        embeddings, labels = [], []
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if "embedding" not in row:
+                    continue
+                embeddings.append(row["embedding"])
+                labels.append(row.get(label_key, row.get("command")))
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+    keep = np.asarray([label in COMMANDS for label in labels], dtype=bool)
+    label_ids = np.asarray([COMMANDS.index(label) for label in labels if label in COMMANDS], dtype=np.int64)
+    return embeddings[keep] if len(labels) else embeddings, label_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a vector index of labelled image embeddings")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    build = subparsers.add_parser("build", help="Create or extend an index")
+    build.add_argument("inputs", nargs="+", help=".npz or replay --embeddings .jsonl files")
+    build.add_argument("--output", required=True, help="Index directory")
+    build.add_argument("--kind", choices=["flat", "ivfpq"], default="flat", help="Index type")
+    build.add_argument("--nlist", type=int, default=256, help="IVF lists")
+    build.add_argument("--m", type=int, default=32, help="PQ bytes per vector")
+    build.add_argument("--label-key", default="label", help="Label field in .jsonl inputs")
+
+    query = subparsers.add_parser("query", help="Report kNN agreement with labels")
+    query.add_argument("index", help="Index directory")
+    query.add_argument("inputs", nargs="+", help=".npz or .jsonl files with labelled embeddings")
+    query.add_argument("-k", type=int, default=10, help="Neighbours per query")
+    query.add_argument("--label-key", default="label", help="Label field in .jsonl inputs")
+    args = parser.parse_args()
+
+    data = [load_labelled_embeddings(path, args.label_key) for path in args.inputs]
+    embeddings = np.concatenate([embedding for embedding, _ in data])
+    labels = np.concatenate([label for _, label in data])
+
+    if args.action == "build":
+        if os.path.exists(os.path.join(args.output, "meta.json")):
+            index = open_index(args.output)
+        elif args.kind == "ivfpq":
+            index = IVFPQIndex(args.output, embeddings.shape[1], args.nlist, args.m)
+        else:
+            index = FlatIndex(args.output, embeddings.shape[1])
+        if isinstance(index, IVFPQIndex) and not index.trained:
+            index.train(embeddings)
+        index.add(embeddings, labels)
+        index.flush()
+        print(f"Index {args.output} ({index.kind}) now holds {len(index)} vectors")
+    else:
+        decider = KnnDecider(open_index(args.index), k=args.k, min_similarity=-1.0)
+        predicted = decider.votes(embeddings).argmax(axis=1)
+        print(f"kNN command agreement with labels: {np.mean(predicted == labels):.3f} over {len(labels)} frames")
+
+
+if __name__ == "__main__":
+    main()
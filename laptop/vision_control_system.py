@@ -1,28 +1,144 @@
-import torch
-from transformers import CLIPProcessor, CLIPModel
 import cv2
+import gc
+import logging
+import os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from typing import Dict, List
 import time
 import sys
+from profiling import profile_inference
+from decision_engine import COMMANDS, DEFAULT_RULES, DecisionEngine
+from scene_scores import SceneSchema, SceneScores
+from scoring import PromptScorer
+from vector_index import KnnDecider, open_index
+from model_artifact import is_artifact, load_artifact
+from scene_student import StudentBackend, is_student
+from cascade import CASCADE_RULES
+from prompt_set import (DEFAULT_SCENE_ELEMENTS, DEFAULT_TEMPLATES, EmbeddingCache, PromptSet, PromptConfigWatcher,
+                        ensemble_key, load_prompt_config, load_prompt_templates)
+
+# Per-frame messages go through the rate-limited queue set up by loop_logging
+log = logging.getLogger("vlm_car.control")
+
+# torch and transformers are imported lazily inside the loader threads so
+# that importing this module (and argument parsing in main.py) stays cheap.
+# transformers' lazy module is not safe to import from two threads at once.
+_import_lock = Lock()
+
+
+def _import_torch():
+    """Import torch without transformers' text/processor modules"""
+    with _import_lock:
+        import torch
+    return torch
+
+
+def _import_clip():
+    """Import torch and the CLIP classes, serialized across loader threads"""
+    with _import_lock:
+        import torch
+        from transformers import CLIPModel, CLIPProcessor
+    return torch, CLIPModel, CLIPProcessor
+
 
 class VisionControlSystem:
-    def __init__(self):
+    # Default scene elements scored for every frame
+    SCENE_ELEMENTS = DEFAULT_SCENE_ELEMENTS
+    # Decision rules, shared by live control and offline replay
+    decision_engine = DecisionEngine(DEFAULT_RULES)
+    # Scene elements the rules look up; checked against the prompt set at startup
+    REQUIRED_SCENE_ELEMENTS = tuple(decision_engine.elements)
+    # Optional kNN refinement (set_knn_index) and command head (set_command_head); class
+    # defaults so systems built without __init__ (benchmark.py) decide with the rules alone
+    knn = None
+    command_head = None
+
+    def __init__(self, model_name: str = "openai/clip-vit-base-patch32", device: str = None,
+                 open_camera: bool = False, vision_only: bool = False, prompt_config: str = None,
+                 prompt_cache: str = None, command_head: str = None):
+        """
+        Args:
+            model_name: CLIP model name or local path, a baked .safetensors artifact, or a distilled
+                student (.ts/.onnx, see scene_student.py)
+            device: Torch device, defaults to cuda when available
+            open_camera: Open the camera concurrently with model loading
+            vision_only: Free the text tower and tokenizer once prompt embeddings are computed
+            prompt_config: Optional prompt configuration file (see prompt_set.load_prompt_config)
+            prompt_cache: Optional .npz file persisting prompt embeddings across restarts
+            command_head: Optional trained command head (see command_head.py); replaces prompt
+                scoring, so no prompts are encoded
+        """
         print("Initializing Vision Control System...")
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Using device: {self.device}")
-        
-        try:
-            print("Loading CLIP model...")
-            self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(self.device)
-            self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            print("CLIP model loaded successfully")
-        except Exception as e:
-            print(f"Error loading CLIP model: {str(e)}")
-            sys.exit(1)
-            
+        self.model_name = model_name
+        self.text_resident = False
         self.camera = None
         self.is_running = False
+        self.artifact = None
+        self.processor = None
+        self.scene_backend = None
+        self.prompts = None
+        self.prompt_watcher = None
+        # Prompt configuration applied at startup and its mtime when read
+        self.prompt_config = None
+        self._prompt_config_mtime = None
+        self.knn = None
+        self.command_head = None
+        self.cascade = None
+        self.last_image_features = None
+        self.startup_timings = {}
+        self._startup_t0 = time.perf_counter()
+        
+        # Model, processor and camera are independent, so load them concurrently
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="startup") as executor:
+            student = is_student(model_name)
+            if student:
+                # Distilled student: scores scenes directly, no CLIP or prompts
+                model_future = executor.submit(self._timed, "student", self._load_student, model_name)
+                processor_future = None
+            elif is_artifact(model_name):
+                # Baked artifact: vision tower plus precomputed prompt embeddings, no processor
+                model_future = executor.submit(self._timed, "artifact", self._load_artifact, model_name, device)
+                processor_future = None
+            else:
+                model_future = executor.submit(self._timed, "model", self._load_model, model_name, device)
+                processor_future = executor.submit(self._timed, "processor", self._load_processor, model_name)
+            camera_future = executor.submit(self._timed, "camera", self.initialize_camera) if open_camera else None
+            
+            try:
+                print("Loading scene student..." if student else "Loading CLIP model...")
+                self.model, self.device = model_future.result()
+                if processor_future is not None:
+                    self.processor = processor_future.result()
+                print("Scene student loaded successfully" if student else "CLIP model loaded successfully")
+            except Exception as e:
+                print(f"Error loading {'scene student' if student else 'CLIP model'}: {str(e)}")
+                sys.exit(1)
+            
+            self._schema = None
+            if self.scene_backend is not None:
+                self._scene_schema(self.scene_backend.names)
+            elif command_head:
+                # Commands come from the head; the scene scores it reports stay at zero
+                self.set_command_head(command_head)
+                self._scene_schema(list(self.SCENE_ELEMENTS))
+                if vision_only:
+                    self.drop_text_tower()
+            else:
+                # Text prompts never change per frame, so encode them once
+                self.text_resident = self.artifact is None
+                self._timed("text_embeddings", self._init_prompts, prompt_config, prompt_cache)
+                self.scorer = PromptScorer(self._logit_scale())
+                self._scene_schema(self.prompts.snapshot()[0])
+                if vision_only:
+                    self.drop_text_tower()
+            
+            if camera_future is not None:
+                camera_future.result()
+        
+        self.startup_timings["total"] = (0.0, time.perf_counter() - self._startup_t0)
+        self.print_startup_report()
         
         # Define control commands and their descriptions
         self.control_commands = {
@@ -34,6 +150,209 @@ class VisionControlSystem:
             "maintain_current": "no significant changes in the environment"
         }
         
+    def _timed(self, phase: str, fn, *args):
+        """Run one startup phase and record its (start, end) offsets in seconds"""
+        start = time.perf_counter() - self._startup_t0
+        try:
+            return fn(*args)
+        finally:
+            self.startup_timings[phase] = (start, time.perf_counter() - self._startup_t0)
+    
+    def _load_model(self, model_name: str, device: str = None):
+        """Import torch/transformers and load the CLIP model onto the device"""
+        torch, CLIPModel, _ = self._timed("imports", _import_clip)
+        
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        device = torch.device(device)
+        print(f"Using device: {device}")
+        model = CLIPModel.from_pretrained(model_name).to(device)
+        model.eval()
+        return model, device
+    
+    def _load_artifact(self, path: str, device: str = None):
+        """Load a baked vision-only artifact and its precomputed prompt embeddings"""
+        torch = self._timed("imports", _import_torch)
+        
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        device = torch.device(device)
+        print(f"Using device: {device}")
+        self.artifact = load_artifact(path, device)
+        if self.artifact.source_model:
+            self.model_name = self.artifact.source_model
+        return self.artifact.model, device
+    
+    def _load_student(self, path: str):
+        """Load a distilled scene student as the scene backend"""
+        self.scene_backend = StudentBackend(path)
+        print(f"Using scene student {path} ({len(self.scene_backend.names)} scores, "
+              f"distilled from {self.scene_backend.teacher})")
+        return None, "cpu"
+    
+    def _load_processor(self, model_name: str):
+        """Load the CLIP tokenizer and image processor"""
+        _, _, CLIPProcessor = _import_clip()
+        
+        return CLIPProcessor.from_pretrained(model_name)
+    
+    def _init_prompts(self, prompt_config: str = None, prompt_cache: str = None):
+        """Build the prompt set, seeding its cache with any embeddings baked into the artifact"""
+        # Prompt ensembles by default; an artifact keeps the templates it was baked
+        # with so its embeddings are reused, and a config file can override either
+        templates = DEFAULT_TEMPLATES
+        if self.artifact is not None:
+            templates = self.artifact.templates
+        if prompt_config:
+            # Taken before reading, so an edit made while loading is applied by the watcher
+            self.prompt_config = prompt_config
+            self._prompt_config_mtime = os.path.getmtime(prompt_config)
+        if prompt_config and load_prompt_templates(prompt_config) is not None:
+            templates = load_prompt_templates(prompt_config)
+        
+        self.prompts = PromptSet(self.encode_text, self.model_name, self.device, EmbeddingCache(prompt_cache),
+                                 templates=templates, required=self.REQUIRED_SCENE_ELEMENTS)
+        if self.artifact is not None:
+            for prompt, vector in zip(self.artifact.prompts, self.artifact.text_embeddings.float().cpu().numpy()):
+                self.prompts.cache.put(self.model_name, ensemble_key(prompt, self.artifact.templates), vector)
+        
+        if prompt_config:
+            self.prompts.update(load_prompt_config(prompt_config))
+        else:
+            self.prompts.add(self.SCENE_ELEMENTS)
+    
+    def _logit_scale(self) -> float:
+        """CLIP's learned similarity temperature"""
+        if self.artifact is not None:
+            return self.artifact.logit_scale
+        return float(self.model.logit_scale.detach().exp().item())
+    
+    def set_thresholds(self, thresholds: Dict[str, float]):
+        """Override decision thresholds per scene element (see calibrate.py)"""
+        self.decision_engine = self.decision_engine.with_thresholds(thresholds)
+        print(f"Decision thresholds: {self.decision_engine.thresholds()}")
+    
+    def set_knn_index(self, path: str, **kwargs):
+        """
+        Refine rule-based commands with the nearest labelled frames of a vector index
+        Args:
+            path: Index directory (see vector_index.py)
+            kwargs: KnnDecider options (k, mode, knn_weight, min_similarity, min_confidence)
+        """
+        index = open_index(path)
+        self.knn = KnnDecider(index, **kwargs)
+        print(f"kNN decisions: {len(index)} frames in {path} ({index.kind}, {self.knn.mode})")
+    
+    def set_command_head(self, path: str):
+        """Predict commands with a trained head (see command_head.py) instead of prompt scoring"""
+        from command_head import load_head
+        self.command_head = load_head(path)
+        kind = f"{self.command_head.hidden}-unit MLP" if self.command_head.hidden else "linear"
+        print(f"Command head: {kind} from {path}; prompt scoring disabled")
+    
+    @property
+    def rule_names(self):
+        """Names decide() can report, in rule order"""
+        return tuple(self.decision_engine.rule_names) + ("head", "knn") + tuple(CASCADE_RULES.values())
+    
+    @property
+    def score_names(self) -> List[str]:
+        """Names of the scene scores analyze_scenes currently produces"""
+        if self.scene_backend is not None:
+            return self.scene_backend.names
+        if self.prompts is None:
+            return self._schema.names
+        return self.prompts.names
+    
+    def _scene_schema(self, names: List[str]) -> SceneSchema:
+        """Schema for a snapshot's prompt names, rebuilt only when the prompt set changes"""
+        if self._schema is None or self._schema_names is not names:
+            self._schema = SceneSchema(names, self.REQUIRED_SCENE_ELEMENTS)
+            self._schema_names = names
+        return self._schema
+    
+    def watch_prompt_config(self, path: str, interval: float = 2.0):
+        """Apply changes to a prompt configuration file while running"""
+        if self.prompts is None:
+            print("Ignoring prompt configuration: scenes are not scored against prompts "
+                  "(scene student or command head)")
+            return
+        # Skip re-applying the file if the constructor already loaded this version of it
+        mtime = self._prompt_config_mtime if path == self.prompt_config else None
+        self.prompt_watcher = PromptConfigWatcher(self.prompts, path, interval, mtime)
+        self.prompt_watcher.poll()
+        self.prompt_watcher.start()
+    
+    def encode_text(self, prompts: List[str]):
+        """
+        Encode text prompts into CLIP text embeddings
+        
+        Uses the resident text tower if there is one; in vision-only mode the
+        text tower and tokenizer are loaded temporarily and freed again.
+        Args:
+            prompts: List of text prompts
+        Returns:
+            Tensor of shape (len(prompts), projection_dim)
+        """
+        import torch
+        
+        with torch.no_grad():
+            if self.text_resident:
+                text_inputs = self.processor(text=prompts, return_tensors="pt", padding=True).to(self.device)
+                return self.model.get_text_features(**text_inputs)
+            
+            print(f"Temporarily loading text encoder to encode {len(prompts)} prompts...")
+            text_model, tokenizer = self._load_text_side()
+            text_inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(self.device)
+            features = text_model(**text_inputs).text_embeds
+            del text_model, tokenizer
+            self._release_memory()
+            return features
+    
+    def _load_text_side(self):
+        """Load only the CLIP text tower with projection, plus the tokenizer"""
+        from transformers import CLIPConfig, CLIPTextModelWithProjection, CLIPTokenizer
+        
+        config = CLIPConfig.from_pretrained(self.model_name)
+        text_config = config.text_config
+        text_config.projection_dim = config.projection_dim
+        text_model = CLIPTextModelWithProjection.from_pretrained(self.model_name, config=text_config)
+        return text_model.to(self.device).eval(), CLIPTokenizer.from_pretrained(self.model_name)
+    
+    def drop_text_tower(self):
+        """Free the text transformer, text projection and tokenizer"""
+        if not self.text_resident:
+            return
+        freed = sum(p.numel() * p.element_size() for p in self.model.text_model.parameters())
+        freed += sum(p.numel() * p.element_size() for p in self.model.text_projection.parameters())
+        self.model.text_model = None
+        self.model.text_projection = None
+        # Keep only the image half of the processor
+        self.processor = self.processor.image_processor
+        self.text_resident = False
+        self._release_memory()
+        print(f"Vision-only mode: freed {freed / 2**20:.1f} MB of text encoder weights")
+    
+    def _release_memory(self):
+        import torch
+        
+        gc.collect()
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+    
+    def _encode_images(self, images: List[np.ndarray]):
+        """Return projected CLIP image embeddings for a batch of frames"""
+        if self.artifact is not None:
+            return self.artifact.encode_images(images, self.device)
+        inputs = self.processor(images=list(images), return_tensors="pt").to(self.device)
+        return self.model.get_image_features(**inputs)
+    
+    def print_startup_report(self):
+        """Print when each startup phase ran and how long it took"""
+        print("Startup timings:")
+        for phase, (start, end) in sorted(self.startup_timings.items(), key=lambda item: item[1]):
+            print(f"  {phase:16s} {start:7.2f}s -> {end:7.2f}s  ({end - start:.2f}s)")
+    
     def initialize_camera(self):
         """Initialize the camera for visual input"""
         print("Initializing camera...")
@@ -63,93 +382,114 @@ class VisionControlSystem:
             
         return frame
         
-    def analyze_scene(self, image: np.ndarray) -> Dict[str, float]:
+    def analyze_scene(self, image: np.ndarray) -> SceneScores:
         """
         Analyze the visual scene using CLIP model
         Args:
             image: Input image array
         Returns:
-            Dictionary of scene elements and their confidence scores
+            Scene element confidence scores
         """
+        return self.analyze_scenes([image])[0]
+
+    def analyze_scenes(self, images: List[np.ndarray]) -> List[SceneScores]:
+        """
+        Analyze a batch of visual scenes in a single CLIP forward pass
+        Args:
+            images: List of input image arrays
+        Returns:
+            List of scene element confidence scores, backed by one array
+        """
+        if self.scene_backend is not None:
+            schema = self._scene_schema(self.scene_backend.names)
+            try:
+                return schema.batch(self.scene_backend.score(images))
+            except Exception as e:
+                log.error("Error in scene analysis: %s", e, extra={"event": "analyze_error"})
+                return schema.zeros(len(images))
+        
+        import torch
+        
+        snapshot = self.prompts.snapshot() if self.prompts is not None else None
+        schema = self._scene_schema(snapshot[0]) if snapshot is not None else self._schema
         try:
-            # Preprocess image
-            inputs = self.processor(images=image, return_tensors="pt").to(self.device)
-            
-            # Define scene elements to detect
-            scene_elements = [
-                "road", "pedestrian", "car", "traffic light", "stop sign",
-                "obstacle", "clear path", "narrow space", "intersection",
-                "left turn", "right turn", "straight path"
-            ]
-            
-            # Get text inputs
-            text_inputs = self.processor(text=scene_elements, return_tensors="pt", padding=True).to(self.device)
-            
-            # Get image and text features
-            image_features = self.model.get_image_features(**inputs)
-            text_features = self.model.get_text_features(**text_inputs)
-            
-            # Calculate similarity scores
-            similarity = torch.nn.functional.cosine_similarity(
-                image_features.unsqueeze(1),
-                text_features.unsqueeze(0),
-                dim=2
-            )
-            
-            # Convert to confidence scores
-            confidence_scores = torch.softmax(similarity, dim=1)
+            with torch.no_grad():
+                # Get image features; text features are precomputed
+                image_features = self._encode_images(images)
+                # Kept for kNN lookups and embedding logging
+                self.last_image_features = image_features.float().cpu().numpy()
+                if self.command_head is not None:
+                    # Commands come from the head; scene scores are left at zero
+                    return schema.zeros(len(images))
+                
+                # Grouped softmax over logit-scaled similarities, scaled by the per-prompt weights
+                confidence_scores = self.scorer.score(image_features, snapshot).cpu().numpy()
             
-            # Create result dictionary
-            results = {element: score.item() for element, score in zip(scene_elements, confidence_scores[0])}
-            return results
+            # One host copy for the whole batch; each result is a row view
+            return schema.batch(confidence_scores)
             
         except Exception as e:
-            print(f"Error in scene analysis: {str(e)}")
-            return {element: 0.0 for element in scene_elements}
+            log.error("Error in scene analysis: %s", e, extra={"event": "analyze_error"})
+            self.last_image_features = None
+            return schema.zeros(len(images))
     
-    def determine_command(self, scene_analysis: Dict[str, float]) -> str:
+    def determine_command(self, scene_analysis: SceneScores) -> str:
         """
         Determine the appropriate command based on scene analysis
         Args:
-            scene_analysis: Dictionary of scene elements and their confidence scores
+            scene_analysis: Scene element confidence scores
         Returns:
             Command to execute
         """
+        return self.decide(scene_analysis)[0]
+    
+    def decide(self, scene_analysis: SceneScores, embedding: np.ndarray = None):
+        """
+        Determine the command for one frame and the rule that chose it
+        Args:
+            scene_analysis: Scene element confidence scores
+            embedding: Image embedding of the frame, for kNN refinement
+        Returns:
+            Tuple of (command, rule name); ("stop", "error") if the rules can't be evaluated
+        """
         try:
-            # Safety check (highest priority)
-            if scene_analysis["pedestrian"] > 0.3 or scene_analysis["car"] > 0.3 or scene_analysis["obstacle"] > 0.3:
-                return "stop"
-                
-            # Traffic signal check
-            if scene_analysis["traffic light"] > 0.5:
-                return "stop"
-            if scene_analysis["stop sign"] > 0.5:
-                return "stop"
-                
-            # Path analysis with confidence thresholds
-            path_confidence = scene_analysis["clear path"]
-            narrow_confidence = scene_analysis["narrow space"]
-            
-            if narrow_confidence > 0.5:
-                return "slow_down"
-            elif path_confidence > 0.7:
-                # Check for turn indicators
-                left_confidence = scene_analysis["left turn"]
-                right_confidence = scene_analysis["right turn"]
-                
-                if left_confidence > 0.6:
-                    return "turn_left"
-                elif right_confidence > 0.6:
-                    return "turn_right"
-                else:
-                    return "move_forward"
-                    
-            # Default to maintain current if no clear indicators
-            return "maintain_current"
+            commands, rules = self.determine_commands(
+                [scene_analysis], None if embedding is None else np.atleast_2d(embedding))
+            return commands[0], rules[0]
             
         except Exception as e:
-            print(f"Error in command determination: {str(e)}")
-            return "stop"
+            log.error("Error in command determination: %s", e, extra={"event": "decide_error"})
+            return "stop", "error"
+    
+    def determine_commands(self, scene_analyses: List[SceneScores], embeddings: np.ndarray = None):
+        """
+        Run the decision rules over a batch of scene analyses in one vectorized pass
+        Args:
+            scene_analyses: Scene scores sharing one schema
+            embeddings: Image embeddings (N, dim); used by the command head and the kNN index when set
+        Returns:
+            Tuple of (commands, names of the rules that fired)
+        """
+        first = scene_analyses[0]
+        if isinstance(first, SceneScores):
+            schema = first.schema
+            scores = np.stack([analysis.values for analysis in scene_analyses])
+        else:
+            # Plain {element: score} dictionaries
+            schema = SceneSchema(list(first), self.REQUIRED_SCENE_ELEMENTS)
+            scores = np.asarray([[analysis[name] for name in schema.names] for analysis in scene_analyses],
+                                dtype=np.float32)
+        if self.command_head is not None and embeddings is not None:
+            command_ids = self.command_head.predict(embeddings).argmax(axis=1)
+            rules = ["head"] * len(command_ids)
+        else:
+            compiled = self.decision_engine.compile(schema)
+            command_ids, rule_ids = compiled.evaluate(scores)
+            rules = [compiled.rule_names[i] for i in rule_ids.tolist()]
+        if self.knn is not None and embeddings is not None:
+            command_ids, changed = self.knn.decide(embeddings, command_ids)
+            rules = ["knn" if knn else rule for rule, knn in zip(rules, changed.tolist())]
+        return [COMMANDS[i] for i in command_ids.tolist()], rules
         
     def generate_motor_commands(self, command: str) -> Dict[str, float]:
         """
@@ -195,28 +535,75 @@ class VisionControlSystem:
             return commands
             
         except Exception as e:
-            print(f"Error in motor command generation: {str(e)}")
+            log.error("Error in motor command generation: %s", e, extra={"event": "motor_error"})
             return {"speed": 0.0, "steering": 0.0, "brake": 1.0}
         
-    def run_control_loop(self):
-        """Main control loop for the robotic system"""
+    def run_control_loop(self, profiler=None, telemetry=None, black_box=None):
+        """
+        Main control loop for the robotic system
+        Args:
+            profiler: Optional ControlLoopProfiler receiving per-iteration hooks
+            telemetry: Optional TelemetryRecorder receiving one row per frame
+            black_box: Optional BlackBoxRecorder keeping recent frames, snapshotted on
+                emergency stops and loop errors
+        
+        With self.cascade set, trivial frames are decided by the cascade and skip
+        CLIP; their telemetry rows have zero scores and a cascade_* rule.
+        """
         print("Starting control loop...")
         self.is_running = True
-        self.initialize_camera()
+        if self.camera is None:
+            self.initialize_camera()
+        if profiler is not None:
+            profiler.begin()
+        iteration = 0
+        last_command = None
         
         try:
             while self.is_running:
+                if profiler is not None:
+                    profiler.begin_iteration(iteration)
                 try:
                     # 1. Capture and analyze visual scene
+                    t0 = time.perf_counter()
                     frame = self.get_camera_frame()
-                    scene_analysis = self.analyze_scene(frame)
-                    
-                    # 2. Determine command based on scene analysis
-                    command = self.determine_command(scene_analysis)
+                    t1 = time.perf_counter()
+                    early = self.cascade.check(frame) if self.cascade is not None else None
+                    if early is None:
+                        with profile_inference(profiler):
+                            scene_analysis = self.analyze_scene(frame)
+                        t2 = time.perf_counter()
+                        
+                        # 2. Determine command based on scene analysis
+                        command, rule = self.decide(scene_analysis, self.last_image_features)
+                        if self.cascade is not None:
+                            self.cascade.observe(command)
+                    else:
+                        # Trivial frame: the cascade's decision stands, CLIP is skipped
+                        t2 = time.perf_counter()
+                        scene_analysis = self._schema.zeros(1)[0]
+                        command, rule = early
+                        log.debug("Cascade exit: %s", command,
+                                  extra={"event": "cascade_exit", "rule": rule,
+                                         **{key: value for key, value in self.cascade.last_features.items()
+                                            if key != "patch"}})
+                    t3 = time.perf_counter()
                     
                     # 3. Generate and execute motor commands
                     commands = self.generate_motor_commands(command)
                     self.execute_commands(commands)
+                    t4 = time.perf_counter()
+                    
+                    if telemetry is not None:
+                        telemetry.record(iteration, scene_analysis.values, command, rule, commands,
+                                         ((t1 - t0) * 1e3, (t2 - t1) * 1e3, (t3 - t2) * 1e3,
+                                          (t4 - t3) * 1e3, (t4 - t0) * 1e3),
+                                         scene_analysis.schema.names)
+                    if black_box is not None:
+                        black_box.record(frame, iteration, command, commands)
+                        if command == "stop" and last_command != "stop":
+                            black_box.trigger("stop")
+                    last_command = command
                     
                     # 4. Display feedback
                     self.display_feedback(frame, commands, command, scene_analysis)
@@ -225,14 +612,32 @@ class VisionControlSystem:
                     time.sleep(0.1)
                     
                 except Exception as e:
-                    print(f"Error in control loop iteration: {str(e)}")
+                    log.error("Error in control loop iteration: %s", e, extra={"event": "loop_error"})
+                    if black_box is not None:
+                        black_box.trigger("exception")
                     time.sleep(1)  # Wait a bit before retrying
+                
+                if profiler is not None:
+                    profiler.end_iteration(iteration)
+                iteration += 1
                     
         except KeyboardInterrupt:
             print("\nControl loop interrupted by user")
         except Exception as e:
             print(f"Fatal error in control loop: {str(e)}")
+            if black_box is not None:
+                snapshot = black_box.trigger("fatal")
+                if snapshot is not None:
+                    snapshot.join(timeout=5.0)
         finally:
+            if self.cascade is not None:
+                print(f"Cascade: {self.cascade.summary()}")
+            if profiler is not None:
+                profiler.stop()
+            if telemetry is not None:
+                telemetry.close()
+            if black_box is not None:
+                black_box.close()
             self.cleanup()
             
     def execute_commands(self, commands: Dict[str, float]):
@@ -250,14 +655,15 @@ class VisionControlSystem:
             # if self.arduino.is_open:
             #     self.arduino.write(command_str.encode())
             
-            print(f"Executing commands: {commands}")
-            print(f"Command string: {command_str.strip()}")
+            log.info("Executing commands: speed=%.2f steering=%.2f brake=%.2f",
+                     commands["speed"], commands["steering"], commands["brake"],
+                     extra={"event": "execute", "command_string": command_str.strip()})
             
         except Exception as e:
-            print(f"Error executing commands: {str(e)}")
+            log.error("Error executing commands: %s", e, extra={"event": "execute_error"})
         
     def display_feedback(self, frame: np.ndarray, commands: Dict[str, float], 
-                        command: str, scene_analysis: Dict[str, float]):
+                        command: str, scene_analysis: SceneScores):
         """
         Display system feedback on the frame
         Args:
@@ -280,11 +686,15 @@ class VisionControlSystem:
             cv2.waitKey(1)
             
         except Exception as e:
-            print(f"Error displaying feedback: {str(e)}")
+            log.error("Error displaying feedback: %s", e, extra={"event": "display_error"})
         
     def cleanup(self):
         """Clean up resources"""
         print("Cleaning up resources...")
+        if self.prompt_watcher is not None:
+            self.prompt_watcher.stop()
+        if self.prompts is not None:
+            self.prompts.cache.save()
         if self.camera is not None:
             self.camera.release()
             print("Camera released")
@@ -3,56 +3,62 @@ from transformers import CLIPProcessor, CLIPModel
 import cv2
 import numpy as np
 from typing import List, Tuple, Dict
+from prompt_set import DEFAULT_SCENE_ELEMENTS, PromptSet
+from scene_scores import SceneSchema, SceneScores
+from scoring import PromptScorer
 
 class VisionLanguageProcessor:
-    def __init__(self):
+    # Scene elements interpret_environment looks up
+    REQUIRED_SCENE_ELEMENTS = ("pedestrian", "car", "traffic light", "stop sign", "clear path", "narrow space")
+    
+    def __init__(self, model_name: str = "openai/clip-vit-base-patch32", prompts: List[str] = None):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(self.device)
-        self.processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+        self.model = CLIPModel.from_pretrained(model_name).to(self.device)
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+        
+        # Same default prompt vocabulary as VisionControlSystem
+        self.prompts = PromptSet(self.encode_text, model_name, self.device, required=self.REQUIRED_SCENE_ELEMENTS)
+        self.prompts.add(prompts or DEFAULT_SCENE_ELEMENTS)
+        self.schema = SceneSchema(self.prompts.names, self.REQUIRED_SCENE_ELEMENTS)
+        self.scorer = PromptScorer(self.model.logit_scale.detach().exp().item())
+    
+    def encode_text(self, prompts: List[str]) -> torch.Tensor:
+        """Encode text prompts into CLIP text embeddings"""
+        with torch.no_grad():
+            text_inputs = self.processor(text=prompts, return_tensors="pt", padding=True).to(self.device)
+            return self.model.get_text_features(**text_inputs)
         
-    def analyze_scene(self, image: np.ndarray) -> Dict[str, float]:
+    def analyze_scene(self, image: np.ndarray) -> SceneScores:
         """
         Analyze the visual scene using CLIP model
         Args:
             image: Input image array
         Returns:
-            Dictionary of scene elements and their confidence scores
+            Scene element confidence scores
         """
         # Preprocess image
         inputs = self.processor(images=image, return_tensors="pt").to(self.device)
         
-        # Define potential scene elements to detect
-        scene_elements = [
-            "road", "pedestrian", "car", "traffic light", "stop sign",
-            "obstacle", "clear path", "narrow space", "intersection"
-        ]
-        
-        # Get text inputs
-        text_inputs = self.processor(text=scene_elements, return_tensors="pt", padding=True).to(self.device)
+        # Scene elements to detect and their precomputed text features
+        snapshot = self.prompts.snapshot()
+        if self.schema.names != tuple(snapshot[0]):
+            self.schema = SceneSchema(snapshot[0], self.REQUIRED_SCENE_ELEMENTS)
         
-        # Get image and text features
-        image_features = self.model.get_image_features(**inputs)
-        text_features = self.model.get_text_features(**text_inputs)
-        
-        # Calculate similarity scores
-        similarity = torch.nn.functional.cosine_similarity(
-            image_features.unsqueeze(1),
-            text_features.unsqueeze(0),
-            dim=2
-        )
-        
-        # Convert to confidence scores
-        confidence_scores = torch.softmax(similarity, dim=1)
+        # Get image features
+        with torch.no_grad():
+            image_features = self.model.get_image_features(**inputs)
+            
+            # Grouped softmax over logit-scaled similarities, scaled by the per-prompt weights
+            confidence_scores = self.scorer.score(image_features, snapshot)
         
-        # Create result dictionary
-        results = {element: score.item() for element, score in zip(scene_elements, confidence_scores[0])}
-        return results
+        # Single device-to-host copy
+        return self.schema.scores(confidence_scores[0].cpu().numpy())
     
-    def interpret_environment(self, scene_analysis: Dict[str, float]) -> Dict[str, str]:
+    def interpret_environment(self, scene_analysis: SceneScores) -> Dict[str, str]:
         """
         Interpret the environment based on scene analysis
         Args:
-            scene_analysis: Dictionary of scene elements and their confidence scores
+            scene_analysis: Scene element confidence scores
         Returns:
             Dictionary of environment interpretations and recommendations
         """
@@ -61,15 +67,15 @@ class VisionLanguageProcessor:
         # Safety assessment
         if scene_analysis["pedestrian"] > 0.3 or scene_analysis["car"] > 0.3:
             interpretations["safety_status"] = "high_risk"
-        elif scene_analysis["clear_path"] > 0.7:
+        elif scene_analysis["clear path"] > 0.7:
             interpretations["safety_status"] = "safe"
         else:
             interpretations["safety_status"] = "moderate_risk"
             
         # Path assessment
-        if scene_analysis["narrow_space"] > 0.5:
+        if scene_analysis["narrow space"] > 0.5:
             interpretations["path_status"] = "narrow"
-        elif scene_analysis["clear_path"] > 0.7:
+        elif scene_analysis["clear path"] > 0.7:
             interpretations["path_status"] = "clear"
         else:
             interpretations["path_status"] = "moderate"
@@ -1,141 +1,203 @@
+import argparse
 import cv2
 import numpy as np
 import socket
 import json
 import RPi.GPIO as GPIO
 import time
-from threading import Thread
+from threading import Thread, Lock
 from utils import setup_gpio
+from motor_driver import MotorDriver
+from safety_reflex import SafetyReflex
+from mjpeg_capture import MJPEGCapture
+from local_pilot import LocalPilot, make_pilot
 
 class CarController:
-    def __init__(self, host='0.0.0.0', port=5000):
+    # Continuous (speed, steering, brake) targets for the discrete commands
+    DISCRETE_COMMANDS = {
+        'forward': (1.0, 0.0, 0.0),
+        'backward': (-1.0, 0.0, 0.0),
+        'left': (0.0, -1.0, 0.0),
+        'right': (0.0, 1.0, 0.0),
+        'stop': (0.0, 0.0, 1.0),
+    }
+    # Socket reads and writes give up after this many heartbeat timeouts; a
+    # half-open link (laptop lost power, Wi-Fi dropped without FIN/RST) then
+    # counts as dropped instead of blocking the main loop forever
+    LINK_TIMEOUT_FACTOR = 2
+
+    def __init__(self, host='0.0.0.0', port=5000, fallback=None, fallback_rate=4.0):
+        """
+        Args:
+            host, port: Address the laptop connects to
+            fallback: Local pilot used while the laptop link is down: 'heuristic',
+                the path of an .onnx scene student, or None to just stop
+            fallback_rate: Local decisions per second
+        """
+        # Motor control pins (adjust these based on your wiring)
+        self.left_motor_forward = 17
+        self.left_motor_backward = 27
+        self.right_motor_forward = 22
+        self.right_motor_backward = 23
+
         # Initialize GPIO pins for motor control
         self.setup_gpio()
         
-        # Initialize camera
-        self.camera = cv2.VideoCapture(0)
-        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        # Watchdog owning the motor update loop, independent of the network
+        self.reflex = SafetyReflex(self.motors)
+        
+        # Initialize camera; MJPEG is forwarded without decode/re-encode when supported
+        self.camera = MJPEGCapture(0, width=640, height=480)
+        # The main loop and the local pilot both read frames
+        self.camera_lock = Lock()
+        
+        # On-device driving when the laptop's heartbeat lapses
+        self.local_pilot = None
+        if fallback:
+            self.local_pilot = LocalPilot(self.reflex, self.read_jpeg, make_pilot(fallback), rate_hz=fallback_rate)
         
         # Initialize socket server
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.bind((host, port))
         self.server_socket.listen(1)
         
-        # Motor control pins (adjust these based on your wiring)
-        self.left_motor_forward = 17
-        self.left_motor_backward = 27
-        self.right_motor_forward = 22
-        self.right_motor_backward = 23
-        
         # Initialize connection
         self.client_socket = None
         self.connected = False
 
     def setup_gpio(self):
-        """Setup GPIO pins for motor control"""
+        """Setup GPIO pins and the PWM motor driver"""
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
         
-        # Setup motor control pins as output
-        pins = [17, 27, 22, 23]  # Adjust these based on your wiring
-        for pin in pins:
-            GPIO.setup(pin, GPIO.OUT)
+        self.motors = MotorDriver(
+            self.left_motor_forward, self.left_motor_backward,
+            self.right_motor_forward, self.right_motor_backward
+        )
+    
+    def read_jpeg(self):
+        """Read one camera frame as JPEG bytes"""
+        with self.camera_lock:
+            return self.camera.read_jpeg()
     
     def connect(self):
         """Wait for connection from laptop"""
         print("Waiting for connection...")
         self.client_socket, addr = self.server_socket.accept()
+        # By the time this fires the heartbeat has lapsed and the reflex or local pilot has the car
+        self.client_socket.settimeout(self.reflex.heartbeat_timeout * self.LINK_TIMEOUT_FACTOR)
         self.connected = True
         print(f"Connected to {addr}")
     
     def send_image(self, image):
-        """Send image to laptop"""
+        """Send image to laptop (JPEG bytes are sent as-is, arrays are encoded first)"""
         if self.connected:
-            # Encode image as JPEG
-            _, img_encoded = cv2.imencode('.jpg', image)
+            if isinstance(image, np.ndarray):
+                # Encode image as JPEG
+                _, img_encoded = cv2.imencode('.jpg', image)
+                image = img_encoded.tobytes()
             # Send image size first
-            self.client_socket.send(len(img_encoded).to_bytes(4, 'big'))
+            self.client_socket.sendall(len(image).to_bytes(4, 'big'))
             # Send image data
-            self.client_socket.send(img_encoded.tobytes())
+            self.client_socket.sendall(image)
     
     def receive_command(self):
-        """Receive command from laptop"""
+        """
+        Receive command from laptop
+
+        Messages are JSON objects carrying either a discrete command
+        ({"command": "forward"}), continuous values
+        ({"speed": 0.5, "steering": -0.2, "brake": 0.0}) or a bare
+        {"heartbeat": true} keep-alive. Any message refreshes the heartbeat.
+        Raises ConnectionError when the laptop has closed the connection and
+        socket.timeout when it has been silent past the link timeout.
+        """
         if self.connected:
+            data = self.client_socket.recv(1024)
+            if not data:
+                raise ConnectionResetError("laptop closed the connection")
             try:
-                data = self.client_socket.recv(1024).decode()
+                data = data.decode()
                 if data:
-                    return json.loads(data)['command']
+                    self.reflex.heartbeat()
+                    message = json.loads(data)
+                    if message.get('heartbeat'):
+                        return None
+                    if 'speed' in message:
+                        return {
+                            'speed': float(message['speed']),
+                            'steering': float(message.get('steering', 0.0)),
+                            'brake': float(message.get('brake', 0.0)),
+                        }
+                    return message['command']
             except:
                 return None
         return None
     
     def execute_command(self, command):
-        """Execute driving command"""
-        if command == 'forward':
-            self.move_forward()
-        elif command == 'backward':
-            self.move_backward()
-        elif command == 'left':
-            self.turn_left()
-        elif command == 'right':
-            self.turn_right()
-        elif command == 'stop':
-            self.stop()
+        """Execute a discrete driving command or a continuous command dict"""
+        if isinstance(command, dict):
+            self.reflex.submit(command['speed'], command['steering'], command['brake'])
+        elif command in self.DISCRETE_COMMANDS:
+            self.reflex.submit(*self.DISCRETE_COMMANDS[command])
     
     def move_forward(self):
         """Move car forward"""
-        GPIO.output(self.left_motor_forward, GPIO.HIGH)
-        GPIO.output(self.left_motor_backward, GPIO.LOW)
-        GPIO.output(self.right_motor_forward, GPIO.HIGH)
-        GPIO.output(self.right_motor_backward, GPIO.LOW)
+        self.execute_command('forward')
     
     def move_backward(self):
         """Move car backward"""
-        GPIO.output(self.left_motor_forward, GPIO.LOW)
-        GPIO.output(self.left_motor_backward, GPIO.HIGH)
-        GPIO.output(self.right_motor_forward, GPIO.LOW)
-        GPIO.output(self.right_motor_backward, GPIO.HIGH)
+        self.execute_command('backward')
     
     def turn_left(self):
         """Turn car left"""
-        GPIO.output(self.left_motor_forward, GPIO.LOW)
-        GPIO.output(self.left_motor_backward, GPIO.HIGH)
-        GPIO.output(self.right_motor_forward, GPIO.HIGH)
-        GPIO.output(self.right_motor_backward, GPIO.LOW)
+        self.execute_command('left')
     
     def turn_right(self):
         """Turn car right"""
-        GPIO.output(self.left_motor_forward, GPIO.HIGH)
-        GPIO.output(self.left_motor_backward, GPIO.LOW)
-        GPIO.output(self.right_motor_forward, GPIO.LOW)
-        GPIO.output(self.right_motor_backward, GPIO.HIGH)
+        self.execute_command('right')
     
     def stop(self):
         """Stop car"""
-        GPIO.output(self.left_motor_forward, GPIO.LOW)
-        GPIO.output(self.left_motor_backward, GPIO.LOW)
-        GPIO.output(self.right_motor_forward, GPIO.LOW)
-        GPIO.output(self.right_motor_backward, GPIO.LOW)
+        self.motors.stop()
+    
+    def disconnect(self):
+        """Drop the laptop connection; the heartbeat lapses and the safety reflex (or local pilot) takes over"""
+        self.connected = False
+        if self.client_socket:
+            try:
+                self.client_socket.close()
+            except OSError:
+                pass
+            self.client_socket = None
     
     def run(self):
-        """Main loop for car control"""
+        """Main loop for car control; accepts a new laptop connection whenever the link drops"""
         try:
-            self.connect()
+            self.reflex.start()
+            if self.local_pilot is not None:
+                self.local_pilot.start()
             
             while True:
-                # Capture frame from camera
-                ret, frame = self.camera.read()
-                if ret:
-                    # Send frame to laptop
-                    self.send_image(frame)
-                    
-                    # Receive and execute command
-                    command = self.receive_command()
-                    if command:
-                        self.execute_command(command)
-                
-                time.sleep(0.1)  # Small delay to prevent overwhelming the system
+                self.connect()
+                try:
+                    while True:
+                        # Capture frame from camera as JPEG bytes
+                        ret, frame = self.read_jpeg()
+                        if ret:
+                            # Send frame to laptop
+                            self.send_image(frame)
+                            
+                            # Receive and execute command
+                            command = self.receive_command()
+                            if command:
+                                self.execute_command(command)
+                        
+                        time.sleep(0.1)  # Small delay to prevent overwhelming the system
+                except OSError as e:
+                    # Laptop process died, the network reset the connection or the link went silent
+                    print(f"Laptop link lost: {str(e)}")
+                    self.disconnect()
                 
         except KeyboardInterrupt:
             print("Stopping car controller...")
@@ -144,7 +206,12 @@ class CarController:
     
     def cleanup(self):
         """Cleanup resources"""
-        self.stop()
+        if self.local_pilot is not None:
+            self.local_pilot.stop()
+            print(f"Local pilot stats: {self.local_pilot.stats()}")
+        self.reflex.stop()
+        print(f"Safety reflex stats: {self.reflex.stats()}")
+        self.motors.cleanup()
         GPIO.cleanup()
         self.camera.release()
         if self.client_socket:
@@ -152,5 +219,11 @@ class CarController:
         self.server_socket.close()
 
 if __name__ == "__main__":
-    controller = CarController()
+    parser = argparse.ArgumentParser(description='Raspberry Pi car controller')
+    parser.add_argument('--port', type=int, default=5000, help='Port the laptop connects to')
+    parser.add_argument('--fallback', help="Drive locally when the laptop link drops: 'heuristic' or an .onnx student")
+    parser.add_argument('--fallback-rate', type=float, default=4.0, help='Local decisions per second')
+    args = parser.parse_args()
+    
+    controller = CarController(port=args.port, fallback=args.fallback, fallback_rate=args.fallback_rate)
     controller.run()
@@ -0,0 +1,189 @@
+import json
+import time
+from collections import Counter
+from threading import Thread, Event
+
+import cv2
+import numpy as np
+
+# The laptop's command vocabulary and the motor targets it maps them to
+COMMAND_TARGETS = {
+    'move_forward': (0.5, 0.0, 0.0),
+    'stop': (0.0, 0.0, 1.0),
+    'turn_left': (0.3, -0.5, 0.0),
+    'turn_right': (0.3, 0.5, 0.0),
+    'slow_down': (0.2, 0.0, 0.0),
+    'maintain_current': (0.3, 0.0, 0.0),
+}
+
+
+class HeuristicPilot:
+    """
+    Classical-CV driving decisions from edge density on a small frame.
+
+    The lower half of the frame is treated as the floor in front of the car
+    and split into left, centre and right thirds. Few edges means open floor,
+    many edges means clutter; a busy band right in front of the car is
+    treated as an obstacle.
+    """
+
+    def __init__(self, width=80, height=60, clear_density=0.04, busy_density=0.10, near_density=0.15):
+        """
+        Args:
+            width, height: Size the frame is reduced to
+            clear_density: Edge density below which a region counts as open floor
+            busy_density: Centre density above which the car stops instead of slowing
+            near_density: Density of the near-field centre band that means an obstacle
+        """
+        self.size = (width, height)
+        self.clear_density = clear_density
+        self.busy_density = busy_density
+        self.near_density = near_density
+
+    def decide(self, frame):
+        """
+        Args:
+            frame: BGR image
+        Returns:
+            Command name from COMMAND_TARGETS
+        """
+        gray = cv2.cvtColor(cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(cv2.GaussianBlur(gray, (3, 3), 0), 50, 150) > 0
+        height, width = edges.shape
+        floor = edges[height // 2:]
+        left, centre, right = (band.mean() for band in np.array_split(floor, 3, axis=1))
+        near = edges[height * 3 // 4:, width // 3:2 * width // 3].mean()
+
+        if near > self.near_density:
+            return 'stop'
+        if centre < self.clear_density:
+            return 'move_forward'
+        if min(left, right) < self.clear_density:
+            return 'turn_left' if left < right else 'turn_right'
+        if centre < self.busy_density:
+            return 'slow_down'
+        return 'stop'
+
+
+class StudentPilot:
+    """
+    Runs an ONNX scene student (laptop/scene_student.py) with ONNX Runtime
+    and applies the decision rules stored in its .json sidecar
+    """
+
+    def __init__(self, path, threads=1):
+        """
+        Args:
+            path: Exported .onnx student with its .json sidecar
+            threads: ONNX Runtime intra-op threads
+        """
+        import onnxruntime
+
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        if 'rules' not in meta:
+            raise ValueError(f"{path}.json has no decision rules; re-export the student")
+        self.size = meta['input_size']
+        self.mean = np.asarray(meta['mean'], dtype=np.float32)
+        self.std = np.asarray(meta['std'], dtype=np.float32)
+        columns = {name: i for i, name in enumerate(meta['names'])}
+        # (command, [(score column, threshold), ...]) in priority order
+        self.rules = [(command, [(columns[element], threshold) for element, threshold in conditions])
+                      for _, command, conditions in meta['rules']]
+        self.default = meta['default']
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def decide(self, frame):
+        image = cv2.resize(frame, (self.size, self.size), interpolation=cv2.INTER_AREA)
+        image = (cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0 - self.mean) / self.std
+        scores = self.session.run(None, {'images': image.transpose(2, 0, 1)[None]})[0][0]
+        for command, conditions in self.rules:
+            if all(scores[column] > threshold for column, threshold in conditions):
+                return command
+        return self.default
+
+
+def make_pilot(spec, threads=1):
+    """
+    Args:
+        spec: 'heuristic', or the path of an exported .onnx scene student
+    Returns:
+        Pilot with a decide(frame) -> command method
+    """
+    if spec == 'heuristic':
+        return HeuristicPilot()
+    return StudentPilot(spec, threads)
+
+
+class LocalPilot(Thread):
+    """
+    Drives the car from the Pi's own camera while the laptop link is down.
+
+    Idle while the laptop's heartbeat is fresh. Once SafetyReflex reports the
+    link lost, it reads a frame, decodes it at reduced size, decides a command
+    with the pilot and submits it at reduced speed via submit_local, a few
+    times per second. The first message from the laptop hands control back.
+    """
+
+    def __init__(self, reflex, read_jpeg, pilot, rate_hz=4.0, speed_scale=0.5):
+        """
+        Args:
+            reflex: SafetyReflex owning the motors
+            read_jpeg: Callable returning (ok, JPEG bytes or BGR frame)
+            pilot: HeuristicPilot or StudentPilot
+            rate_hz: Decisions per second while driving locally
+            speed_scale: Factor applied to the commanded speed in degraded mode
+        """
+        super().__init__(name="LocalPilot", daemon=True)
+        self.reflex = reflex
+        self.read_jpeg = read_jpeg
+        self.pilot = pilot
+        self.period = 1.0 / rate_hz
+        self.speed_scale = speed_scale
+        self._stop_event = Event()
+
+        self.decisions = Counter()
+        self.decide_time = 0.0
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=1.0)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            if self.reflex.link_lost():
+                try:
+                    self.step()
+                except Exception as e:
+                    print(f"Local pilot error: {str(e)}")
+            self._stop_event.wait(max(0.0, self.period - (time.monotonic() - start)))
+
+    def step(self):
+        """Decide and submit one command from the current camera frame"""
+        ret, frame = self.read_jpeg()
+        if not ret:
+            return
+        start = time.perf_counter()
+        if not isinstance(frame, np.ndarray):
+            # Decoding at 1/4 scale skips most of the JPEG decode work
+            frame = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_REDUCED_COLOR_4)
+            if frame is None:
+                return
+        command = self.pilot.decide(frame)
+        self.decide_time += time.perf_counter() - start
+        self.decisions[command] += 1
+        speed, steering, brake = COMMAND_TARGETS[command]
+        self.reflex.submit_local(speed * self.speed_scale, steering, brake)
+
+    def stats(self):
+        """Counts of local decisions and their mean latency in milliseconds"""
+        total = sum(self.decisions.values())
+        return {
+            'decisions': dict(self.decisions),
+            'decide_mean_ms': self.decide_time / total * 1000.0 if total else 0.0,
+        }
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+
+JPEG_SOI = b'\xff\xd8'
+
+
+class MJPEGCapture:
+    """
+    Camera capture that forwards the camera's own MJPEG bytes.
+
+    The camera is asked for MJPEG over V4L2 with RGB conversion disabled, so
+    read_jpeg() returns the compressed frame exactly as the sensor produced
+    it: no decode on read and no re-encode before sending. Cameras or
+    backends that cannot deliver raw MJPEG fall back to decode + imencode.
+    """
+
+    def __init__(self, device=0, width=640, height=480, fps=None, passthrough=True, jpeg_quality=80):
+        """
+        Args:
+            device: Camera index or device path
+            width, height: Requested frame size
+            fps: Requested frame rate, or None for the camera default
+            passthrough: Try raw MJPEG passthrough before falling back to transcoding
+            jpeg_quality: JPEG quality used when transcoding
+        """
+        self.jpeg_quality = jpeg_quality
+        self.passthrough = False
+        self.passthrough_frames = 0
+        self.transcoded_frames = 0
+
+        self.camera = cv2.VideoCapture(device, cv2.CAP_V4L2) if passthrough else cv2.VideoCapture(device)
+        if not self.camera.isOpened():
+            self.camera = cv2.VideoCapture(device)
+
+        self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self.camera.set(cv2.CAP_PROP_FPS, fps)
+
+        if passthrough:
+            self.passthrough = self._enable_passthrough()
+        print(f"Camera capture mode: {'MJPEG passthrough' if self.passthrough else 'transcode'}")
+
+    def _enable_passthrough(self):
+        """Disable RGB conversion and check that frames arrive as raw JPEG"""
+        if not self.camera.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+            return False
+        ret, buffer = self.camera.read()
+        if ret and self._is_jpeg(buffer):
+            return True
+        # Backend ignored the request or the camera is not delivering MJPEG
+        self.camera.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        return False
+
+    @staticmethod
+    def _is_jpeg(buffer):
+        """Check whether a captured buffer is an undecoded JPEG bitstream"""
+        return (buffer is not None and buffer.dtype == np.uint8 and buffer.size > 4
+                and (buffer.ndim == 1 or buffer.shape[0] == 1)
+                and buffer.ravel()[:2].tobytes() == JPEG_SOI)
+
+    def isOpened(self):
+        """Whether the underlying camera is open"""
+        return self.camera.isOpened()
+
+    def read_jpeg(self):
+        """
+        Capture one frame as JPEG bytes
+        Returns:
+            Tuple of (success, jpeg_bytes)
+        """
+        ret, buffer = self.camera.read()
+        if not ret:
+            return False, None
+        if self.passthrough:
+            if self._is_jpeg(buffer):
+                self.passthrough_frames += 1
+                return True, buffer.ravel().tobytes()
+            # Corrupt or truncated MJPEG buffer; drop it rather than send garbage
+            return False, None
+        ok, encoded = cv2.imencode('.jpg', buffer, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            return False, None
+        self.transcoded_frames += 1
+        return True, encoded.tobytes()
+
+    def read(self):
+        """
+        Capture one frame as a decoded BGR image (decodes only in passthrough mode)
+        Returns:
+            Tuple of (success, frame)
+        """
+        ret, buffer = self.camera.read()
+        if not ret:
+            return False, None
+        if self.passthrough:
+            frame = cv2.imdecode(buffer.ravel(), cv2.IMREAD_COLOR)
+            return frame is not None, frame
+        return True, buffer
+
+    def release(self):
+        """Release the camera"""
+        self.camera.release()
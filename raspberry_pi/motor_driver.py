@@ -0,0 +1,153 @@
+import time
+from threading import Lock
+
+import RPi.GPIO as GPIO
+
+
+class MotorDriver:
+    """
+    Continuous differential-drive motor driver using GPIO PWM.
+
+    Each motor is driven through two H-bridge inputs (forward/backward); the
+    active direction pin carries the PWM duty cycle and the other is held at 0.
+    Duty cycles are only written when they actually change, so calling
+    update() at a high rate costs no GPIO syscalls while the car holds state.
+    """
+
+    def __init__(self, left_forward=17, left_backward=27, right_forward=22, right_backward=23,
+                 pwm_frequency=1000, max_accel=4.0, max_decel=8.0, duty_resolution=0.5):
+        """
+        Args:
+            left_forward, left_backward, right_forward, right_backward: BCM pin numbers
+            pwm_frequency: PWM frequency in Hz
+            max_accel: Maximum increase of |wheel output| per second (1.0 = full scale)
+            max_decel: Maximum decrease of |wheel output| per second
+            duty_resolution: Duty cycle steps (in percent) below which writes are skipped
+        """
+        self.pins = (left_forward, left_backward, right_forward, right_backward)
+        self.max_accel = max_accel
+        self.max_decel = max_decel
+        self.duty_resolution = duty_resolution
+
+        self._lock = Lock()
+        self._pwms = {}
+        self._duty = {}
+        for pin in self.pins:
+            GPIO.setup(pin, GPIO.OUT)
+            GPIO.output(pin, GPIO.LOW)
+            pwm = GPIO.PWM(pin, pwm_frequency)
+            pwm.start(0)
+            self._pwms[pin] = pwm
+            self._duty[pin] = 0.0
+
+        # Wheel outputs in [-1, 1]: target is what was commanded, current is
+        # what is applied after ramp limiting
+        self._target = [0.0, 0.0]
+        self._current = [0.0, 0.0]
+        self._last_update = time.monotonic()
+        self.writes = 0
+        self.skipped_writes = 0
+
+    @staticmethod
+    def mix(speed, steering):
+        """
+        Differential-drive mixing of speed/steering into wheel outputs
+        Args:
+            speed: Forward speed in [-1, 1]
+            steering: Steering in [-1, 1], negative turns left
+        Returns:
+            Tuple of (left, right) wheel outputs in [-1, 1]
+        """
+        left = speed + steering
+        right = speed - steering
+        scale = max(1.0, abs(left), abs(right))
+        return left / scale, right / scale
+
+    def drive(self, speed, steering=0.0, brake=0.0):
+        """
+        Set a new continuous target
+        Args:
+            speed: Forward speed in [-1, 1]
+            steering: Steering in [-1, 1], negative turns left
+            brake: Brake in [0, 1]; above 0.5 the motors stop without ramping
+        """
+        speed = min(1.0, max(-1.0, float(speed)))
+        steering = min(1.0, max(-1.0, float(steering)))
+        if brake > 0.5:
+            self.stop()
+            return
+        left, right = self.mix(speed, steering)
+        with self._lock:
+            self._target = [left, right]
+
+    def stop(self):
+        """Stop both motors immediately, bypassing ramp limits"""
+        with self._lock:
+            self._target = [0.0, 0.0]
+            self._current = [0.0, 0.0]
+            self._write_outputs()
+
+    def ramp_to_stop(self):
+        """Set a zero target and let update() ramp the motors down"""
+        with self._lock:
+            self._target = [0.0, 0.0]
+
+    @property
+    def output(self):
+        """Currently applied (left, right) wheel outputs"""
+        with self._lock:
+            return tuple(self._current)
+
+    def update(self, now=None):
+        """
+        Advance the ramp toward the target and write changed duty cycles
+        Args:
+            now: Optional monotonic timestamp, defaults to time.monotonic()
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            dt = max(0.0, now - self._last_update)
+            self._last_update = now
+            for i in range(2):
+                self._current[i] = self._ramp(self._current[i], self._target[i], dt)
+            self._write_outputs()
+
+    def _ramp(self, current, target, dt):
+        """Move current toward target within the accel/decel limits"""
+        if current == target:
+            return current
+        # Crossing zero is treated as a deceleration down to 0 first
+        if current * target < 0 or abs(target) < abs(current):
+            limit = self.max_decel * dt
+            goal = 0.0 if current * target < 0 else target
+        else:
+            limit = self.max_accel * dt
+            goal = target
+        delta = goal - current
+        if abs(delta) <= limit:
+            return goal
+        return current + limit * (1 if delta > 0 else -1)
+
+    def _write_outputs(self):
+        """Write duty cycles for the current outputs, skipping unchanged pins"""
+        left_forward, left_backward, right_forward, right_backward = self.pins
+        self._set_duty(left_forward, max(0.0, self._current[0]) * 100.0)
+        self._set_duty(left_backward, max(0.0, -self._current[0]) * 100.0)
+        self._set_duty(right_forward, max(0.0, self._current[1]) * 100.0)
+        self._set_duty(right_backward, max(0.0, -self._current[1]) * 100.0)
+
+    def _set_duty(self, pin, duty):
+        """Write a duty cycle only if it differs from the last written one"""
+        duty = min(100.0, round(duty / self.duty_resolution) * self.duty_resolution)
+        if duty == self._duty[pin]:
+            self.skipped_writes += 1
+            return
+        self._pwms[pin].ChangeDutyCycle(duty)
+        self._duty[pin] = duty
+        self.writes += 1
+
+    def cleanup(self):
+        """Stop PWM on all pins"""
+        self.stop()
+        for pwm in self._pwms.values():
+            pwm.stop()
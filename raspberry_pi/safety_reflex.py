@@ -0,0 +1,177 @@
+import os
+import time
+from collections import deque
+from threading import Thread, Lock, Event
+
+
+class SafetyReflex(Thread):
+    """
+    Fixed-rate watchdog thread that owns the motor update loop.
+
+    Runs independently of the network so the reaction time to a stalled link
+    is bounded by the tick period and the driver's decel limit, not by how
+    long receive_command happens to block:
+      - no fresh drive command within command_timeout -> ramp motors to zero
+      - no heartbeat (any message from the laptop) within heartbeat_timeout
+        -> stop motors immediately, unless a local pilot is submitting fresh
+        commands with submit_local (degraded on-device driving)
+    """
+
+    def __init__(self, motors, rate_hz=100, command_timeout=0.5, heartbeat_timeout=1.0,
+                 jitter_window=1000, realtime_priority=10):
+        """
+        Args:
+            motors: MotorDriver instance updated by this thread
+            rate_hz: Loop rate in Hz
+            command_timeout: Seconds a drive command stays valid
+            heartbeat_timeout: Seconds without any laptop message before a hard stop
+            jitter_window: Number of recent ticks kept for jitter statistics
+            realtime_priority: SCHED_FIFO priority to request (0 disables)
+        """
+        super().__init__(name="SafetyReflex", daemon=True)
+        self.motors = motors
+        self.period = 1.0 / rate_hz
+        self.command_timeout = command_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.realtime_priority = realtime_priority
+
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._last_command = float('-inf')
+        self._last_heartbeat = float('-inf')
+        self._local = False
+        self.state = 'idle'
+
+        self._jitter = deque(maxlen=jitter_window)
+        self.ticks = 0
+        self.overruns = 0
+        self.trips = {'command_timeout': 0, 'heartbeat_timeout': 0, 'local_takeover': 0}
+
+    def heartbeat(self):
+        """Record that the laptop link is alive; local commands lose their standing"""
+        with self._lock:
+            self._last_heartbeat = time.monotonic()
+            self._local = False
+
+    def submit(self, speed, steering=0.0, brake=0.0):
+        """
+        Apply a fresh drive command and refresh both deadlines
+        Args:
+            speed: Forward speed in [-1, 1]
+            steering: Steering in [-1, 1], negative turns left
+            brake: Brake in [0, 1]
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._last_command = now
+            self._last_heartbeat = now
+            self._local = False
+            self.motors.drive(speed, steering, brake)
+            self.state = 'active'
+
+    def submit_local(self, speed, steering=0.0, brake=0.0):
+        """
+        Apply a command decided on the Pi while the laptop link is down.
+        Refreshes the command deadline only; the heartbeat stays lapsed, so
+        the first laptop message hands control back.
+        """
+        with self._lock:
+            self._last_command = time.monotonic()
+            self._local = True
+            self.motors.drive(speed, steering, brake)
+
+    def link_lost(self):
+        """True once the laptop has been heard from and its heartbeat has since lapsed"""
+        with self._lock:
+            return (self._last_heartbeat != float('-inf')
+                    and time.monotonic() - self._last_heartbeat > self.heartbeat_timeout)
+
+    def stop(self):
+        """Stop the loop and the motors"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout=1.0)
+        self.motors.stop()
+
+    def run(self):
+        self._raise_priority()
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            lateness = now - next_tick
+            with self._lock:
+                self._jitter.append(lateness)
+            self.ticks += 1
+
+            self._enforce_deadlines(now)
+            self.motors.update(now)
+
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            elif -delay > self.period:
+                # Fell more than a full tick behind; resynchronize instead of bursting
+                self.overruns += 1
+                next_tick = time.monotonic()
+
+    def _enforce_deadlines(self, now):
+        """Ramp down or stop the motors when commands or heartbeats go stale"""
+        with self._lock:
+            if now - self._last_heartbeat > self.heartbeat_timeout:
+                if self._local and now - self._last_command <= self.command_timeout:
+                    if self.state != 'local':
+                        self.trips['local_takeover'] += 1
+                        print("Safety reflex: heartbeat lost, local pilot driving")
+                        self.state = 'local'
+                elif self.state != 'stopped':
+                    if self.state != 'idle':
+                        self.trips['heartbeat_timeout'] += 1
+                        print("Safety reflex: heartbeat lost, stopping motors")
+                    self.motors.stop()
+                    self.state = 'stopped'
+            elif now - self._last_command > self.command_timeout:
+                # A local command outlives its deadline once the laptop is back
+                # but only sending heartbeats or unusable messages
+                if self.state in ('active', 'local'):
+                    self.trips['command_timeout'] += 1
+                    print("Safety reflex: command stale, ramping down")
+                    self.motors.ramp_to_stop()
+                    self.state = 'ramping'
+
+    def _raise_priority(self):
+        """Request real-time scheduling for this thread where the OS allows it"""
+        if not self.realtime_priority:
+            return
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.realtime_priority))
+        except (AttributeError, OSError, PermissionError):
+            try:
+                os.nice(-5)
+            except (AttributeError, OSError, PermissionError):
+                pass
+
+    def stats(self):
+        """
+        Loop timing statistics over the recent jitter window
+        Returns:
+            Dictionary with tick counts, trips and jitter in milliseconds
+        """
+        # Copied under the lock: run() appends concurrently, and iterating a deque while it is mutated raises
+        with self._lock:
+            samples = list(self._jitter)
+        samples.sort()
+        if samples:
+            mean = sum(samples) / len(samples)
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            worst = samples[-1]
+        else:
+            mean = p99 = worst = 0.0
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'trips': dict(self.trips),
+            'jitter_mean_ms': mean * 1000.0,
+            'jitter_p99_ms': p99 * 1000.0,
+            'jitter_max_ms': worst * 1000.0,
+        }
@@ -1,16 +1,186 @@
-import cv2
+import argparse
 import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+class FrameStreamer:
+    """
+    Standalone camera streamer.
+
+    A capture thread encodes frames at most `max_fps` times per second into a
+    bounded queue that drops the oldest frame when full; a sender thread
+    writes them to the receiver as length-prefixed messages (4-byte
+    big-endian size, then JPEG bytes) and reconnects with exponential
+    backoff. A small socket send buffer keeps a slow receiver from queueing
+    up stale frames inside the kernel.
+    """
+
+    def __init__(self, host, port=8000, camera=0, max_fps=15.0, jpeg_quality=80,
+                 queue_size=2, send_buffer=256 * 1024, backoff_max=10.0, stats_interval=5.0):
+        """
+        Args:
+            host: Receiver address
+            port: Receiver port
+            camera: Camera index or device path
+            max_fps: Frame rate cap
+            jpeg_quality: JPEG encode quality
+            queue_size: Maximum number of encoded frames waiting to be sent
+            send_buffer: SO_SNDBUF size in bytes
+            backoff_max: Maximum reconnect delay in seconds
+            stats_interval: Seconds between throughput reports (0 disables)
+        """
+        self.address = (host, port)
+        self.camera_index = camera
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.jpeg_quality = jpeg_quality
+        self.send_buffer = send_buffer
+        self.backoff_max = backoff_max
+        self.stats_interval = stats_interval
+
+        self.queue = deque(maxlen=queue_size)
+        self.queue_cond = threading.Condition()
+        self.running = False
+        self.sock = None
+
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.dropped = 0
+        self.reconnects = 0
+
+    def start(self):
+        """Start the capture and sender threads"""
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._send_loop, name="sender", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Stop streaming and close the connection"""
+        self.running = False
+        with self.queue_cond:
+            self.queue_cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+        self._close()
+
+    def run(self):
+        """Stream until interrupted, printing throughput statistics"""
+        self.start()
+        try:
+            last_report = time.monotonic()
+            last_bytes, last_frames = 0, 0
+            while self.running:
+                time.sleep(0.5)
+                now = time.monotonic()
+                if self.stats_interval and now - last_report >= self.stats_interval:
+                    elapsed = now - last_report
+                    print(f"Streaming {(self.frames_sent - last_frames) / elapsed:.1f} fps, "
+                          f"{(self.bytes_sent - last_bytes) / elapsed / 1024:.1f} KiB/s, "
+                          f"dropped {self.dropped}, reconnects {self.reconnects}")
+                    last_report, last_bytes, last_frames = now, self.bytes_sent, self.frames_sent
+        except KeyboardInterrupt:
+            print("Stopping camera stream...")
+        finally:
+            self.stop()
+
+    def _capture_loop(self):
+        camera = cv2.VideoCapture(self.camera_index)
+        encode_params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        next_frame = time.monotonic()
+        try:
+            while self.running:
+                ret, frame = camera.read()
+                if not ret:
+                    time.sleep(0.05)
+                    continue
+                now = time.monotonic()
+                if now < next_frame:
+                    # Rate cap: keep draining the camera but skip the encode
+                    continue
+                next_frame = max(next_frame + self.min_interval, now)
+
+                ok, img_encoded = cv2.imencode('.jpg', frame, encode_params)
+                if not ok:
+                    continue
+                with self.queue_cond:
+                    if len(self.queue) == self.queue.maxlen:
+                        self.dropped += 1
+                    self.queue.append((struct.pack('!I', len(img_encoded)), img_encoded.tobytes()))
+                    self.queue_cond.notify()
+        finally:
+            camera.release()
+
+    def _connect(self):
+        """Connect to the receiver, retrying with exponential backoff"""
+        delay = 0.5
+        while self.running:
+            try:
+                sock = socket.create_connection(self.address, timeout=5.0)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+                sock.settimeout(None)
+                print(f"Connected to {self.address[0]}:{self.address[1]}")
+                return sock
+            except OSError as e:
+                print(f"Connection to {self.address[0]}:{self.address[1]} failed: {str(e)}; "
+                      f"retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.backoff_max)
+        return None
+
+    def _close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _send_loop(self):
+        while self.running:
+            if self.sock is None:
+                self.sock = self._connect()
+                if self.sock is None:
+                    return
+            with self.queue_cond:
+                while self.running and not self.queue:
+                    self.queue_cond.wait(0.5)
+                if not self.running:
+                    return
+                header, payload = self.queue.popleft()
+            try:
+                self.sock.sendall(header)
+                self.sock.sendall(payload)
+                self.frames_sent += 1
+                self.bytes_sent += len(header) + len(payload)
+            except OSError as e:
+                print(f"Stream connection lost: {str(e)}")
+                self._close()
+                self.reconnects += 1
+
+
+def send_frame(host='192.168.1.5', port=8000, camera=0, max_fps=15.0):
+    """Stream camera frames to a receiver until interrupted"""
+    FrameStreamer(host, port, camera=camera, max_fps=max_fps).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stream camera frames to the laptop')
+    parser.add_argument('--host', default='192.168.1.5', help='Receiver address')
+    parser.add_argument('--port', type=int, default=8000, help='Receiver port')
+    parser.add_argument('--camera', type=int, default=0, help='Camera index')
+    parser.add_argument('--fps', type=float, default=15.0, help='Frame rate cap')
+    parser.add_argument('--quality', type=int, default=80, help='JPEG quality')
+    parser.add_argument('--queue-size', type=int, default=2, help='Maximum queued frames before dropping the oldest')
+    args = parser.parse_args()
 
-def send_frame():
-    camera = cv2.VideoCapture(0)
-    
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_socket.connect(('192.168.1.5', 8000))
-
-    while True:
-        ret, frame = camera.read()
-        if not ret:
-            continue
-        
-        _, img_encoded = cv2.imencode('.jpg', frame)
-        client_socket.sendall(img_encoded.tobytes())
+    FrameStreamer(args.host, args.port, camera=args.camera, max_fps=args.fps,
+                  jpeg_quality=args.quality, queue_size=args.queue_size).run()